@@ -2,6 +2,11 @@
 API Flask para procesamiento de PDFs
 Expone endpoints para el frontend Next.js
 """
+from startup_profile import startup_profile
+
+# Importar primero los módulos de arranque midiendo su coste (ver /health -> startup)
+startup_profile.import_modules(['flask', 'fitz', 'normalizer', 'validators', 'detector', 'ocr_processor', 'pdf_processor'])
+
 import os
 import tempfile
 import json
@@ -10,23 +15,36 @@ from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 from pdf_processor import pdf_processor
+from image_ingest import ingest_image
+from request_workspace import RequestWorkspace
+from ocr_processor import ocr_processor
+from ocr_worker import ocr_worker
+from ocr_cache import ocr_cache
 from detector import detector
-import fitz  # PyMuPDF para conversin de imgenes
+from extraction_cache import extraction_cache
+import page_workers
 import time
 from threading import Lock
 from typing import Any, Dict, Optional
 
 app = Flask(__name__)
 # Permitir CORS para Next.js y exponer headers personalizados
-CORS(app, expose_headers=['X-Total-Matches', 'X-Matches-By-Type', 'X-Pages-Processed'])
+CORS(app, expose_headers=['X-Total-Matches', 'X-Matches-By-Type', 'X-Pages-Processed', 'X-Propagated-Values', 'X-Extraction-Cache', 'X-OCR-Cache-Hits', 'X-OCR-Profile', 'X-Save-Profile', 'X-Save-Seconds'])
 
 # Configuración
 UPLOAD_FOLDER = tempfile.gettempdir()
 ALLOWED_EXTENSIONS = {'pdf', 'txt', 'jpg', 'jpeg', 'png'}
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
+# Por encima de este tamaño la entrada/salida de una petición se vuelca a disco
+REQUEST_SPILL_BYTES = int(float(os.getenv('REQUEST_SPILL_MB', '16')) * 1024 * 1024)
+# Cargar y precalentar el modelo del OCR al arrancar en lugar de en la primera petición escaneada
+OCR_PRELOAD = os.getenv('OCR_PRELOAD', '0').strip().lower() in {'1', 'true', 'yes', 'on'}
+# Recarga automática del servidor de desarrollo al cambiar el código
+FLASK_RELOADER = os.getenv('FLASK_RELOADER', '1').strip().lower() in {'1', 'true', 'yes', 'on'}
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
+app.config['REQUEST_SPILL_BYTES'] = REQUEST_SPILL_BYTES
 
 progress_lock = Lock()
 progress_state: Dict[str, Dict[str, Any]] = {}
@@ -66,66 +84,6 @@ def is_image(filename):
     return ext in {'jpg', 'jpeg', 'png'}
 
 
-def convert_image_to_pdf(image_path, output_pdf_path):
-    """
-    Convierte una imagen a PDF
-
-    Args:
-        image_path: Ruta a la imagen
-        output_pdf_path: Ruta donde guardar el PDF
-
-    Returns:
-        True si la conversión fue exitosa, False en caso contrario
-    """
-    try:
-        print(f"[IMG→PDF] Convirtiendo imagen a PDF: {image_path}")
-
-        # Crear un nuevo documento PDF
-        doc = fitz.open()
-
-        # Abrir la imagen
-        img = fitz.open(image_path)
-
-        # Obtener el primer (y único) pixmap de la imagen
-        pix = fitz.Pixmap(image_path)
-
-        # Crear una página con el tamaño de la imagen
-        # Usar A4 como máximo, escalando si es necesario
-        img_width = pix.width
-        img_height = pix.height
-
-        # A4 size in points (595 x 842)
-        a4_width = 595
-        a4_height = 842
-
-        # Calcular escala para que quepa en A4 si es más grande
-        scale = min(a4_width / img_width, a4_height / img_height, 1.0)
-
-        page_width = img_width * scale
-        page_height = img_height * scale
-
-        # Crear página
-        page = doc.new_page(width=page_width, height=page_height)
-
-        # Insertar la imagen
-        rect = fitz.Rect(0, 0, page_width, page_height)
-        page.insert_image(rect, filename=image_path)
-
-        # Guardar el PDF
-        doc.save(output_pdf_path)
-        doc.close()
-        pix = None
-
-        print(f"[IMG→PDF] ✓ Conversión exitosa: {output_pdf_path}")
-        return True
-
-    except Exception as e:
-        print(f"[IMG→PDF] ✗ Error al convertir imagen: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
-
-
 @app.route('/api/progress/<progress_id>', methods=['GET'])
 def get_progress_status(progress_id: str):
     """Devuelve el estado de progreso asociado a un identificador."""
@@ -141,7 +99,76 @@ def health():
     return jsonify({
         'status': 'ok',
         'service': 'sensitive-data-detector',
-        'version': '1.0.0'
+        'version': '1.0.0',
+        'extractionCache': extraction_cache.stats(),
+        'detectionCache': detector.cache_stats(),
+        'pageWorkers': page_workers.pool_status(),
+        'ocrWorkers': ocr_worker.status(),
+        'startup': startup_profile.report(),
+        'ocrAvailable': ocr_processor.ocr_available,
+        'ocrModel': ocr_processor.status(),
+        'ocrCache': ocr_cache.stats(),
+        'ocrPreload': OCR_PRELOAD,
+    })
+
+
+def _ocr_readiness():
+    """Estado del OCR para el balanceador: listo si hay un modelo cargado y precalentado"""
+    if ocr_worker.enabled:
+        workers = ocr_worker.status()
+        return ocr_worker.is_ready, {'mode': 'workers', 'workers': workers}
+    return ocr_processor.is_ready, {'mode': 'in-process', 'model': ocr_processor.status()}
+
+
+@app.route('/ready/ocr', methods=['GET'])
+def ready_ocr():
+    """
+    Readiness del OCR: 200 si el modelo está caliente, 503 si no (frío, cargando o con error)
+    El balanceador puede usarlo para no enviar documentos escaneados a un nodo frío
+    """
+    ready, details = _ocr_readiness()
+    return jsonify({'ready': ready, **details}), 200 if ready else 503
+
+
+def _findings_response(input_source, rules, sensitivity_level, extraction_mode, progress_id, progress_callback,
+                       page_images=None, ocr_profile=None):
+    """Detecciones con coordenadas en JSON, sin modificar ni guardar el PDF"""
+    stats = pdf_processor.process_pdf(
+        input_source,
+        None,
+        rules,
+        sensitivity_level,
+        'findings',
+        extraction_mode,
+        progress_callback=progress_callback,
+        page_images=page_images,
+        ocr_profile=ocr_profile,
+    )
+    print(f"[OK] Findings: {len(stats['findings'])} deteccion(es)")
+
+    if progress_id:
+        _update_progress(
+            progress_id,
+            stage='completed',
+            percent=100,
+            done=True,
+            currentPage=stats.get('pages_processed'),
+            totalPages=stats.get('pages_processed'),
+        )
+
+    return jsonify({
+        'findings': stats['findings'],
+        'pages': stats['page_sizes'],
+        'stats': {
+            'totalMatches': stats['total_matches'],
+            'byType': stats['by_type'],
+            'byPage': stats['by_page'],
+            'pagesProcessed': stats['pages_processed'],
+            'propagatedValues': stats['propagated_values'],
+            'extractionCache': stats['extraction_cache'],
+            'ocrCacheHits': stats['ocr_cache_hits'],
+            'ocrProfile': stats['ocr_profile'],
+        },
     })
 
 
@@ -154,15 +181,23 @@ def process_pdf():
         - file: PDF file
         - rules: JSON string con reglas habilitadas
         - sensitivityLevel: 'strict', 'normal', 'relaxed'
-        - action: 'highlight' (default) o 'redact'
+        - action: 'highlight' (default), 'redact' o 'findings'
         - extractionMode: 'auto', 'parser' o 'ocr'
+        - ocrProfile: 'fast', 'balanced' o 'accurate' (opcional, por defecto OCR_PROFILE; solo los de OCR_ALLOWED_PROFILES)
+        - saveProfile: 'compact', 'fast' o 'incremental' (opcional, por defecto OUTPUT_SAVE_PROFILE)
 
     Response:
+        - Con action='findings': JSON con las detecciones y sus coordenadas, sin generar PDF
         - PDF procesado como archivo
         - Headers con estadísticas:
             - X-Total-Matches: número total de detecciones
             - X-Matches-By-Type: JSON con detecciones por tipo
             - X-Pages-Processed: número de páginas procesadas
+            - X-Propagated-Values: valores del documento propagados, contados una vez por página en la que se localizan
+            - X-Extraction-Cache: 'hit', 'miss' o 'disabled'
+            - X-OCR-Profile: perfil del OCR usado
+            - X-Save-Profile: perfil de guardado usado
+            - X-Save-Seconds: tiempo de guardado del PDF
     """
     try:
         # Validar que hay archivo
@@ -184,6 +219,8 @@ def process_pdf():
         extraction_mode = (request.form.get('extractionMode', 'auto') or 'auto').lower()
         if extraction_mode not in {'parser', 'ocr', 'auto'}:
             extraction_mode = 'auto'
+        ocr_profile = (request.form.get('ocrProfile') or '').strip().lower() or None
+        save_profile = (request.form.get('saveProfile') or '').strip().lower() or None
 
         progress_id = request.form.get('progressId')
         progress_callback = None
@@ -216,54 +253,69 @@ def process_pdf():
         except json.JSONDecodeError:
             return jsonify({'error': 'Invalid rules JSON'}), 400
 
-        # Guardar archivo temporal
+        # Entrada y salida en memoria; solo los documentos grandes pasan al directorio privado de la petición
         filename = secure_filename(file.filename)
-        original_input_path = os.path.join(app.config['UPLOAD_FOLDER'], f'input_{filename}')
-        output_path = os.path.join(app.config['UPLOAD_FOLDER'], f'output_{filename}')
-
-        file.save(original_input_path)
-
-        if progress_id:
-            _update_progress(progress_id, stage='saved-input', percent=5, currentPage=0)
-
-        # Si es una imagen, convertirla a PDF primero
-        input_path = original_input_path
         pdf_filename = filename
-
-        if is_image(filename):
-            print(f"[IMAGEN] Detectada imagen: {filename}")
-            pdf_filename = filename.rsplit('.', 1)[0] + '.pdf'
-            pdf_input_path = os.path.join(app.config['UPLOAD_FOLDER'], f'converted_{pdf_filename}')
-
-            if not convert_image_to_pdf(original_input_path, pdf_input_path):
-                return jsonify({'error': 'Error converting image to PDF'}), 500
-
-            input_path = pdf_input_path
-            output_path = os.path.join(app.config['UPLOAD_FOLDER'], f'output_{pdf_filename}')
-            print(f"[IMAGEN] ✓ Imagen convertida a PDF para procesamiento")
-
-            if progress_id:
-                _update_progress(progress_id, stage='image-converted', percent=8, currentPage=0)
+        page_images = None
+        workspace = RequestWorkspace(app.config['REQUEST_SPILL_BYTES'], app.config['UPLOAD_FOLDER'])
+        workspace_handed_off = False
 
         try:
+            if is_image(filename):
+                # La imagen se decodifica una vez y el PDF se construye en memoria
+                print(f"[IMAGEN] Detectada imagen: {filename}")
+                pdf_filename = filename.rsplit('.', 1)[0] + '.pdf'
+
+                try:
+                    ingested = ingest_image(file.read())
+                except Exception as e:
+                    print(f"[IMG→PDF] ✗ Error al convertir imagen: {e}")
+                    return jsonify({'error': 'Error converting image to PDF', 'details': str(e)}), 500
+
+                input_source = workspace.store(ingested.pdf_bytes, 'input.pdf')
+                # El OCR lee estos píxeles en lugar de rasterizar de nuevo la página
+                page_images = [ingested.ocr_pixmap]
+                print(f"[IMAGEN] ✓ Imagen convertida a PDF para procesamiento")
+
+                if progress_id:
+                    _update_progress(progress_id, stage='image-converted', percent=8, currentPage=0)
+            else:
+                input_source = workspace.load_upload(file)
+
+                if progress_id:
+                    _update_progress(progress_id, stage='saved-input', percent=5, currentPage=0)
+
             # Procesar PDF (original o convertido desde imagen)
             print(f"[PROCESO] Procesando: {pdf_filename}")
             print(f"          Reglas: {sum(rules.values())} habilitadas")
             print(f"          Sensibilidad: {sensitivity_level}")
             print(f"          Accion: {action}")
             print(f"          Modo extraccion: {extraction_mode}")
+            print(f"          Perfil OCR: {ocr_profile or 'por defecto'}")
+            print(f"          Entrada: {'disco (directorio privado)' if isinstance(input_source, str) else 'memoria'}")
 
             if progress_id:
                 _update_progress(progress_id, stage='starting-processing', percent=10, currentPage=0, extractionMethod=extraction_mode)
 
+            if action == 'findings':
+                return _findings_response(input_source, rules, sensitivity_level, extraction_mode,
+                                          progress_id, progress_callback, page_images, ocr_profile)
+
+            # El guardado incremental necesita un archivo de salida
+            incremental = (save_profile or pdf_processor.save_profile) == 'incremental'
+            output_target = workspace.output_target(input_source, on_disk=incremental)
+
             stats = pdf_processor.process_pdf(
-                input_path,
-                output_path,
+                input_source,
+                output_target,
                 rules,
                 sensitivity_level,
                 action,
                 extraction_mode,
-                progress_callback=progress_callback
+                progress_callback=progress_callback,
+                save_profile=save_profile,
+                page_images=page_images,
+                ocr_profile=ocr_profile,
             )
 
             print(f"[OK] Procesado: {stats['total_matches']} deteccion(es)")
@@ -280,8 +332,10 @@ def process_pdf():
                 )
 
             # Retornar PDF procesado
+            if not isinstance(output_target, str):
+                output_target.seek(0)
             response = send_file(
-                output_path,
+                output_target,
                 mimetype='application/pdf',
                 as_attachment=True,
                 download_name=f'redacted_{pdf_filename}'
@@ -291,22 +345,26 @@ def process_pdf():
             response.headers['X-Total-Matches'] = str(stats['total_matches'])
             response.headers['X-Matches-By-Type'] = json.dumps(stats['by_type'])
             response.headers['X-Pages-Processed'] = str(stats['pages_processed'])
+            response.headers['X-Propagated-Values'] = str(stats.get('propagated_values', 0))
+            response.headers['X-Extraction-Cache'] = stats.get('extraction_cache', 'disabled')
+            response.headers['X-OCR-Cache-Hits'] = str(stats.get('ocr_cache_hits', 0))
+            response.headers['X-OCR-Profile'] = stats.get('ocr_profile') or ''
+            response.headers['X-Save-Profile'] = stats.get('save', {}).get('profile', '')
+            response.headers['X-Save-Seconds'] = str(stats.get('save', {}).get('seconds', ''))
 
             print(f"[HEADERS] X-Total-Matches: {response.headers.get('X-Total-Matches')}")
             print(f"[HEADERS] X-Matches-By-Type: {response.headers.get('X-Matches-By-Type')}")
 
+            # Si la salida está en disco, el directorio se borra cuando termine el envío. Sin
+            # direct_passthrough el servidor cierra la respuesta (y ejecuta call_on_close) al acabar
+            response.direct_passthrough = False
+            response.call_on_close(workspace.cleanup)
+            workspace_handed_off = True
             return response
 
         finally:
-            # Limpiar archivos temporales
-            if os.path.exists(original_input_path):
-                os.remove(original_input_path)
-
-            # Si convertimos una imagen a PDF, limpiar el PDF temporal también
-            if is_image(filename) and input_path != original_input_path and os.path.exists(input_path):
-                os.remove(input_path)
-
-            # No eliminar output_path aún, send_file lo necesita
+            if not workspace_handed_off:
+                workspace.cleanup()
 
     except Exception as e:
         print(f"[ERROR] Error procesando PDF: {str(e)}")
@@ -440,4 +498,24 @@ if __name__ == '__main__':
     print(f"  Directorio temporal: {UPLOAD_FOLDER}")
     print(f"  Puerto: 5000")
     print("=" * 60)
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Con el reloader, este bloque se ejecuta en el proceso vigilante y en el hijo que sirve
+    # (WERKZEUG_RUN_MAIN=true); los procesos y la precarga solo tienen sentido en el segundo
+    serving_process = not FLASK_RELOADER or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+    if serving_process:
+        # Sondear los candidatos del parser desde el arranque para no pagar su latencia en la primera petición
+        pdf_processor.parser_client.start_health_probe()
+        # Crear y precalentar los procesos del marcado en paralelo antes de aceptar peticiones
+        if pdf_processor.page_workers > 1:
+            page_workers.get_pool(pdf_processor.page_workers)
+        # Procesos de OCR: cargan el modelo en segundo plano mientras el servidor arranca
+        if ocr_worker.enabled:
+            ocr_worker.start()
+        elif OCR_PRELOAD:
+            # Modelo en este proceso: cargarlo y precalentarlo sin bloquear el arranque
+            ocr_processor.start_preload()
+        startup_profile.mark_ready()
+        startup_profile.print_report()
+        # Comprobar el OCR y precargar las dependencias diferidas sin bloquear el arranque
+        ocr_processor.start_availability_probe()
+        startup_profile.warm_up_in_background()
+    app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=FLASK_RELOADER)
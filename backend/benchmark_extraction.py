@@ -0,0 +1,77 @@
+"""
+Benchmark de extract_text_with_coords: PyMuPDF frente a pdfplumber
+
+Uso:
+    python benchmark_extraction.py [pdf ...] [--repeat N]
+
+Sin argumentos usa los PDFs de muestra del repositorio (incidencias/ y la raíz).
+Para cada documento muestra el tiempo medio por motor, las palabras extraídas y
+el porcentaje de palabras de pdfplumber que PyMuPDF también devuelve.
+"""
+import argparse
+import glob
+import os
+import time
+from collections import Counter
+
+from pdf_processor import pdf_processor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def default_corpus():
+    patterns = [os.path.join(REPO_ROOT, 'incidencias', '*.pdf'), os.path.join(REPO_ROOT, '*.pdf')]
+    return sorted({path for pattern in patterns for path in glob.glob(pattern)})
+
+
+def time_engine(pdf_path, engine, repeat):
+    pages = None
+    elapsed = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        pages = pdf_processor.extract_text_with_coords(pdf_path, engine=engine)
+        elapsed.append(time.perf_counter() - started)
+    return sum(elapsed) / len(elapsed), pages
+
+
+def word_agreement(reference_pages, candidate_pages):
+    """Porcentaje de palabras de referencia presentes también en el candidato (multiconjunto)"""
+    reference = Counter(w['text'] for page in reference_pages for w in page['words'])
+    candidate = Counter(w['text'] for page in candidate_pages for w in page['words'])
+    total = sum(reference.values())
+    if not total:
+        return 100.0
+    shared = sum((reference & candidate).values())
+    return 100.0 * shared / total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('pdfs', nargs='*')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    pdfs = args.pdfs or default_corpus()
+    if not pdfs:
+        print("[BENCH] No se encontraron PDFs")
+        return
+
+    print(f"{'documento':40} {'pags':>5} {'pymupdf s':>10} {'pdfplumber s':>13} {'x':>6} {'palabras':>9} {'coinc %':>8}")
+    total_fast = total_slow = 0.0
+    for pdf_path in pdfs:
+        fast, fast_pages = time_engine(pdf_path, 'pymupdf', args.repeat)
+        slow, slow_pages = time_engine(pdf_path, 'pdfplumber', args.repeat)
+        total_fast += fast
+        total_slow += slow
+        words = sum(len(page['words']) for page in fast_pages)
+        speedup = slow / fast if fast else 0.0
+        name = os.path.basename(pdf_path)[:40]
+        print(f"{name:40} {len(fast_pages):>5} {fast:>10.3f} {slow:>13.3f} {speedup:>6.1f} {words:>9} "
+              f"{word_agreement(slow_pages, fast_pages):>8.1f}")
+
+    if total_fast:
+        print(f"\n[BENCH] Total: pymupdf {total_fast:.3f}s | pdfplumber {total_slow:.3f}s | x{total_slow / total_fast:.1f}")
+
+
+if __name__ == '__main__':
+    main()
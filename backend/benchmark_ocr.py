@@ -0,0 +1,185 @@
+"""
+Benchmark de los backends de inferencia y de los perfiles del OCR (TrOCR)
+
+Uso:
+    python benchmark_ocr.py [pdf ...] [--backends torch,torch-int8,onnx] [--pages N]
+    python benchmark_ocr.py [pdf ...] --profiles fast,balanced,accurate [--backends torch] [--pages N]
+
+Sin argumentos usa los PDFs de muestra del repositorio (incidencias/ y la raíz).
+Cada backend (o cada perfil, con --profiles, sobre el primer backend) procesa los
+mismos documentos con el pipeline completo del OCR; se muestra el rendimiento en
+páginas por minuto y la diferencia de precisión frente a la referencia (PyTorch
+eager float32, o el perfil balanced con --profiles):
+
+- CER ref: tasa de error por carácter del texto de cada configuración frente al
+  de la referencia (0 = mismo texto)
+- CER capa: tasa de error frente a la capa de texto del PDF, si la tiene; la
+  columna delta es la diferencia con el CER de la referencia
+"""
+import argparse
+import glob
+import os
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+from rapidfuzz.distance import Levenshtein
+
+from ocr_backends import BACKENDS, TorchBackend
+from ocr_cache import ocr_cache
+from ocr_processor import DEFAULT_OCR_PROFILE, OCR_PROFILES, OCRProcessor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def default_corpus():
+    patterns = [os.path.join(REPO_ROOT, 'incidencias', '*.pdf'), os.path.join(REPO_ROOT, '*.pdf')]
+    return sorted({path for pattern in patterns for path in glob.glob(pattern)})
+
+
+def limit_pages(pdf_path, max_pages):
+    """Primeras max_pages páginas del PDF en un archivo temporal (None si no hace falta)"""
+    with fitz.open(pdf_path) as doc:
+        if max_pages <= 0 or len(doc) <= max_pages:
+            return None
+        subset = fitz.open()
+        subset.insert_pdf(doc, from_page=0, to_page=max_pages - 1)
+        fd, path = tempfile.mkstemp(prefix='bench_ocr_', suffix='.pdf')
+        os.close(fd)
+        subset.save(path)
+        subset.close()
+        return path
+
+
+def text_layer(pdf_path):
+    with fitz.open(pdf_path) as doc:
+        return [page.get_text() for page in doc]
+
+
+def cer(reference, candidate):
+    """Character error rate de candidate frente a reference (espacios normalizados)"""
+    reference = ' '.join(reference.split())
+    candidate = ' '.join(candidate.split())
+    if not reference:
+        return 0.0 if not candidate else 1.0
+    return Levenshtein.distance(reference, candidate) / len(reference)
+
+
+def run_backend(name, pdfs, profile=None):
+    processor = OCRProcessor(backend=name, profile=profile)
+    label = profile or name
+    started = time.perf_counter()
+    try:
+        processor._initialize_model()
+    except Exception as exc:  # pylint: disable=broad-except
+        print(f"[BENCH] {label}: el modelo no se pudo cargar ({exc}), se omite")
+        return None
+    load_seconds = time.perf_counter() - started
+    if processor.backend.name != name:
+        print(f"[BENCH] {label}: backend {name} no disponible, se omite")
+        return None
+
+    texts = {}
+    pages = 0
+    started = time.perf_counter()
+    for pdf_path in pdfs:
+        result = processor.extract_text_from_pdf(pdf_path)
+        texts[pdf_path] = [page['text'] for page in result['pages']]
+        pages += len(result['pages'])
+    elapsed = time.perf_counter() - started
+    return {
+        'load_seconds': load_seconds,
+        'seconds': elapsed,
+        'pages': pages,
+        'texts': texts,
+        'describe': f"{processor.backend.model_name}, zoom {processor.zoom:g}, {processor.backend.describe()}",
+    }
+
+
+def mean_cer(reference_texts, candidate_texts):
+    rates = [
+        cer(reference, candidate)
+        for pdf_path, reference_pages in reference_texts.items()
+        for reference, candidate in zip(reference_pages, candidate_texts[pdf_path])
+    ]
+    return 100.0 * sum(rates) / len(rates) if rates else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('pdfs', nargs='*')
+    parser.add_argument('--backends', default=','.join(BACKENDS))
+    parser.add_argument('--profiles', default='',
+                        help=f"perfiles a comparar ({','.join(OCR_PROFILES)}) sobre el primer backend")
+    parser.add_argument('--pages', type=int, default=3, help='máximo de páginas por documento (0 = todas)')
+    args = parser.parse_args()
+
+    # Las páginas servidas desde la caché de plantillas no miden el OCR
+    ocr_cache.enabled = False
+
+    backends = [name.strip() for name in args.backends.split(',') if name.strip()]
+    profiles = [name.strip().lower() for name in args.profiles.split(',') if name.strip()]
+    unknown = [name for name in profiles if name not in OCR_PROFILES]
+    if unknown:
+        parser.error(f"perfiles desconocidos: {', '.join(unknown)}")
+
+    if profiles:
+        # Una configuración por perfil, todas con el mismo backend
+        backend = backends[0] if backends else TorchBackend.name
+        reference_name = DEFAULT_OCR_PROFILE
+        if reference_name not in profiles:
+            profiles.insert(0, reference_name)
+        names = profiles
+        configurations = {name: (backend, name) for name in profiles}
+    else:
+        reference_name = TorchBackend.name
+        names = backends
+        if reference_name not in names:
+            names.insert(0, reference_name)
+        configurations = {name: (name, None) for name in names}
+
+    sources = args.pdfs or default_corpus()
+    if not sources:
+        print("[BENCH] No se encontraron PDFs")
+        return
+
+    subsets = {path: limit_pages(path, args.pages) for path in sources}
+    pdfs = [subsets[path] or path for path in sources]
+    try:
+        layers = {pdf: text_layer(pdf) for pdf in pdfs}
+        results = {}
+        for name in names:
+            backend, profile = configurations[name]
+            results[name] = run_backend(backend, pdfs, profile)
+    finally:
+        for subset in subsets.values():
+            if subset and os.path.exists(subset):
+                os.remove(subset)
+
+    reference = results.get(reference_name)
+    if reference is None:
+        print(f"[BENCH] La referencia ({reference_name}) no está disponible")
+        return
+    reference_layer_cer = mean_cer(layers, reference['texts'])
+    has_layer = any(any(text.strip() for text in pages) for pages in layers.values())
+
+    print(f"\n{'perfil' if profiles else 'backend':12} {'carga s':>8} {'paginas':>8} {'pag/min':>8} {'x':>6} {'CER ref %':>10} "
+          f"{'CER capa %':>11} {'delta':>7}")
+    for name in names:
+        result = results.get(name)
+        if result is None:
+            continue
+        pages_per_minute = 60.0 * result['pages'] / result['seconds'] if result['seconds'] else 0.0
+        speedup = reference['seconds'] / result['seconds'] if result['seconds'] else 0.0
+        layer_cer = mean_cer(layers, result['texts']) if has_layer else float('nan')
+        delta = layer_cer - reference_layer_cer if has_layer else float('nan')
+        print(f"{name:12} {result['load_seconds']:>8.1f} {result['pages']:>8} {pages_per_minute:>8.1f} "
+              f"{speedup:>6.2f} {mean_cer(reference['texts'], result['texts']):>10.2f} {layer_cer:>11.2f} {delta:>+7.2f}")
+
+    for name in names:
+        if results.get(name):
+            print(f"[BENCH] {name}: {results[name]['describe']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,10 @@ Detector de datos sensibles
 Implementa el pipeline del blueprint: regex + validaciones + contexto
 """
 import regex as re
+import hashlib
+import os
+from collections import OrderedDict
+from threading import Lock
 from typing import List, Dict, Tuple, Optional
 from normalizer import normalizer
 from validators import validator
@@ -12,6 +16,13 @@ class SensitiveDataDetector:
     """Detecta datos sensibles en texto usando regex y validaciones"""
 
     def __init__(self):
+        # Memoización por página: (hash del texto normalizado, reglas, sensibilidad) -> detecciones
+        # Solo guarda offsets, tipos y confianzas; los valores se reconstruyen del texto
+        self.cache_size = int(os.getenv('DETECTION_CACHE_SIZE', '2048'))
+        self._cache: 'OrderedDict[Tuple, List[Tuple[str, int, int, float]]]' = OrderedDict()
+        self._cache_lock = Lock()
+        self._cache_counters = {'hits': 0, 'misses': 0}
+
         # Patrones elásticos (tolerantes a espacios/saltos)
         self.patterns = {
             # IBAN (incluyendo con puntos y espacios)
@@ -448,11 +459,90 @@ class SensitiveDataDetector:
                 'normalized_value': str
             }
         """
-        matches = []
-
         # Normalizar texto completo
         normalized_text = normalizer.normalize_full(text)
 
+        return self._detect_normalized(normalized_text, enabled_rules, sensitivity_level, context_length)
+
+    def detect_cached(
+        self,
+        text: str,
+        enabled_rules: Dict[str, bool],
+        sensitivity_level: str = 'normal',
+        context_length: int = 50
+    ) -> Tuple[List[Dict], bool]:
+        """
+        Igual que detect, pero reutiliza el resultado de textos ya analizados
+        (cabeceras, pies, condiciones generales y anexos repetidos)
+
+        Returns:
+            Tuple(detecciones, True si salió de la caché)
+        """
+        normalized_text = normalizer.normalize_full(text)
+        if self.cache_size <= 0:
+            return self._detect_normalized(normalized_text, enabled_rules, sensitivity_level, context_length), False
+
+        rule_plan = tuple(sorted(rule for rule in self.patterns if enabled_rules.get(rule, False)))
+        text_hash = hashlib.sha256(normalized_text.encode('utf-8')).digest()
+        key = (text_hash, rule_plan, sensitivity_level, context_length)
+
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self._cache_counters['hits'] += 1
+            else:
+                self._cache_counters['misses'] += 1
+
+        if cached is not None:
+            matches = []
+            for data_type, start, end, confidence in cached:
+                value = normalized_text[start:end]
+                matches.append({
+                    'type': data_type,
+                    'value': value,
+                    'start': start,
+                    'end': end,
+                    'confidence': confidence,
+                    'context': self._get_context(normalized_text, start, end, context_length),
+                    'normalized_value': normalizer.normalize_for_validation(value, data_type),
+                })
+            return matches, True
+
+        matches = self._detect_normalized(normalized_text, enabled_rules, sensitivity_level, context_length)
+        entry = [(m['type'], m['start'], m['end'], m['confidence']) for m in matches]
+        with self._cache_lock:
+            self._cache[key] = entry
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return matches, False
+
+    def cache_stats(self) -> Dict[str, float]:
+        """Aciertos, fallos y tamaño de la caché de detección del proceso"""
+        with self._cache_lock:
+            hits = self._cache_counters['hits']
+            misses = self._cache_counters['misses']
+            size = len(self._cache)
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'entries': size,
+            'hit_rate': round(hits / lookups, 3) if lookups else 0.0,
+        }
+
+    def _detect_normalized(
+        self,
+        normalized_text: str,
+        enabled_rules: Dict[str, bool],
+        sensitivity_level: str,
+        context_length: int
+    ) -> List[Dict]:
+        """Aplica los patrones habilitados sobre texto ya normalizado"""
+        matches = []
+
         # Umbral de confianza según sensibilidad
         threshold = self._get_confidence_threshold(sensitivity_level)
 
@@ -0,0 +1,285 @@
+"""
+Caché en disco de resultados de extracción (parser externo / OCR)
+La clave es el SHA-256 del PDF de entrada más el modo de extracción, de modo que
+volver a procesar el mismo archivo (subrayar y luego redactar, lotes tras cambiar
+reglas) salta directamente a la detección.
+
+Formato de cada entrada (.dxc):
+    b'DXC1' | flags (1 byte) | longitud cabecera (4 bytes) | cabecera JSON | páginas
+Cada página se guarda como JSON comprimido con zlib (y cifrado con Fernet si hay
+clave), así se puede descomprimir página a página sin cargar el documento entero.
+
+Las entradas contienen el texto completo de los documentos: la caché solo se
+activa por defecto con EXTRACTION_CACHE_KEY; sin clave hay que pedirla
+explícitamente (EXTRACTION_CACHE_ENABLED=1) y se guarda en claro. La caducidad
+cuenta siempre desde la creación de la entrada, aunque se siga usando.
+"""
+import base64
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+MAGIC = b'DXC1'
+FLAG_ENCRYPTED = 0x01
+HEADER_STRUCT = struct.Struct('>4sBI')
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).strip().lower() in {'1', 'true', 'yes', 'on'}
+
+
+def hash_source(source: Union[str, bytes]) -> str:
+    """SHA-256 del contenido de un archivo (leído por bloques) o de un buffer"""
+    digest = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        digest.update(source)
+    else:
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CachedPages(Sequence):
+    """Páginas de una entrada de caché, descomprimidas bajo demanda"""
+
+    def __init__(self, payload: bytes, offsets: List[List[int]], decrypt=None):
+        self._payload = payload
+        self._offsets = offsets
+        self._decrypt = decrypt
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        start, length = self._offsets[index]
+        record = self._payload[start:start + length]
+        if self._decrypt is not None:
+            record = self._decrypt(record)
+        return json.loads(zlib.decompress(record).decode('utf-8'))
+
+
+class ExtractionCache:
+    """Caché LRU en disco con límite de tamaño, caducidad y cifrado opcional"""
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: int = 512 * 1024 * 1024,
+        ttl_seconds: float = 24 * 3600,
+        encryption_key: Optional[str] = None,
+        enabled: bool = True,
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+        self._fernet = None
+
+        if self.enabled and encryption_key:
+            try:
+                from cryptography.fernet import Fernet
+            except ImportError:
+                # Con clave configurada nunca se guarda texto en claro
+                print("[CACHE] EXTRACTION_CACHE_KEY definida pero falta 'cryptography': caché desactivada")
+                self.enabled = False
+            else:
+                derived = base64.urlsafe_b64encode(hashlib.sha256(encryption_key.encode('utf-8')).digest())
+                self._fernet = Fernet(derived)
+
+        if self.enabled and self._fernet is None:
+            print("[CACHE] Caché de extracción activada SIN cifrado: el texto de los documentos se guarda en claro")
+
+    @classmethod
+    def from_env(cls) -> 'ExtractionCache':
+        default_dir = os.path.join(tempfile.gettempdir(), 'datossensibles', 'extraction-cache')
+        encryption_key = os.getenv('EXTRACTION_CACHE_KEY') or None
+        return cls(
+            cache_dir=os.getenv('EXTRACTION_CACHE_DIR', default_dir),
+            max_bytes=int(float(os.getenv('EXTRACTION_CACHE_MAX_MB', '512')) * 1024 * 1024),
+            ttl_seconds=float(os.getenv('EXTRACTION_CACHE_TTL_HOURS', '24')) * 3600,
+            encryption_key=encryption_key,
+            # Sin clave, el texto en claro en disco tiene que pedirse explícitamente
+            enabled=_env_flag('EXTRACTION_CACHE_ENABLED', '1' if encryption_key else '0'),
+        )
+
+    def make_key(self, source: Union[str, bytes], extraction_mode: str, options: Optional[Dict[str, Any]] = None) -> str:
+        """Clave de caché: SHA-256 del PDF + modo de extracción + opciones que alteran el resultado"""
+        content_hash = hash_source(source)
+        suffix = json.dumps({'mode': extraction_mode, 'options': options or {}}, sort_keys=True)
+        return hashlib.sha256(f"{content_hash}:{suffix}".encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.dxc")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Devuelve {'pages': CachedPages, 'meta': {...}} o None si no hay entrada válida
+        """
+        if not self.enabled:
+            return None
+
+        path = self._entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            flags, header_length, header = self._parse_header(data)
+        except FileNotFoundError:
+            self._count('misses')
+            return None
+        except (OSError, ValueError, struct.error) as e:
+            print(f"[CACHE] Entrada corrupta, se descarta: {e}")
+            self._remove(path)
+            self._count('misses')
+            return None
+
+        if self._expired(header, time.time()):
+            self._remove(path)
+            self._count('misses')
+            return None
+
+        encrypted = bool(flags & FLAG_ENCRYPTED)
+        if encrypted and self._fernet is None:
+            # Entrada cifrada con una clave que ya no está configurada
+            self._count('misses')
+            return None
+
+        try:
+            os.utime(path)  # LRU: la fecha de modificación marca el último uso
+        except OSError:
+            pass
+
+        payload = data[HEADER_STRUCT.size + header_length:]
+        pages = CachedPages(payload, header['offsets'], self._fernet.decrypt if encrypted else None)
+        self._count('hits')
+        return {'pages': pages, 'meta': header.get('meta', {})}
+
+    def put(self, key: str, pages: Sequence, meta: Optional[Dict[str, Any]] = None) -> None:
+        """Guarda las páginas extraídas (comprimidas por página) y aplica el límite de tamaño"""
+        if not self.enabled:
+            return
+
+        try:
+            # Directorio privado: las entradas contienen el texto de los documentos
+            os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+            records: List[bytes] = []
+            offsets: List[List[int]] = []
+            position = 0
+            for page in pages:
+                record = zlib.compress(json.dumps(page, ensure_ascii=False).encode('utf-8'), 6)
+                if self._fernet is not None:
+                    record = self._fernet.encrypt(record)
+                records.append(record)
+                offsets.append([position, len(record)])
+                position += len(record)
+
+            header = json.dumps({
+                'created_at': time.time(),
+                'offsets': offsets,
+                'meta': meta or {},
+            }).encode('utf-8')
+            flags = FLAG_ENCRYPTED if self._fernet is not None else 0
+
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(HEADER_STRUCT.pack(MAGIC, flags, len(header)))
+                    f.write(header)
+                    for record in records:
+                        f.write(record)
+                os.replace(tmp_path, self._entry_path(key))
+            except Exception:
+                self._remove(tmp_path)
+                raise
+
+            self._count('writes')
+            self._evict()
+        except Exception as e:  # pragma: no cover - la caché nunca debe romper el procesamiento
+            print(f"[CACHE] No se pudo guardar la entrada: {e}")
+
+    @staticmethod
+    def _parse_header(data: bytes):
+        """flags, longitud y cabecera JSON de una entrada (basta con su comienzo)"""
+        magic, flags, header_length = HEADER_STRUCT.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError('formato desconocido')
+        header_start = HEADER_STRUCT.size
+        header = json.loads(data[header_start:header_start + header_length].decode('utf-8'))
+        return flags, header_length, header
+
+    def _expired(self, header: Dict[str, Any], now: float) -> bool:
+        """Caducidad por fecha de creación (la de modificación solo ordena el LRU)"""
+        return self.ttl_seconds > 0 and now - header.get('created_at', 0) > self.ttl_seconds
+
+    def _entry_expired(self, path: str, now: float) -> bool:
+        """Lee solo la cabecera de una entrada para saber si caducó; una entrada ilegible también cuenta"""
+        try:
+            with open(path, 'rb') as f:
+                prefix = f.read(HEADER_STRUCT.size)
+                _, _, header_length = HEADER_STRUCT.unpack_from(prefix, 0)
+                _, _, header = self._parse_header(prefix + f.read(header_length))
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, struct.error):
+            return True
+        return self._expired(header, now)
+
+    def _evict(self) -> None:
+        """Elimina entradas caducadas y, por LRU, las necesarias para respetar max_bytes"""
+        with self._lock:
+            entries = []
+            now = time.time()
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith('.dxc'):
+                    continue
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+
+            entries.sort()
+            total = sum(size for _, size, _ in entries)
+            for mtime, size, path in entries:
+                expired = self.ttl_seconds > 0 and self._entry_expired(path, now)
+                if total <= self.max_bytes and not expired:
+                    continue
+                if self._remove(path):
+                    total -= size
+                    self._counters['evictions'] += 1
+
+    def _remove(self, path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores del proceso (aciertos, fallos, escrituras, desalojos)"""
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters['hits'] + counters['misses']
+        counters['hit_rate'] = round(counters['hits'] / lookups, 3) if lookups else 0.0
+        counters['enabled'] = self.enabled
+        counters['encrypted'] = self._fernet is not None
+        return counters
+
+
+# Instancia global
+extraction_cache = ExtractionCache.from_env()
@@ -0,0 +1,71 @@
+"""
+Ingesta de imágenes (JPG/PNG) en memoria
+La imagen subida se decodifica una sola vez con PyMuPDF. Con esos píxeles se
+construye el PDF de una página en memoria y se entregan al OCR, que así no tiene
+que volver a rasterizar la página para leerla.
+"""
+from typing import Optional
+
+import fitz  # PyMuPDF
+
+# Tamaño A4 en puntos: las imágenes mayores se escalan para caber en él
+A4_WIDTH = 595
+A4_HEIGHT = 842
+
+JPEG_MAGIC = b'\xff\xd8'
+
+
+class IngestedImage:
+    """Imagen decodificada junto con el PDF de una página que la contiene"""
+
+    def __init__(self, pixmap: fitz.Pixmap, pdf_bytes: bytes, page_width: float, page_height: float):
+        self.pixmap = pixmap
+        self.pdf_bytes = pdf_bytes
+        self.page_width = page_width
+        self.page_height = page_height
+
+    @property
+    def ocr_pixmap(self) -> Optional[fitz.Pixmap]:
+        """
+        Píxeles en gris o RGB para el OCR, o None si la imagen tiene transparencia
+        (en ese caso el OCR rasteriza la página, que compone la imagen sobre blanco)
+        """
+        if self.pixmap.alpha:
+            return None
+        if self.pixmap.n not in (1, 3):
+            return fitz.Pixmap(fitz.csRGB, self.pixmap)
+        return self.pixmap
+
+
+def ingest_image(data: bytes) -> IngestedImage:
+    """
+    Decodifica una imagen y construye en memoria un PDF de una página con ella
+
+    Las imágenes mayores que A4 se escalan para caber en la página. Los JPEG se
+    insertan tal cual (el PDF guarda el flujo DCT original, sin recomprimir); el
+    resto de formatos se inserta desde los píxeles ya decodificados.
+
+    Raises:
+        RuntimeError / ValueError de PyMuPDF si los datos no son una imagen válida
+    """
+    pixmap = fitz.Pixmap(data)
+
+    scale = min(A4_WIDTH / pixmap.width, A4_HEIGHT / pixmap.height, 1.0)
+    page_width = pixmap.width * scale
+    page_height = pixmap.height * scale
+
+    doc = fitz.open()
+    try:
+        page = doc.new_page(width=page_width, height=page_height)
+        rect = fitz.Rect(0, 0, page_width, page_height)
+        if data[:2] == JPEG_MAGIC:
+            page.insert_image(rect, stream=data)
+        else:
+            page.insert_image(rect, pixmap=pixmap)
+        pdf_bytes = doc.tobytes(garbage=1, deflate=True)
+    finally:
+        doc.close()
+
+    print(f"[IMG→PDF] Imagen {pixmap.width}x{pixmap.height} px -> pagina {page_width:.0f}x{page_height:.0f} pt "
+          f"({len(pdf_bytes)} bytes)")
+    return IngestedImage(pixmap, pdf_bytes, page_width, page_height)
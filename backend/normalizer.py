@@ -3,7 +3,6 @@ Normalización de texto para detección robusta
 Basado en blueprint.md - Normalización idéntica en detección y búsqueda
 """
 import re
-import ftfy
 
 
 class TextNormalizer:
@@ -34,7 +33,8 @@ class TextNormalizer:
         if not text:
             return ""
 
-        # 1. Arreglar encoding raro con ftfy
+        # 1. Arreglar encoding raro con ftfy (import diferido: solo cuesta en la primera llamada)
+        import ftfy
         text = ftfy.fix_text(text)
 
         # 2. Sustituir ligaduras
@@ -0,0 +1,210 @@
+"""
+Inference backends for the TrOCR model.
+
+All backends share the TrOCR processor (image preprocessing and tokenizer) and
+expose the same generate(pixel_values) -> token ids call (and
+generate_with_confidence, which adds a per-sequence confidence), so
+OCRProcessor does not care which runtime executes the model. Decoding settings
+of the OCR profile (num_beams, max_new_tokens) go to every generate call:
+
+- torch:      eager float32 PyTorch (CUDA when available). The reference.
+- torch-int8: PyTorch with dynamic int8 quantisation of the Linear layers (CPU).
+- onnx:       encoder/decoder exported to ONNX and run with ONNX Runtime through
+              optimum (optional dependency: pip install "optimum[onnxruntime]").
+
+Weights are read from (and downloaded once into) OCR_MODEL_DIR; with
+OCR_MODEL_OFFLINE=1 nothing is downloaded and a missing model is an error.
+"""
+from __future__ import annotations
+
+import os
+import math
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+DEFAULT_MODEL_NAME = "microsoft/trocr-base-printed"
+DEFAULT_MODEL_DIR = os.path.join(os.path.expanduser("~"), ".cache", "datossensibles", "ocr-models")
+
+
+def sequence_confidences(model, outputs) -> List[float]:
+    """
+    0..1 confidence of each generated sequence: the geometric mean of the
+    probabilities of its tokens (padding after the end token excluded).
+
+    Beam search already returns length-normalised log-probabilities
+    (sequences_scores); greedy decoding is scored from the per-step logits.
+    """
+    import torch
+
+    sequence_scores = getattr(outputs, "sequences_scores", None)
+    if sequence_scores is not None:
+        return [math.exp(score) for score in sequence_scores.tolist()]
+
+    transition = model.compute_transition_scores(outputs.sequences, outputs.scores, normalize_logits=True)
+    generated = outputs.sequences[:, -transition.shape[1]:]
+    mask = torch.isfinite(transition)
+    pad_token_id = getattr(model.generation_config, "pad_token_id", None)
+    if pad_token_id is not None:
+        mask &= generated != pad_token_id
+    totals = torch.where(mask, transition, torch.zeros_like(transition)).sum(dim=1)
+    counts = mask.sum(dim=1).clamp(min=1)
+    return [math.exp(value) for value in (totals / counts).tolist()]
+
+
+class OCRBackend:
+    """Loads TrOCR for one runtime and runs generate on preprocessed batches."""
+
+    name = "base"
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_MODEL_NAME,
+        model_dir: str = DEFAULT_MODEL_DIR,
+        threads: int = 0,
+        offline: bool = False,
+        generation: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.model_name = model_name
+        self.model_dir = model_dir
+        self.threads = threads
+        self.offline = offline
+        # Extra generate() arguments (empty = the model's own generation config)
+        self.generation: Dict[str, Any] = dict(generation or {})
+        self.processor = None
+        self.model = None
+        self.device = "cpu"
+
+    def _pretrained_kwargs(self) -> Dict[str, Any]:
+        return {"cache_dir": self.model_dir, "local_files_only": self.offline}
+
+    def _configure_threads(self) -> None:
+        if self.threads > 0:
+            import torch
+
+            torch.set_num_threads(self.threads)
+
+    def load(self) -> None:
+        from transformers import TrOCRProcessor
+
+        os.makedirs(self.model_dir, exist_ok=True)
+        self._configure_threads()
+        self.processor = TrOCRProcessor.from_pretrained(self.model_name, **self._pretrained_kwargs())
+        self.model = self._load_model()
+
+    def _load_model(self):
+        raise NotImplementedError
+
+    def generate(self, pixel_values):
+        """Token ids for a batch of preprocessed images."""
+        return self._run_generate(pixel_values, **self.generation)
+
+    def generate_with_confidence(self, pixel_values) -> Tuple[Any, List[float]]:
+        """Token ids plus the confidence of each sequence (see sequence_confidences)."""
+        outputs = self._run_generate(
+            pixel_values, **self.generation, output_scores=True, return_dict_in_generate=True
+        )
+        return outputs.sequences, sequence_confidences(self.model, outputs)
+
+    def _run_generate(self, pixel_values, **kwargs):
+        import torch
+
+        with torch.no_grad():
+            return self.model.generate(pixel_values.to(self.device), **kwargs)
+
+    def describe(self) -> str:
+        threads = self.threads if self.threads > 0 else "default"
+        generation = ", ".join(f"{key}={value}" for key, value in sorted(self.generation.items()))
+        return (f"{self.name} on {self.device.upper()} (threads: {threads})"
+                + (f", generate: {generation}" if generation else ""))
+
+
+class TorchBackend(OCRBackend):
+    """Eager float32 PyTorch model."""
+
+    name = "torch"
+
+    def _load_model(self):
+        import torch
+        from transformers import VisionEncoderDecoderModel
+
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        model = VisionEncoderDecoderModel.from_pretrained(self.model_name, **self._pretrained_kwargs())
+        model.to(self.device)
+        model.eval()
+        return model
+
+
+class QuantizedTorchBackend(OCRBackend):
+    """PyTorch model with int8 dynamically quantised Linear layers (CPU only)."""
+
+    name = "torch-int8"
+
+    def _load_model(self):
+        import torch
+        from transformers import VisionEncoderDecoderModel
+
+        self.device = "cpu"
+        model = VisionEncoderDecoderModel.from_pretrained(self.model_name, **self._pretrained_kwargs())
+        model.eval()
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class OnnxBackend(OCRBackend):
+    """ONNX Runtime session exported once with optimum and cached next to the weights."""
+
+    name = "onnx"
+
+    @property
+    def export_dir(self) -> str:
+        return os.path.join(self.model_dir, "onnx", self.model_name.replace("/", "--"))
+
+    def _load_model(self):
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForVision2Seq
+
+        options = onnxruntime.SessionOptions()
+        if self.threads > 0:
+            options.intra_op_num_threads = self.threads
+            options.inter_op_num_threads = 1
+
+        self.device = "cpu"
+        if os.path.exists(os.path.join(self.export_dir, "config.json")):
+            return ORTModelForVision2Seq.from_pretrained(self.export_dir, session_options=options)
+
+        if self.offline:
+            raise FileNotFoundError(f"ONNX export not found in {self.export_dir} (OCR_MODEL_OFFLINE=1)")
+        print(f"[OCR] Exporting {self.model_name} to ONNX (first run only): {self.export_dir}")
+        model = ORTModelForVision2Seq.from_pretrained(
+            self.model_name, export=True, session_options=options, **self._pretrained_kwargs()
+        )
+        model.save_pretrained(self.export_dir)
+        return model
+
+    def _run_generate(self, pixel_values, **kwargs):
+        return self.model.generate(pixel_values, **kwargs)
+
+
+BACKENDS: Dict[str, Type[OCRBackend]] = {
+    TorchBackend.name: TorchBackend,
+    QuantizedTorchBackend.name: QuantizedTorchBackend,
+    OnnxBackend.name: OnnxBackend,
+}
+
+
+def create_backend(name: Optional[str] = None, **overrides: Any) -> OCRBackend:
+    """
+    Backend configured from the environment (OCR_BACKEND, OCR_MODEL_NAME,
+    OCR_MODEL_DIR, OCR_THREADS, OCR_MODEL_OFFLINE); keyword arguments win.
+    """
+    backend_name = (name or os.getenv("OCR_BACKEND", TorchBackend.name)).strip().lower()
+    if backend_name not in BACKENDS:
+        print(f"[OCR] Unknown backend '{backend_name}', using '{TorchBackend.name}'")
+        backend_name = TorchBackend.name
+
+    settings: Dict[str, Any] = {
+        "model_name": os.getenv("OCR_MODEL_NAME", DEFAULT_MODEL_NAME),
+        "model_dir": os.getenv("OCR_MODEL_DIR", DEFAULT_MODEL_DIR),
+        "threads": max(0, int(os.getenv("OCR_THREADS", "0"))),
+        "offline": os.getenv("OCR_MODEL_OFFLINE", "0").strip().lower() in {"1", "true", "yes", "on"},
+    }
+    settings.update(overrides)
+    return BACKENDS[backend_name](**settings)
@@ -0,0 +1,373 @@
+"""
+On-disk cache of per-line OCR results for recurring scanned templates.
+
+Many scanned pages are copies of the same template (insurer cover sheets,
+standard conditions, blank forms). Each page raster gets a signature used to
+find the stored page of the same template:
+
+- a 64-bit difference hash (dHash) of the page downscaled to 9x8 cells, used to
+  find candidate entries by Hamming distance;
+- a grid of 8x8-pixel block means of the whole raster; a candidate whose blocks
+  differ by more than OCR_CACHE_BLOCK_TOLERANCE gray levels is another
+  template.
+
+The signature only picks the template. What is reused is decided line by line:
+an entry stores, for every text line crop, the SHA-256 of its exact pixels and
+the text read from it. A line is only reused when its crop is bit-identical;
+any other line (a different name, one different digit) goes through OCR again.
+
+Entries are tied to the OCR backend, model and profile that produced them,
+expire OCR_CACHE_TTL_HOURS after they were written and are evicted LRU beyond
+OCR_CACHE_MAX_MB. They hold document text, so the cache is only on by default
+with OCR_CACHE_KEY (or EXTRACTION_CACHE_KEY), which encrypts them with Fernet;
+without a key it must be enabled explicitly (OCR_CACHE_ENABLED=1).
+
+Entry format (<dhash>-<digest>.ocr):
+    b'OCR2' | flags (1 byte) | zlib(JSON header with the line readings) | zlib(block grid)
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+MAGIC = b"OCR2"
+FLAG_ENCRYPTED = 0x01
+# magic, flags, compressed header length
+HEADER_STRUCT = struct.Struct(">4sBI")
+
+BLOCK_SIZE = 8
+HASH_COLUMNS = 9
+HASH_ROWS = 8
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).strip().lower() in {"1", "true", "yes", "on"}
+
+
+def crop_digest(gray) -> str:
+    """Exact digest of a line crop (2-D uint8 array): its shape and every pixel."""
+    import numpy as np
+
+    digest = hashlib.sha256(np.ascontiguousarray(gray, dtype=np.uint8).tobytes())
+    digest.update(repr(gray.shape).encode("ascii"))
+    return digest.hexdigest()
+
+
+class PageSignature:
+    """Perceptual hash plus block grid of one grayscale page raster."""
+
+    def __init__(self, dhash: int, size: Tuple[int, int], blocks) -> None:
+        self.dhash = dhash
+        self.size = size
+        self.blocks = blocks
+
+    @classmethod
+    def from_gray(cls, gray) -> "PageSignature":
+        """Signature of a 2-D uint8 array (the OCR raster)."""
+        import numpy as np
+
+        height, width = gray.shape
+        if height < BLOCK_SIZE or width < BLOCK_SIZE:
+            # Rasters smaller than one block: pad with white
+            gray = np.pad(gray, ((0, max(0, BLOCK_SIZE - height)), (0, max(0, BLOCK_SIZE - width))),
+                          constant_values=255)
+        rows, columns = gray.shape[0] // BLOCK_SIZE, gray.shape[1] // BLOCK_SIZE
+        cropped = gray[:rows * BLOCK_SIZE, :columns * BLOCK_SIZE]
+        blocks = cropped.reshape(rows, BLOCK_SIZE, columns, BLOCK_SIZE).mean(axis=(1, 3)).astype(np.uint8)
+
+        cells = np.array([
+            [cell.mean() for cell in np.array_split(band, HASH_COLUMNS, axis=1)]
+            for band in np.array_split(blocks.astype(np.float32), HASH_ROWS, axis=0)
+        ])
+        bits = (cells[:, 1:] > cells[:, :-1]).ravel()
+        dhash = int("".join("1" if bit else "0" for bit in bits), 2)
+        return cls(dhash, (width, height), blocks)
+
+    def matches(self, other: "PageSignature", tolerance: int) -> bool:
+        """Block-wise verification: same raster size and every block within tolerance."""
+        import numpy as np
+
+        if self.size != other.size or self.blocks.shape != other.blocks.shape:
+            return False
+        difference = np.abs(self.blocks.astype(np.int16) - other.blocks.astype(np.int16))
+        return int(difference.max()) <= tolerance
+
+
+class OCRCache:
+    """LRU on-disk cache of OCR page lines keyed by perceptual page signatures."""
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: int = 256 * 1024 * 1024,
+        ttl_seconds: float = 7 * 24 * 3600,
+        max_distance: int = 4,
+        block_tolerance: int = 10,
+        encryption_key: Optional[str] = None,
+        enabled: bool = True,
+    ) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self.block_tolerance = block_tolerance
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "rejected": 0, "writes": 0, "evictions": 0}
+        # file name -> dhash; reloaded when the directory changes (other processes write too)
+        self._index: Dict[str, int] = {}
+        self._index_mtime: Optional[float] = None
+        self._fernet = None
+
+        if self.enabled and encryption_key:
+            try:
+                from cryptography.fernet import Fernet
+            except ImportError:
+                # With a key configured, OCR text is never written in clear
+                print("[OCR-CACHE] OCR_CACHE_KEY set but 'cryptography' is missing: cache disabled")
+                self.enabled = False
+            else:
+                derived = base64.urlsafe_b64encode(hashlib.sha256(encryption_key.encode("utf-8")).digest())
+                self._fernet = Fernet(derived)
+        if self.enabled and self._fernet is None:
+            print("[OCR-CACHE] OCR cache enabled WITHOUT encryption: OCR text is stored in clear")
+
+    @classmethod
+    def from_env(cls) -> "OCRCache":
+        default_dir = os.path.join(tempfile.gettempdir(), "datossensibles", "ocr-cache")
+        encryption_key = os.getenv("OCR_CACHE_KEY") or os.getenv("EXTRACTION_CACHE_KEY") or None
+        return cls(
+            cache_dir=os.getenv("OCR_CACHE_DIR", default_dir),
+            max_bytes=int(float(os.getenv("OCR_CACHE_MAX_MB", "256")) * 1024 * 1024),
+            ttl_seconds=float(os.getenv("OCR_CACHE_TTL_HOURS", "168")) * 3600,
+            max_distance=int(os.getenv("OCR_CACHE_MAX_DISTANCE", "4")),
+            block_tolerance=int(os.getenv("OCR_CACHE_BLOCK_TOLERANCE", "10")),
+            encryption_key=encryption_key,
+            # Without a key, OCR text in clear on disk has to be asked for
+            enabled=_env_flag("OCR_CACHE_ENABLED", "1" if encryption_key else "0"),
+        )
+
+    def get(self, signature: PageSignature, model: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        Line readings of the stored page of the same template (same model), or None.
+
+        Returns crop digest -> {"text", "confidence"}; the caller reuses a reading
+        only for a line whose crop has that exact digest.
+        """
+        if not self.enabled:
+            return None
+
+        for name in self._candidates(signature.dhash):
+            entry = self._read(name)
+            if entry is None:
+                continue
+            header, blocks = entry
+            if header.get("model") != model:
+                continue
+            if not signature.matches(PageSignature(signature.dhash, tuple(header["size"]), blocks),
+                                     self.block_tolerance):
+                self._count("rejected")
+                continue
+            try:
+                os.utime(os.path.join(self.cache_dir, name))  # LRU: mtime marks the last use
+            except OSError:
+                pass
+            self._count("hits")
+            return {reading["digest"]: reading for reading in header["lines"]}
+
+        self._count("misses")
+        return None
+
+    def put(self, signature: PageSignature, model: str, lines: List[Dict[str, Any]]) -> None:
+        """Store the line readings of a page ({"digest", "text", "confidence"} each) and enforce the size cap."""
+        if not self.enabled:
+            return
+
+        try:
+            import numpy as np
+
+            # Private directory: entries hold document text
+            os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+            header = json.dumps({
+                "created_at": time.time(),
+                "model": model,
+                "size": list(signature.size),
+                "shape": list(signature.blocks.shape),
+                "lines": lines,
+            }, ensure_ascii=False).encode("utf-8")
+            header = zlib.compress(header, 6)
+            blocks = zlib.compress(np.ascontiguousarray(signature.blocks, dtype=np.uint8).tobytes(), 6)
+            flags = 0
+            if self._fernet is not None:
+                header, blocks = self._fernet.encrypt(header), self._fernet.encrypt(blocks)
+                flags = FLAG_ENCRYPTED
+
+            digest = hashlib.sha256(blocks).hexdigest()[:16]
+            name = f"{signature.dhash:016x}-{digest}.ocr"
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(HEADER_STRUCT.pack(MAGIC, flags, len(header)))
+                    f.write(header)
+                    f.write(blocks)
+                os.replace(tmp_path, os.path.join(self.cache_dir, name))
+            except Exception:
+                self._remove(tmp_path)
+                raise
+
+            with self._lock:
+                self._index[name] = signature.dhash
+                self._counters["writes"] += 1
+            self._evict()
+        except Exception as exc:  # pylint: disable=broad-except
+            # The cache must never break OCR
+            print(f"[OCR-CACHE] Could not store the page: {exc}")
+
+    def _candidates(self, dhash: int) -> List[str]:
+        """Entry names whose dHash is within max_distance bits, closest first."""
+        self._refresh_index()
+        with self._lock:
+            scored = [
+                (bin(dhash ^ entry_hash).count("1"), name)
+                for name, entry_hash in self._index.items()
+            ]
+        return [name for distance, name in sorted(scored) if distance <= self.max_distance]
+
+    def _refresh_index(self) -> None:
+        try:
+            mtime = os.stat(self.cache_dir).st_mtime
+        except OSError:
+            return
+        with self._lock:
+            if mtime == self._index_mtime:
+                return
+            index: Dict[str, int] = {}
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith(".ocr"):
+                    continue
+                try:
+                    index[name] = int(name.split("-", 1)[0], 16)
+                except ValueError:
+                    continue
+            self._index = index
+            self._index_mtime = mtime
+
+    def _expired(self, header: Dict[str, Any], now: float) -> bool:
+        """Expiry counts from creation (mtime only orders the LRU)."""
+        return self.ttl_seconds > 0 and now - header.get("created_at", 0) > self.ttl_seconds
+
+    def _read_header(self, f) -> Tuple[Optional[Dict[str, Any]], int, int]:
+        """(header, flags, header length) of an open entry; header is None when it cannot be decrypted."""
+        magic, flags, header_length = HEADER_STRUCT.unpack(f.read(HEADER_STRUCT.size))
+        if magic != MAGIC:
+            raise ValueError("unknown format")
+        header = f.read(header_length)
+        if flags & FLAG_ENCRYPTED:
+            if self._fernet is None:
+                # Encrypted with a key that is no longer configured
+                return None, flags, header_length
+            header = self._fernet.decrypt(header)
+        return json.loads(zlib.decompress(header).decode("utf-8")), flags, header_length
+
+    def _entry_expired(self, path: str, now: float) -> bool:
+        """Read only the header of an entry to check its age; unreadable entries count as expired."""
+        try:
+            with open(path, "rb") as f:
+                header, _, _ = self._read_header(f)
+        except FileNotFoundError:
+            return False
+        except Exception:  # pylint: disable=broad-except
+            return True
+        return header is not None and self._expired(header, now)
+
+    def _read(self, name: str):
+        path = os.path.join(self.cache_dir, name)
+        try:
+            with open(path, "rb") as f:
+                header, flags, _ = self._read_header(f)
+                if header is None:
+                    return None
+                blocks = f.read()
+            if flags & FLAG_ENCRYPTED:
+                blocks = self._fernet.decrypt(blocks)
+        except FileNotFoundError:
+            self._forget(name)
+            return None
+        except Exception as exc:  # pylint: disable=broad-except
+            print(f"[OCR-CACHE] Corrupt entry discarded: {exc}")
+            self._remove(path)
+            self._forget(name)
+            return None
+
+        if self._expired(header, time.time()):
+            self._remove(path)
+            self._forget(name)
+            return None
+
+        import numpy as np
+
+        grid = np.frombuffer(zlib.decompress(blocks), dtype=np.uint8).reshape(header["shape"])
+        return header, grid
+
+    def _evict(self) -> None:
+        """Drop expired entries and, least recently used first, those beyond max_bytes."""
+        with self._lock:
+            entries = []
+            now = time.time()
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith(".ocr"):
+                    continue
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, name))
+
+            entries.sort()
+            total = sum(size for _, size, _ in entries)
+            for mtime, size, name in entries:
+                expired = self.ttl_seconds > 0 and self._entry_expired(os.path.join(self.cache_dir, name), now)
+                if total <= self.max_bytes and not expired:
+                    continue
+                if self._remove(os.path.join(self.cache_dir, name)):
+                    total -= size
+                    self._index.pop(name, None)
+                    self._counters["evictions"] += 1
+
+    def _forget(self, name: str) -> None:
+        with self._lock:
+            self._index.pop(name, None)
+
+    def _remove(self, path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Process counters (hits, misses, candidates rejected by the block check, writes, evictions)."""
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_rate"] = round(counters["hits"] / lookups, 3) if lookups else 0.0
+        counters["enabled"] = self.enabled
+        counters["encrypted"] = self._fernet is not None
+        return counters
+
+
+# Global instance
+ocr_cache = OCRCache.from_env()
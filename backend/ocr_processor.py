@@ -4,200 +4,998 @@ Fallback for cases where the external parser fails or returns empty data.
 """
 from __future__ import annotations
 
-import io
+import importlib.util
+import os
+import queue
+import re
+import threading
+import time
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
 
 import fitz  # PyMuPDF
-from PIL import Image, ImageOps
+
+from ocr_backends import OCRBackend, TorchBackend, create_backend
+from ocr_cache import PageSignature, crop_digest, ocr_cache
+
+# Top-level packages required by the OCR path
+OCR_DEPENDENCIES = ("transformers", "torch", "PIL")
+
+# Pages rasterised ahead of the one being recognised
+OCR_PREFETCH_PAGES = 2
+
+# Batch size used when the free memory cannot be measured
+OCR_DEFAULT_BATCH = 8
+# Rough peak memory of one 384x384 stripe through trocr-base generate (activations + beams)
+OCR_BYTES_PER_STRIPE = 160 * 1024 * 1024
+
+
+# Tokens where one misread digit breaks detection: DNI/NIE, IBAN, long digit runs
+IDENTIFIER_PATTERN = re.compile(r"[XYZxyz]?\d{7,8}[A-Za-z]|[A-Za-z]{2}\d{2}[\d\s]{8,}|\d[\d\s.-]{6,}\d")
+
+
+# Speed/quality trade-offs selectable per request (ocrProfile) or with OCR_PROFILE:
+# - zoom: raster resolution (the line segmentation thresholds scale with it)
+# - model: TrOCR checkpoint (None = OCR_MODEL_NAME); OCR_MODEL_NAME_<PROFILE> overrides it
+# - generation: extra generate() arguments (decoding)
+# - recheck: re-read uncertain / identifier lines at OCR_RECHECK_ZOOM
+# - stripe_memory: peak memory per stripe relative to OCR_BYTES_PER_STRIPE (batch sizing)
+OCR_PROFILES: Dict[str, Dict[str, Any]] = {
+    "fast": {
+        "zoom": 1.5,
+        "model": "microsoft/trocr-small-printed",
+        "generation": {"num_beams": 1, "max_new_tokens": 48},
+        "recheck": False,
+        "stripe_memory": 0.5,
+    },
+    "balanced": {
+        "zoom": 2.0,
+        "model": None,
+        "generation": {},
+        "recheck": True,
+        "stripe_memory": 1.0,
+    },
+    "accurate": {
+        "zoom": 3.0,
+        "model": "microsoft/trocr-large-printed",
+        "generation": {"num_beams": 4, "max_new_tokens": 128},
+        "recheck": True,
+        "stripe_memory": 4.0,
+    },
+}
+DEFAULT_OCR_PROFILE = "balanced"
+# Profiles a request may ask for (the default profile is always allowed): accurate
+# loads trocr-large next to the preloaded model, so it has to be enabled server-side
+DEFAULT_ALLOWED_OCR_PROFILES = "fast,balanced"
+
+
+def normalize_ocr_profile(profile: Optional[str]) -> str:
+    """Known profile name; None or an unknown name gives OCR_PROFILE (balanced by default)."""
+    default = os.getenv("OCR_PROFILE", DEFAULT_OCR_PROFILE).strip().lower()
+    if default not in OCR_PROFILES:
+        print(f"[OCR] Unknown OCR_PROFILE '{default}', using '{DEFAULT_OCR_PROFILE}'")
+        default = DEFAULT_OCR_PROFILE
+    if not profile:
+        return default
+    normalized = profile.strip().lower()
+    if normalized not in OCR_PROFILES:
+        print(f"[OCR] Unknown OCR profile '{profile}', using '{default}'")
+        return default
+    return normalized
+
+
+def request_ocr_profile(profile: Optional[str]) -> str:
+    """Profile for a request: like normalize_ocr_profile, but limited to OCR_ALLOWED_PROFILES."""
+    default = normalize_ocr_profile(None)
+    name = normalize_ocr_profile(profile)
+    allowed = {
+        item.strip().lower()
+        for item in os.getenv("OCR_ALLOWED_PROFILES", DEFAULT_ALLOWED_OCR_PROFILES).split(",")
+    }
+    if name != default and name not in allowed:
+        print(f"[OCR] Profile '{name}' not allowed (OCR_ALLOWED_PROFILES), using '{default}'")
+        return default
+    return name
+
+
+def _is_out_of_memory(exc: Exception) -> bool:
+    return isinstance(exc, MemoryError) or "out of memory" in str(exc).lower()
+
+
+# Line segmentation, in pixels of the zoom-2 raster
+LINE_MIN_HEIGHT = 6      # shorter ink bands are specks, rules or underlines
+LINE_MERGE_GAP = 2       # rows this close belong to the same line (accents, descenders)
+LINE_MAX_HEIGHT = 120    # taller bands (touching lines, figures) are split at their thinnest row
+LINE_PADDING = 4
+
+
+def segment_text_lines(gray: np.ndarray, scale: float = 1.0) -> List[Tuple[int, int, int, int]]:
+    """
+    Find text lines with horizontal projection profiles.
+
+    The grayscale raster (2-D uint8 array) is binarised against its own background level; rows
+    holding ink form bands (columns inked over half the height are rules and
+    are ignored), nearby bands are merged, specks are dropped and over-tall
+    bands are split at their emptiest row. Each line is then trimmed
+    horizontally with the column profile of its band.
+
+    Returns:
+        (x0, y0, x1, y1) pixel boxes, top to bottom, padded by LINE_PADDING.
+        An empty list means the page is blank.
+
+    The LINE_* limits are zoom-2 pixels; `scale` adapts them to rasters rendered
+    at another zoom (scale = zoom / 2).
+    """
+    import numpy as np
+
+    min_height = max(2, round(LINE_MIN_HEIGHT * scale))
+    merge_gap = round(LINE_MERGE_GAP * scale)
+    max_height = round(LINE_MAX_HEIGHT * scale)
+    padding = round(LINE_PADDING * scale)
+
+    height, width = gray.shape
+    if not height or not width:
+        return []
+
+    # Background = 90th percentile of the gray histogram (cheaper than np.percentile)
+    histogram = np.bincount(gray.ravel(), minlength=256)
+    background = int(np.searchsorted(np.cumsum(histogram), 0.9 * gray.size))
+    if background < 128:
+        # Light text on a dark page
+        gray = 255 - gray
+        histogram = histogram[::-1]
+        background = int(np.searchsorted(np.cumsum(histogram), 0.9 * gray.size))
+    ink = gray < min(200, background - 40)
+    # Vertical rules (frames, table borders) would turn every row they cross into a text row
+    rules = ink.sum(axis=0) > 0.5 * height
+    if rules.any():
+        ink[:, rules] = False
+
+    row_profile = ink.sum(axis=1)
+    text_rows = row_profile >= max(2, width // 1000)
+
+    # Runs of text rows as [start, end) bands
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], text_rows.view(np.int8), [0]))))
+    bands: List[List[int]] = []
+    for start, end in zip(edges[::2].tolist(), edges[1::2].tolist()):
+        if bands and start - bands[-1][1] <= merge_gap:
+            bands[-1][1] = end
+        else:
+            bands.append([start, end])
+
+    lines: List[Tuple[int, int]] = []
+    pending = [(start, end) for start, end in bands if end - start >= min_height]
+    while pending:
+        start, end = pending.pop(0)
+        if end - start <= max_height:
+            lines.append((start, end))
+            continue
+        inner = row_profile[start + min_height:end - min_height]
+        cut = start + min_height + int(np.argmin(inner))
+        pending[:0] = [(start, cut), (cut, end)]
+
+    boxes: List[Tuple[int, int, int, int]] = []
+    for start, end in lines:
+        columns = np.flatnonzero(ink[start:end].any(axis=0))
+        if not columns.size:
+            continue
+        boxes.append(
+            (
+                max(0, int(columns[0]) - padding),
+                max(0, start - padding),
+                min(width, int(columns[-1]) + 1 + padding),
+                min(height, end + padding),
+            )
+        )
+    return boxes
+
+
+class PageRaster:
+    """
+    Grayscale raster of a page at the OCR zoom.
+
+    `gray` is a NumPy view over the pixmap samples, not a copy: the pixmap is
+    kept alive here because it owns that memory. Only the line crops handed to
+    TrOCR are copied (and expanded to RGB). `origin` is the page point of the
+    top-left pixel (non-zero for rasters of a clipped region).
+    """
+
+    def __init__(self, pixmap: fitz.Pixmap, zoom: float, origin: Tuple[float, float] = (0.0, 0.0)) -> None:
+        import numpy as np
+
+        self.pixmap = pixmap
+        self.zoom = zoom
+        self.origin = origin
+        samples = np.frombuffer(pixmap.samples_mv, dtype=np.uint8)
+        self.gray = samples.reshape(pixmap.height, pixmap.stride)[:, :pixmap.width]
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.pixmap.width, self.pixmap.height
+
+    def crop(self, box: Tuple[int, int, int, int]) -> Image.Image:
+        from PIL import Image
+
+        x0, y0, x1, y1 = box
+        return Image.fromarray(self.gray[y0:y1, x0:x1]).convert("RGB")
 
 
 class OCRProcessor:
     """Processes scanned PDFs through Microsoft TrOCR."""
 
-    def __init__(self) -> None:
+    def __init__(self, backend: Optional[str] = None, profile: Optional[str] = None) -> None:
         self.model = None
         self.processor = None
         self.device = None
+        # Inference runtime (see ocr_backends.py); None = OCR_BACKEND
+        self.backend_name = backend
+        self.backend: Optional[OCRBackend] = None
+        # Speed/quality profile (see OCR_PROFILES); None = OCR_PROFILE
+        self.profile = normalize_ocr_profile(profile)
+        settings = OCR_PROFILES[self.profile]
+        self.zoom = settings["zoom"]
+        self.model_name = os.getenv(f"OCR_MODEL_NAME_{self.profile.upper()}") or settings["model"]
+        self.generation = dict(settings["generation"])
+        self.stripe_bytes = int(OCR_BYTES_PER_STRIPE * settings["stripe_memory"])
         self._initialized = False
+        self._ocr_available: Optional[bool] = None
+        self._probe_lock = threading.Lock()
+        self._inference_lock = threading.Lock()
+        # Serialises model loading: concurrent first requests must not load it twice
+        self._model_lock = threading.Lock()
+        # cold -> loading -> warming -> ready, or failed / unavailable
+        self.model_state = "cold"
+        self.model_error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+        self._preload_thread: Optional[threading.Thread] = None
+        # OCR_BATCH_SIZE=0 sizes batches from the available memory
+        self.batch_size = max(0, int(os.getenv("OCR_BATCH_SIZE", "0")))
+        self.max_batch_size = max(1, int(os.getenv("OCR_BATCH_MAX", "16")))
+        self._batch_size = 0
+        # Per-line confidence from the generate scores (turned off if the backend cannot score)
+        self.confidence_scores = True
+        # Re-read uncertain / identifier lines at a higher zoom (0 disables)
+        self.recheck_confidence = float(os.getenv("OCR_RECHECK_CONFIDENCE", "0.8"))
+        self.recheck_identifiers = (
+            os.getenv("OCR_RECHECK_IDENTIFIERS", "1").strip().lower() in {"1", "true", "yes", "on"}
+        )
+        self.recheck_zoom = float(os.getenv("OCR_RECHECK_ZOOM", "4")) if settings["recheck"] else 0.0
 
     def _initialize_model(self) -> None:
-        """Lazy-load the TrOCR model on first use."""
+        """Lazy-load the TrOCR model on first use (at most once, whatever the number of callers)."""
         if self._initialized:
             return
-
+        with self._model_lock:
+            if self._initialized:
+                return
+            self._load_model()
+
+    def _load_model(self, mark_ready: bool = True) -> None:
+        """Load the backend; with mark_ready=False the caller (preload) sets "ready" after its warm-up."""
+        self.model_state = "loading"
+        self.model_error = None
+        started = time.perf_counter()
         try:
             print("[OCR] Initialising Microsoft TrOCR model...")
             print("[OCR] First run may take a few minutes while weights download")
 
-            from transformers import TrOCRProcessor, VisionEncoderDecoderModel
-            import torch
-
-            self.device = "cuda" if torch.cuda.is_available() else "cpu"
-            print(f"[OCR] Device: {self.device.upper()}")
-
-            model_name = "microsoft/trocr-base-printed"
-            print(f"[OCR] Loading model: {model_name}")
-
-            self.processor = TrOCRProcessor.from_pretrained(model_name)
-            self.model = VisionEncoderDecoderModel.from_pretrained(model_name)
-            self.model.to(self.device)
-            self.model.eval()
-
+            backend = create_backend(self.backend_name, **self._backend_settings())
+            print(f"[OCR] Loading model: {backend.model_name} ({backend.name}, profile: {self.profile}, "
+                  f"cache: {backend.model_dir})")
+            try:
+                backend.load()
+            except ImportError as exc:
+                if backend.name == TorchBackend.name:
+                    raise
+                # Optional runtime not installed (optimum/onnxruntime): keep OCR working
+                print(f"[OCR] Backend '{backend.name}' unavailable ({exc}), falling back to '{TorchBackend.name}'")
+                backend = create_backend(TorchBackend.name, **self._backend_settings())
+                backend.load()
+
+            self.backend = backend
+            self.processor = backend.processor
+            self.model = backend.model
+            self.device = backend.device
+            print(f"[OCR] Backend: {backend.describe()}")
+
+            self.load_seconds = time.perf_counter() - started
             self._initialized = True
-            print("[OCR] Model ready")
+            if mark_ready:
+                # Loaded on demand (no warm-up): the first batch pays the kernel set-up
+                self.model_state = "ready"
+            print(f"[OCR] Model loaded ({self.load_seconds:.1f}s)")
 
         except ImportError as exc:
+            # Installed but not importable (broken install): stop offering OCR
+            self._ocr_available = False
+            self.model_state = "unavailable"
+            self.model_error = f"{exc.__class__.__name__}: {exc}"
             print("[OCR] Missing dependencies: install transformers torch pillow")
             raise Exception("OCR dependencies are not installed") from exc
 
         except Exception as exc:  # pylint: disable=broad-except
+            self.model_state = "failed"
+            self.model_error = f"{exc.__class__.__name__}: {exc}"
             print(f"[OCR] Error initialising TrOCR: {exc}")
             raise
 
-    def extract_text_from_pdf(self, pdf_path: str) -> Dict:
-        """Extract text (and coarse layout data) from a PDF using OCR."""
+    def _backend_settings(self) -> Dict[str, Any]:
+        """Backend overrides of the profile: model checkpoint and decoding settings."""
+        settings: Dict[str, Any] = {"generation": self.generation}
+        if self.model_name:
+            settings["model_name"] = self.model_name
+        return settings
+
+    def preload(self, warm_up: bool = True) -> bool:
+        """
+        Load the model now and, optionally, run one warm-up inference.
+
+        The warm-up pushes a blank text line through generate so the first real
+        batch does not pay for allocator growth and kernel selection. Returns
+        True when the model is ready; errors are recorded in model_state /
+        model_error instead of being raised (this runs at boot).
+        """
+        if not self.can_use_ocr():
+            self.model_state = "unavailable"
+            self.model_error = "OCR dependencies are not installed"
+            print(f"[OCR] Preload skipped: {self.model_error}")
+            return False
+
+        from PIL import Image
+
+        with self._model_lock:
+            warming = warm_up and self.warmup_seconds is None
+            try:
+                if not self._initialized:
+                    # Not "ready" until the warm-up below has run
+                    self._load_model(mark_ready=not warming)
+                if warming:
+                    self.model_state = "warming"
+                    started = time.perf_counter()
+                    self._generate([Image.new("RGB", (384, 48), "white")])
+                    self.warmup_seconds = time.perf_counter() - started
+                    print(f"[OCR] Warm-up inference done ({self.warmup_seconds:.2f}s)")
+            except Exception as exc:  # pylint: disable=broad-except
+                if self._initialized:
+                    # The model loaded but the warm-up failed: OCR still works, just cold
+                    print(f"[OCR] Warm-up failed: {exc}")
+                else:
+                    return False
+            self.model_state = "ready"
+            return True
+
+    def start_preload(self, warm_up: bool = True) -> None:
+        """Preload the model in a background thread (used at boot with OCR_PRELOAD=1)."""
+        if self._preload_thread is not None:
+            return
+        self._preload_thread = threading.Thread(
+            target=self.preload, args=(warm_up,), name="ocr-preload", daemon=True
+        )
+        self._preload_thread.start()
+
+    @property
+    def is_ready(self) -> bool:
+        """True once the model is loaded (and warmed up, if a warm-up was requested)."""
+        return self.model_state == "ready"
+
+    def status(self) -> Dict:
+        """Model state for /health and /ready/ocr."""
+        return {
+            "state": self.model_state,
+            "profile": self.profile,
+            "backend": self.backend.describe() if self.backend is not None else None,
+            "loadSeconds": round(self.load_seconds, 2) if self.load_seconds is not None else None,
+            "warmupSeconds": round(self.warmup_seconds, 2) if self.warmup_seconds is not None else None,
+            "error": self.model_error,
+        }
+
+    def extract_text_from_pdf(
+        self,
+        pdf_path: Union[str, bytes],
+        page_images: Optional[Sequence[Optional[fitz.Pixmap]]] = None,
+        on_page: Optional[Callable[[Dict, int], None]] = None,
+    ) -> Dict:
+        """
+        Extract text (and coarse layout data) from a PDF using OCR.
+
+        page_images optionally holds, per page, the already-decoded pixels of
+        an image that fills the page (image uploads). Those pages are read from
+        the pixels instead of being rasterised again; None entries are rendered.
+        pdf_path may also be the PDF content itself (in-memory requests).
+
+        A producer thread rasterises and segments page N+1 while the lines of
+        page N are being recognised. Lines from consecutive pages share TrOCR
+        batches, and on_page(page, total_pages) is called as soon as every line
+        of a page has been recognised.
+        """
         self._initialize_model()
 
         print("\n[OCR] " + "=" * 60)
-        print(f"[OCR] Processing PDF with OCR: {Path(pdf_path).name}")
+        in_memory = isinstance(pdf_path, (bytes, bytearray, memoryview))
+        print(f"[OCR] Processing PDF with OCR: {'<in memory>' if in_memory else Path(pdf_path).name}")
         print("[OCR] " + "=" * 60)
 
-        doc = fitz.open(pdf_path)
+        doc = self._open_document(pdf_path)
         total_pages = len(doc)
         print(f"[OCR] Total pages: {total_pages}")
 
-        pages: List[Dict] = []
+        self._batch_size = self._resolve_batch_size()
+        print(f"[OCR] Batch size: {self._batch_size} line(s)")
 
+        page_lines: List[List[Dict]] = [[] for _ in range(total_pages)]
+        pages: List[Dict] = []
+        pending: List[Dict] = []
+        # Signatures and line crops of the pages recognised here, stored in the OCR cache once complete
+        signatures: Dict[int, PageSignature] = {}
+        page_stripes: Dict[int, List[Dict]] = {}
+        failed_pages: set = set()
+        cached_pages: set = set()
+        # Lines read from the OCR cache are not re-read at a higher zoom again
+        reused_lines: set = set()
+        cache_hits = 0
+        cache_lines = 0
+        recheck = {"lines": 0, "improved": 0}
+        # Rechecks render line clips in this thread, so they get their own handle on the document
+        recheck_doc: List[fitz.Document] = []
+        rasterised = queue.Queue(maxsize=OCR_PREFETCH_PAGES)
+        stop = threading.Event()
+
+        def recheck_page(page_index: int) -> fitz.Page:
+            if not recheck_doc:
+                recheck_doc.append(self._open_document(pdf_path))
+            return recheck_doc[0][page_index]
+
+        def emit_completed(limit: int) -> None:
+            # Pages before `limit` have no line left in the queue
+            for page_index in range(len(pages), limit):
+                line_items = page_lines[page_index]
+                # Cached and recognised lines arrive separately: back to top-to-bottom order
+                line_items.sort(key=lambda line: line["stripe_index"])
+                recheck_items = [line for line in line_items if id(line) not in reused_lines]
+                if any(self._needs_recheck(line) for line in recheck_items):
+                    lines, improved = self._recheck_lines(recheck_page(page_index), recheck_items)
+                    recheck["lines"] += lines
+                    recheck["improved"] += improved
+                page_text = "\n".join(item["text"] for item in line_items)
+                page = {"text": page_text, "page_number": page_index + 1, "lines": line_items}
+                pages.append(page)
+                print(f"[OCR] Page {page_index + 1}: {len(line_items)} line(s), {len(page_text)} character(s)")
+                signature = signatures.pop(page_index, None)
+                stripes = page_stripes.pop(page_index, None)
+                if signature is not None and stripes and page_index not in failed_pages:
+                    ocr_cache.put(signature, self._cache_model_id(), self._cache_readings(stripes, line_items))
+                if on_page is not None:
+                    on_page(page, total_pages)
+
+        # The producer is the only thread touching `doc` until it is joined
+        producer = threading.Thread(
+            target=self._rasterise_pages,
+            args=(doc, page_images, rasterised, stop),
+            name="ocr-raster",
+            daemon=True,
+        )
+        producer.start()
         try:
-            for page_index in range(total_pages):
-                print(f"\n[OCR] Page {page_index + 1}/{total_pages}")
-                page = doc[page_index]
-
-                page_text, line_items = self._extract_text_from_page(page)
-
-                pages.append(
-                    {
-                        "text": page_text,
-                        "page_number": page_index + 1,
-                        "lines": line_items,
-                    }
-                )
-
-                print(f"[OCR] Characters extracted: {len(page_text)}")
+            for _ in range(total_pages):
+                page_index, stripes, cached_readings, signature = self._next_rasterised(rasterised, producer)
+                if signature is not None:
+                    signatures[page_index] = signature
+                    page_stripes[page_index] = stripes
+                if cached_readings is not None:
+                    # Only lines whose crop is bit-identical to the cached one skip inference
+                    missing: List[Dict] = []
+                    for stripe in stripes:
+                        reading = cached_readings.get(stripe.get("digest"))
+                        if reading is None:
+                            missing.append(stripe)
+                            continue
+                        stripe["reading"] = (reading["text"], reading["confidence"])
+                        if reading["text"]:
+                            line = self._stripe_line_item(stripe, reading["text"], reading["confidence"])
+                            page_lines[page_index].append(line)
+                            reused_lines.add(id(line))
+                    cache_lines += len(stripes) - len(missing)
+                    print(f"[OCR]   {len(stripes) - len(missing)}/{len(stripes)} line(s) reused from the OCR cache")
+                    if not missing:
+                        # Nothing new to store for this page
+                        cached_pages.add(page_index)
+                        cache_hits += 1
+                        signatures.pop(page_index, None)
+                    stripes = missing
+                pending.extend(stripes)
+
+                while len(pending) >= self._batch_size:
+                    batch, pending = pending[:self._batch_size], pending[self._batch_size:]
+                    self._recognize_stripes(batch, page_lines, failed_pages)
+                    emit_completed(pending[0]["page_index"] if pending else page_index + 1)
+                if not pending:
+                    emit_completed(page_index + 1)
+
+            self._recognize_stripes(pending, page_lines, failed_pages)
+            emit_completed(total_pages)
 
         finally:
+            stop.set()
+            producer.join()
             doc.close()
+            for handle in recheck_doc:
+                handle.close()
 
         print("\n[OCR] " + "=" * 60)
         print(f"[OCR] OCR finished: {total_pages} page(s)")
+        if ocr_cache.enabled:
+            print(f"[OCR] Pages reused from the OCR cache: {cache_hits}/{total_pages} ({cache_lines} line(s))")
+        if recheck["lines"]:
+            print(f"[OCR] Lines re-read at zoom {self.recheck_zoom:g}: {recheck['lines']} "
+                  f"({recheck['improved']} improved)")
         print("[OCR] " + "=" * 60 + "\n")
 
-        return {"pages": pages}
-
-    def _extract_text_from_page(self, page: fitz.Page) -> Tuple[str, List[Dict]]:
-        """Perform OCR over a single page and collect coarse bounding boxes."""
-        import torch
+        return {
+            "pages": pages,
+            "ocr_cache_hits": cache_hits,
+            "ocr_rechecked_lines": recheck["lines"],
+            "ocr_recheck_improved": recheck["improved"],
+        }
+
+    @staticmethod
+    def _open_document(pdf_path: Union[str, bytes]) -> fitz.Document:
+        if isinstance(pdf_path, (bytes, bytearray, memoryview)):
+            return fitz.open(stream=pdf_path, filetype="pdf")
+        return fitz.open(pdf_path)
+
+    def _needs_recheck(self, line: Dict) -> bool:
+        """Low confidence, or an identifier-like token where one wrong digit matters."""
+        confidence = line.get("confidence")
+        if confidence is None or self.recheck_zoom <= self.zoom or line.get("rechecked"):
+            return False
+        if confidence < self.recheck_confidence:
+            return True
+        return self.recheck_identifiers and IDENTIFIER_PATTERN.search(line["text"]) is not None
+
+    def _recheck_lines(self, page: fitz.Page, line_items: List[Dict]) -> Tuple[int, int]:
+        """
+        Re-read the lines of a page that need it from a render at recheck_zoom.
+
+        Only the line clips are rendered again, so small print and identifier
+        digits get the higher resolution without paying for it on the whole
+        page. The reading with the higher confidence is kept.
+
+        Returns:
+            (lines re-read, lines whose text was replaced)
+        """
+        candidates = [line for line in line_items if self._needs_recheck(line)]
+        images = [self._line_image(page, line["bbox"]) for line in candidates]
+        readings = self._recognize_images(images)
+
+        improved = 0
+        for line, reading in zip(candidates, readings):
+            line["rechecked"] = True
+            if reading is None:
+                continue
+            text, confidence = reading[0].strip(), reading[1]
+            if not text or confidence is None or confidence <= line["confidence"]:
+                continue
+            if text != line["text"]:
+                print(f"[OCR]   Line re-read at zoom {self.recheck_zoom:g}: {line['text']!r} "
+                      f"({line['confidence']:.2f}) -> {text!r} ({confidence:.2f})")
+                improved += 1
+            self._set_line_text(line, text, confidence)
+        return len(candidates), improved
+
+    def _line_image(self, page: fitz.Page, bbox: Sequence[float]) -> Image.Image:
+        """One line clip rendered in gray at recheck_zoom, as the RGB crop TrOCR expects."""
+        clip = fitz.Rect(bbox) & page.rect
+        pix = page.get_pixmap(
+            matrix=fitz.Matrix(self.recheck_zoom, self.recheck_zoom), clip=clip, colorspace=fitz.csGRAY, alpha=False
+        )
+        return PageRaster(pix, self.recheck_zoom).crop((0, 0, pix.width, pix.height))
+
+    def extract_text_from_regions(
+        self,
+        pdf_path: Union[str, bytes],
+        regions: Dict[int, List[Dict]],
+    ) -> Dict[int, List[Dict]]:
+        """
+        OCR only some rectangles of some pages (image regions of digital pages).
+
+        regions maps a page index to [{"bbox": [x0, y0, x1, y1], "zoom": z}], with
+        bbox in PDF points. Each region is rendered on its own at its zoom (the
+        native resolution of the embedded image, capped by the caller) and its
+        lines are recognised in shared batches.
+
+        Returns:
+            Page index -> OCR lines (bbox in page coordinates), same format as
+            the "lines" of extract_text_from_pdf.
+        """
+        self._initialize_model()
+        doc = self._open_document(pdf_path)
+        page_order = sorted(regions)
+        page_lines: List[List[Dict]] = [[] for _ in page_order]
+        try:
+            self._batch_size = self._resolve_batch_size()
+            stripes: List[Dict] = []
+            for position, page_index in enumerate(page_order):
+                page = doc[page_index]
+                for region in regions[page_index]:
+                    clip = fitz.Rect(region["bbox"]) & page.rect
+                    if clip.is_empty:
+                        continue
+                    raster = self._region_raster(page, clip, region.get("zoom", self.zoom))
+                    for stripe in self._page_stripes(page, raster):
+                        stripe["page_index"] = position
+                        stripes.append(stripe)
+
+            print(f"[OCR] Regions: {sum(len(regions[i]) for i in page_order)} on {len(page_order)} page(s), "
+                  f"{len(stripes)} line(s)")
+            for start in range(0, len(stripes), self._batch_size):
+                self._recognize_stripes(stripes[start:start + self._batch_size], page_lines)
+        finally:
+            doc.close()
 
-        zoom = 2.0
-        mat = fitz.Matrix(zoom, zoom)
-        pix = page.get_pixmap(matrix=mat)
+        return {page_index: page_lines[position] for position, page_index in enumerate(page_order)}
 
-        image = Image.open(io.BytesIO(pix.tobytes("png"))).convert("RGB")
-        print(f"[OCR]   Page rasterised at {image.size[0]}x{image.size[1]} px")
+    def _region_raster(self, page: fitz.Page, clip: fitz.Rect, zoom: float) -> PageRaster:
+        """Grayscale raster of one page rectangle; bboxes are mapped back through the origin."""
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip, colorspace=fitz.csGRAY, alpha=False)
+        print(f"[OCR]   Page {page.number + 1}: region {clip.width:.0f}x{clip.height:.0f} pt "
+              f"rasterised at {pix.width}x{pix.height} px (zoom {zoom:.1f})")
+        # pix.x / pix.y: top-left pixel of the clip in the zoomed page space
+        return PageRaster(pix, zoom, origin=(pix.x / zoom, pix.y / zoom))
 
-        line_items = self._extract_text_lines_from_image(page, image, zoom)
-        page_text = "\n".join(item["text"] for item in line_items)
+    def _rasterise_pages(
+        self,
+        doc: fitz.Document,
+        page_images: Optional[Sequence[Optional[fitz.Pixmap]]],
+        rasterised: queue.Queue,
+        stop: threading.Event,
+    ) -> None:
+        """
+        Producer: raster and line crops of every page, in order.
+
+        Pages of a template found in the OCR cache are queued with its line
+        readings (by crop digest) next to their crops; pages with a signature
+        carry it so the consumer can store their readings.
+        """
+        try:
+            for page_index in range(len(doc)):
+                print(f"\n[OCR] Page {page_index + 1}/{len(doc)}")
+                page = doc[page_index]
+                source = page_images[page_index] if page_images and page_index < len(page_images) else None
+
+                raster = self._page_raster(page, source)
+                signature = PageSignature.from_gray(raster.gray) if ocr_cache.enabled else None
+                cached_readings = ocr_cache.get(signature, self._cache_model_id()) if signature is not None else None
+                if cached_readings is not None:
+                    print("[OCR]   Page matched a template in the OCR cache")
+                stripes = self._page_stripes(page, raster, with_digests=signature is not None)
+                for stripe in stripes:
+                    stripe["page_index"] = page_index
+
+                while not stop.is_set():
+                    try:
+                        rasterised.put((page_index, stripes, cached_readings, signature), timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+        except Exception as exc:  # pylint: disable=broad-except
+            rasterised.put(exc)
 
-        return page_text, line_items
+    @staticmethod
+    def _next_rasterised(rasterised: queue.Queue, producer: threading.Thread):
+        while True:
+            try:
+                item = rasterised.get(timeout=0.5)
+            except queue.Empty:
+                if not producer.is_alive():
+                    raise RuntimeError("OCR rasteriser stopped before the last page")
+                continue
+            if isinstance(item, Exception):
+                raise item
+            return item
 
-    def _extract_text_lines_from_image(
+    def _extract_text_from_page(
         self,
         page: fitz.Page,
-        image: Image.Image,
-        zoom: float,
-    ) -> List[Dict]:
-        """Extract text in horizontal stripes, returning coarse bounding boxes."""
-        import torch
-
-        width, height = image.size
-        stripe_height = 100
-        num_stripes = max(1, height // stripe_height)
+        source: Optional[fitz.Pixmap] = None,
+    ) -> Tuple[str, List[Dict]]:
+        """Perform OCR over a single page and collect coarse bounding boxes."""
+        raster = self._page_raster(page, source)
+        line_items = self._extract_text_lines_from_raster(page, raster)
+        page_text = "\n".join(item["text"] for item in line_items)
 
-        print(f"[OCR]   Processing {num_stripes} stripe(s) of text...")
+        return page_text, line_items
 
-        lines: List[Dict] = []
-        page_width = page.rect.width
-        page_height = page.rect.height
+    def _page_raster(self, page: fitz.Page, source: Optional[fitz.Pixmap] = None) -> PageRaster:
+        """
+        Grayscale raster of the page at the profile zoom (taken from decoded pixels when available).
+
+        MuPDF renders straight into a one-channel pixmap, which is wrapped
+        without copying; there is no PNG encode/decode round trip.
+        """
+        zoom = self.zoom
+        if source is not None:
+            # Decoded upload: convert to gray, then resample to the size a render at this zoom would have
+            width = max(1, round(page.rect.width * zoom))
+            height = max(1, round(page.rect.height * zoom))
+            pix = source if source.n == 1 else fitz.Pixmap(fitz.csGRAY, source)
+            if (pix.width, pix.height) != (width, height):
+                pix = fitz.Pixmap(pix, width, height, None)
+            raster = PageRaster(pix, zoom)
+            print(f"[OCR]   Page taken from decoded image at {pix.width}x{pix.height} px")
+        else:
+            pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+            raster = PageRaster(pix, zoom)
+            print(f"[OCR]   Page rasterised at {pix.width}x{pix.height} px")
+
+        return raster
+
+    def _extract_text_lines_from_raster(self, page: fitz.Page, raster: PageRaster) -> List[Dict]:
+        """Extract text line by line, returning the bounding box of each line."""
+        if self._batch_size <= 0:
+            self._batch_size = self._resolve_batch_size()
+
+        stripes = self._page_stripes(page, raster)
+        for stripe in stripes:
+            stripe["page_index"] = 0
+
+        page_lines: List[List[Dict]] = [[]]
+        for start in range(0, len(stripes), self._batch_size):
+            self._recognize_stripes(stripes[start:start + self._batch_size], page_lines)
+
+        print(f"[OCR]   Extracted {len(page_lines[0])} stripe(s) with text")
+        return page_lines[0]
+
+    def _page_stripes(self, page: fitz.Page, raster: PageRaster, with_digests: bool = False) -> List[Dict]:
+        """
+        Crop one stripe per detected text line; blank bands are never sent to TrOCR.
+
+        with_digests adds the exact digest of each crop (OCR cache lookups).
+        """
+        boxes = segment_text_lines(raster.gray, scale=raster.zoom / 2.0)
+        print(f"[OCR]   Queued {len(boxes)} text line(s)")
+
+        stripes: List[Dict] = []
+        for index, (x0, y0, x1, y1) in enumerate(boxes):
+            stripes.append(
+                {
+                    "index": index,
+                    "image": raster.crop((x0, y0, x1, y1)),
+                    "box": (x0, y0, x1, y1),
+                    "zoom": raster.zoom,
+                    "origin": raster.origin,
+                    "page_width": page.rect.width,
+                    "page_height": page.rect.height,
+                }
+            )
+            if with_digests:
+                stripes[-1]["digest"] = crop_digest(raster.gray[y0:y1, x0:x1])
+        return stripes
+
+    def _recognize_stripes(
+        self,
+        stripes: List[Dict],
+        page_lines: List[List[Dict]],
+        failed_pages: Optional[set] = None,
+    ) -> None:
+        """Run one batch of stripes through TrOCR and append the lines to their pages."""
+        if not stripes:
+            return
 
-        for index in range(num_stripes):
-            y_start = index * stripe_height
-            y_end = min((index + 1) * stripe_height, height)
-            stripe = image.crop((0, y_start, width, y_end))
+        readings = self._recognize_images([stripe["image"] for stripe in stripes])
+        for stripe, reading in zip(stripes, readings):
+            if reading is None:
+                print(f"[OCR]   Stripe {stripe['index'] + 1} of page {stripe['page_index'] + 1} failed")
+                if failed_pages is not None:
+                    failed_pages.add(stripe["page_index"])
+                continue
+            text, confidence = reading
+            cleaned = text.strip()
+            stripe["reading"] = (cleaned, confidence)
+            if cleaned:
+                page_lines[stripe["page_index"]].append(self._stripe_line_item(stripe, cleaned, confidence))
+
+    def _recognize_images(self, images: List[Image.Image]) -> List[Optional[Tuple[str, Optional[float]]]]:
+        """
+        Decode a list of crops with as few generate calls as possible.
+
+        Each reading is (text, confidence); confidence is None when the backend
+        cannot score its output.
+
+        A batch that runs out of memory is split in half (and the smaller batch
+        size is kept for the rest of the document); a batch that fails for any
+        other reason is retried image by image so one bad crop only loses itself.
+        None marks an image that could not be recognised.
+        """
+        if not images:
+            return []
+        if len(images) > self._batch_size:
+            size = self._batch_size
+            return [
+                reading
+                for start in range(0, len(images), size)
+                for reading in self._recognize_images(images[start:start + size])
+            ]
 
+        try:
+            return self._generate(images)
+        except Exception as exc:  # pylint: disable=broad-except
+            if len(images) == 1:
+                print(f"[OCR]   Recognition failed: {exc}")
+                return [None]
+            if _is_out_of_memory(exc):
+                self._batch_size = max(1, len(images) // 2)
+                print(f"[OCR]   Out of memory with {len(images)} stripe(s), batch size now {self._batch_size}")
+                self._release_cached_memory()
+                return self._recognize_images(images)
+            print(f"[OCR]   Batch of {len(images)} failed ({exc}), retrying one by one")
+            return [reading for image in images for reading in self._recognize_images([image])]
+
+    def _generate(self, images: List[Image.Image]) -> List[Tuple[str, Optional[float]]]:
+        """Single batched TrOCR forward pass on the configured backend: (text, confidence) per image."""
+        pixel_values = self.processor(images=images, return_tensors="pt").pixel_values
+        confidences: List[Optional[float]] = [None] * len(images)
+        # One model object serves every request thread of this process
+        with self._inference_lock:
+            if self.confidence_scores:
+                try:
+                    generated_ids, confidences = self.backend.generate_with_confidence(pixel_values)
+                except (AttributeError, TypeError, NotImplementedError) as exc:
+                    # Runtime or transformers version without generate scores: plain decoding from now on
+                    print(f"[OCR] Line confidence unavailable ({exc}), re-reading by confidence disabled")
+                    self.confidence_scores = False
+            if not self.confidence_scores:
+                generated_ids = self.backend.generate(pixel_values)
+        texts = self.processor.batch_decode(generated_ids, skip_special_tokens=True)
+        return list(zip(texts, confidences))
+
+    def _cache_model_id(self) -> str:
+        """OCR cache entries are only reused with the backend, model and profile that produced them."""
+        if self.backend is None:
+            return "unknown"
+        return f"{self.backend.name}:{self.backend.model_name}:{self.profile}"
+
+    @staticmethod
+    def _cache_readings(stripes: List[Dict], line_items: List[Dict]) -> List[Dict]:
+        """OCR cache record of a page: crop digest and final text (after re-reading) of every line crop."""
+        lines = {line["stripe_index"]: line for line in line_items}
+        readings = []
+        for stripe in stripes:
+            line = lines.get(stripe["index"])
+            readings.append({
+                "digest": stripe["digest"],
+                "text": line["text"] if line is not None else "",
+                "confidence": line["confidence"] if line is not None else stripe["reading"][1],
+            })
+        return readings
+
+    def _stripe_line_item(self, stripe: Dict, cleaned: str, confidence: Optional[float] = None) -> Dict:
+        """Build the line entry (PDF-space bbox) for a recognised line crop."""
+        left_px, top_px, right_px, bottom_px = stripe["box"]
+        zoom = stripe["zoom"]
+        origin_x, origin_y = stripe.get("origin", (0.0, 0.0))
+
+        x0_pdf = max(0.0, origin_x + left_px / zoom)
+        x1_pdf = min(stripe["page_width"], origin_x + right_px / zoom)
+        y0_pdf = max(0.0, origin_y + top_px / zoom)
+        y1_pdf = min(stripe["page_height"], origin_y + bottom_px / zoom)
+
+        line = {
+            "text": cleaned,
+            "bbox": [x0_pdf, y0_pdf, x1_pdf, y1_pdf],
+            "stripe_index": stripe["index"],
+            "x0": x0_pdf,
+            "y0": y0_pdf,
+        }
+        self._set_line_text(line, cleaned, confidence)
+        return line
+
+    @staticmethod
+    def _set_line_text(line: Dict, text: str, confidence: Optional[float]) -> None:
+        x0_pdf, _, x1_pdf, _ = line["bbox"]
+        line["text"] = text
+        line["text_length"] = len(text)
+        line["char_width"] = (x1_pdf - x0_pdf) / len(text) if text else (x1_pdf - x0_pdf)
+        line["confidence"] = round(confidence, 4) if confidence is not None else None
+
+    def _resolve_batch_size(self) -> int:
+        """
+        Stripes per generate call: OCR_BATCH_SIZE when set, otherwise sized from
+        the memory currently available (GPU memory on CUDA, MemAvailable on CPU)
+        and capped at OCR_BATCH_MAX.
+        """
+        if self.batch_size > 0:
+            return self.batch_size
+
+        available = self._available_memory_bytes()
+        if available is None:
+            return min(OCR_DEFAULT_BATCH, self.max_batch_size)
+        # Keep half of the free memory for everything else in the process
+        fitted = int(available * 0.5 // self.stripe_bytes)
+        return max(1, min(self.max_batch_size, fitted))
+
+    def _available_memory_bytes(self) -> Optional[int]:
+        """Free memory on the inference device, or None when it cannot be read."""
+        if self.device == "cuda":
             try:
-                pixel_values = self.processor(stripe, return_tensors="pt").pixel_values
-                pixel_values = pixel_values.to(self.device)
-
-                with torch.no_grad():
-                    generated_ids = self.model.generate(pixel_values)
-
-                generated_text = self.processor.batch_decode(
-                    generated_ids, skip_special_tokens=True
-                )[0]
-
-                cleaned = generated_text.strip()
-                if not cleaned:
-                    continue
-
-                stripe_gray = stripe.convert("L")
-                inverted = ImageOps.invert(stripe_gray)
-                binary = inverted.point(lambda p: 255 if p > 20 else 0)
-                bbox_pixels = binary.getbbox()
-
-                if not bbox_pixels:
-                    bbox_pixels = (0, 0, stripe.width, stripe.height)
-
-                left_px, top_px, right_px, bottom_px = bbox_pixels
-
-                x0_pdf = max(0.0, left_px / zoom)
-                x1_pdf = min(page_width, right_px / zoom)
-                y0_pdf = max(0.0, (y_start + top_px) / zoom)
-                y1_pdf = min(page_height, (y_start + bottom_px) / zoom)
-
-                text_length = len(cleaned)
-                char_width = (x1_pdf - x0_pdf) / text_length if text_length else (x1_pdf - x0_pdf)
-
-                lines.append(
-                    {
-                        "text": cleaned,
-                        "bbox": [x0_pdf, y0_pdf, x1_pdf, y1_pdf],
-                        "stripe_index": index,
-                        "text_length": text_length,
-                        "char_width": char_width,
-                        "x0": x0_pdf,
-                        "y0": y0_pdf,
-                    }
-                )
-
-            except Exception as exc:  # pylint: disable=broad-except
-                print(f"[OCR]   Stripe {index + 1} failed: {exc}")
-                continue
+                import torch
 
-        print(f"[OCR]   Extracted {len(lines)} stripe(s) with text")
-        return lines
+                free_bytes, _ = torch.cuda.mem_get_info()
+                return int(free_bytes)
+            except Exception:  # pylint: disable=broad-except
+                return None
 
-    def can_use_ocr(self) -> bool:
-        """Return True when all OCR dependencies are importable."""
         try:
-            import transformers  # noqa: F401
-            import torch  # noqa: F401
-            from PIL import Image  # noqa: F401
-
-            return True
-        except ImportError:
-            return False
+            with open("/proc/meminfo", encoding="ascii") as meminfo:
+                for line in meminfo:
+                    if line.startswith("MemAvailable:"):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError, IndexError):
+            pass
+        return None
+
+    def _release_cached_memory(self) -> None:
+        if self.device == "cuda":
+            import torch
 
+            torch.cuda.empty_cache()
 
-# Global instance used across the backend
+    def can_use_ocr(self) -> bool:
+        """
+        Return True when all OCR dependencies are installed.
+
+        The packages are located with importlib.util.find_spec instead of being
+        imported (importing torch and transformers takes seconds on a cold
+        process), and the answer is computed once and cached.
+        """
+        if self._ocr_available is None:
+            with self._probe_lock:
+                if self._ocr_available is None:
+                    started = time.perf_counter()
+                    missing = [name for name in OCR_DEPENDENCIES if importlib.util.find_spec(name) is None]
+                    self._ocr_available = not missing
+                    elapsed = time.perf_counter() - started
+                    if missing:
+                        print(f"[OCR] Unavailable, missing packages: {', '.join(missing)} ({elapsed:.3f}s)")
+                    else:
+                        print(f"[OCR] Dependencies found ({elapsed:.3f}s)")
+        return self._ocr_available
+
+    @property
+    def ocr_available(self) -> Optional[bool]:
+        """Cached probe result (None until can_use_ocr has run)."""
+        return self._ocr_available
+
+    def start_availability_probe(self) -> None:
+        """Run the availability probe in a background thread (used at boot)."""
+        threading.Thread(target=self.can_use_ocr, name="ocr-probe", daemon=True).start()
+
+
+# Global instance used across the backend (profile OCR_PROFILE)
 ocr_processor = OCRProcessor()
+
+# Processor of another profile, created (and its model loaded) on first use; only
+# one stays cached so requests cannot pile extra models up in memory
+_profile_processors: Dict[str, OCRProcessor] = {}
+_profile_lock = threading.Lock()
+
+
+def get_ocr_processor(profile: Optional[str] = None) -> OCRProcessor:
+    """OCR processor of a profile; the default profile is the global ocr_processor."""
+    name = normalize_ocr_profile(profile)
+    if name == ocr_processor.profile:
+        return ocr_processor
+    with _profile_lock:
+        processor = _profile_processors.get(name)
+        if processor is None:
+            if _profile_processors:
+                # Requests still using the previous one keep it until they finish
+                print(f"[OCR] Releasing the '{', '.join(_profile_processors)}' profile model to load '{name}'")
+                _profile_processors.clear()
+            processor = OCRProcessor(backend=ocr_processor.backend_name, profile=name)
+            # Same packages: reuse the availability probe
+            processor._ocr_available = ocr_processor.ocr_available
+            _profile_processors[name] = processor
+        return processor
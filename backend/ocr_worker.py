@@ -0,0 +1,260 @@
+"""
+Dedicated OCR worker processes.
+
+With OCR_WORKERS=N (N > 0) the TrOCR model lives in N long-lived processes
+instead of inside the Flask request threads. Each worker loads the model once at
+start-up and runs a warm-up inference before reporting ready, then takes document
+jobs from a shared queue and streams every page back as soon as it is
+recognised, so request progress stays page-accurate. Inside the worker, rasterisation and inference are pipelined (see
+OCRProcessor.extract_text_from_pdf). Each job names its OCR profile: the
+default one (OCR_PROFILE) is preloaded, the others load in the worker on their
+first job.
+
+Workers are started with the 'spawn' context (safe next to Flask threads). A
+worker that dies is replaced, and the job it held fails with an exception so
+the caller can fall back to in-process OCR.
+"""
+from __future__ import annotations
+
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+import fitz  # PyMuPDF
+
+
+def _encode_images(page_images: Optional[Sequence[Optional[fitz.Pixmap]]]) -> Optional[List[Optional[Dict]]]:
+    """Pixmaps cannot be pickled: send their raw gray or RGB samples instead."""
+    if not page_images:
+        return None
+    return [
+        None if pix is None else {"width": pix.width, "height": pix.height, "n": pix.n, "samples": bytes(pix.samples)}
+        for pix in page_images
+    ]
+
+
+def _decode_images(encoded: Optional[List[Optional[Dict]]]) -> Optional[List[Optional[fitz.Pixmap]]]:
+    if not encoded:
+        return None
+    return [
+        None if item is None else fitz.Pixmap(
+            fitz.csGRAY if item["n"] == 1 else fitz.csRGB, item["width"], item["height"], item["samples"], 0
+        )
+        for item in encoded
+    ]
+
+
+def _worker_main(jobs, results) -> None:
+    """Worker process loop: load and warm up the model, then serve jobs until a None sentinel."""
+    from ocr_processor import get_ocr_processor
+
+    processor = get_ocr_processor()
+    if not processor.preload(warm_up=True):
+        results.put(("failed", None, processor.model_error))
+        return
+    results.put(("ready", None, os.getpid()))
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        job_id = job["job_id"]
+        results.put(("started", job_id, os.getpid()))
+        try:
+            processor = get_ocr_processor(job.get("profile"))
+            if job.get("regions") is not None:
+                regions = processor.extract_text_from_regions(job["pdf"], job["regions"])
+                results.put(("done", job_id, {"regions": regions}))
+                continue
+            result = processor.extract_text_from_pdf(
+                job["pdf"],
+                _decode_images(job["page_images"]),
+                on_page=lambda page, total: results.put(("page", job_id, (page, total))),
+            )
+            # Counters only: the pages already went back one by one
+            results.put(("done", job_id, {key: value for key, value in result.items() if key != "pages"}))
+        except Exception as exc:  # pylint: disable=broad-except
+            results.put(("error", job_id, f"{exc.__class__.__name__}: {exc}"))
+
+
+class OCRWorkerPool:
+    """Long-lived OCR processes fed from one job queue."""
+
+    def __init__(self, workers: int = 0):
+        self.workers = workers
+        self._context = None
+        self._jobs = None
+        self._results = None
+        self._processes: List[multiprocessing.Process] = []
+        self._ready: set = set()
+        self._failures: List[str] = []
+        self._job_queues: Dict[int, queue.Queue] = {}
+        self._job_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._dispatcher: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_env(cls) -> "OCRWorkerPool":
+        return cls(workers=max(0, int(os.getenv("OCR_WORKERS", "0"))))
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def start(self) -> None:
+        """Start the worker processes (once). Returns without waiting for the models to load."""
+        with self._lock:
+            if self._jobs is not None:
+                return
+            self._context = multiprocessing.get_context("spawn")
+            self._jobs = self._context.Queue()
+            self._results = self._context.Queue()
+            for _ in range(self.workers):
+                self._spawn()
+            self._dispatcher = threading.Thread(target=self._dispatch, name="ocr-results", daemon=True)
+            self._dispatcher.start()
+        print(f"[OCR-WORKER] {self.workers} worker process(es) started, loading the model")
+
+    def _spawn(self) -> None:
+        process = self._context.Process(
+            target=_worker_main, args=(self._jobs, self._results), name="ocr-worker", daemon=True
+        )
+        process.start()
+        self._processes.append(process)
+
+    def _dispatch(self) -> None:
+        """Route worker messages to the queue of the job they belong to."""
+        while True:
+            kind, job_id, payload = self._results.get()
+            if kind == "ready":
+                with self._lock:
+                    self._ready.add(payload)
+                print(f"[OCR-WORKER] Worker {payload} ready")
+            elif kind == "failed":
+                with self._lock:
+                    self._failures.append(payload)
+                print(f"[OCR-WORKER] Worker could not load the model: {payload}")
+            else:
+                with self._lock:
+                    job_queue = self._job_queues.get(job_id)
+                if job_queue is not None:
+                    job_queue.put((kind, payload))
+
+    def _replace_dead_workers(self) -> List[int]:
+        """Respawn workers that exited unexpectedly; returns the dead pids."""
+        with self._lock:
+            dead = [process for process in self._processes if not process.is_alive()]
+            for process in dead:
+                self._processes.remove(process)
+                self._ready.discard(process.pid)
+                # A worker that failed to load exits on purpose: do not respawn it forever
+                if len(self._failures) < self.workers:
+                    print(f"[OCR-WORKER] Worker {process.pid} exited (code {process.exitcode}), restarting")
+                    self._spawn()
+        return [process.pid for process in dead]
+
+    def extract_text_from_pdf(
+        self,
+        pdf_path: Union[str, bytes],
+        page_images: Optional[Sequence[Optional[fitz.Pixmap]]] = None,
+        on_page: Optional[Callable[[Dict, int], None]] = None,
+        profile: Optional[str] = None,
+    ) -> Dict:
+        """Same contract as OCRProcessor.extract_text_from_pdf, executed in a worker process."""
+        pages: List[Dict] = []
+
+        def collect(page: Dict, total: int) -> None:
+            pages.append(page)
+            if on_page is not None:
+                on_page(page, total)
+
+        result = self._run_job(
+            {"pdf": pdf_path, "page_images": _encode_images(page_images), "profile": profile}, collect
+        )
+        return {"pages": pages, **result}
+
+    def extract_text_from_regions(
+        self,
+        pdf_path: Union[str, bytes],
+        regions: Dict[int, List[Dict]],
+        profile: Optional[str] = None,
+    ) -> Dict[int, List[Dict]]:
+        """Same contract as OCRProcessor.extract_text_from_regions, executed in a worker process."""
+        return self._run_job({"pdf": pdf_path, "page_images": None, "regions": regions, "profile": profile})["regions"]
+
+    def _run_job(self, job: Dict, on_page: Optional[Callable[[Dict, int], None]] = None) -> Dict:
+        """Queue a job and wait for its 'done' payload, streaming its pages to on_page."""
+        self.start()
+        job_id = next(self._job_ids)
+        job_queue: queue.Queue = queue.Queue()
+        with self._lock:
+            self._job_queues[job_id] = job_queue
+
+        worker: Optional[multiprocessing.Process] = None
+        try:
+            self._jobs.put(dict(job, job_id=job_id))
+            while True:
+                try:
+                    kind, payload = job_queue.get(timeout=1.0)
+                except queue.Empty:
+                    self._replace_dead_workers()
+                    # Another waiting request may have reaped it: look at the process itself
+                    if worker is not None and worker.exitcode is not None:
+                        raise RuntimeError(f"OCR worker {worker.pid} died while processing the document")
+                    with self._lock:
+                        all_failed = len(self._failures) >= self.workers
+                    if all_failed:
+                        raise RuntimeError(f"No OCR worker could load the model: {self._failures[-1]}")
+                    continue
+
+                if kind == "started":
+                    with self._lock:
+                        worker = next((process for process in self._processes if process.pid == payload), None)
+                    if worker is None:
+                        # Already reaped by another waiting request: it died with this job
+                        raise RuntimeError(f"OCR worker {payload} died while processing the document")
+                elif kind == "page":
+                    page, total = payload
+                    if on_page is not None:
+                        on_page(page, total)
+                elif kind == "done":
+                    return payload
+                elif kind == "error":
+                    raise RuntimeError(f"OCR worker error: {payload}")
+        finally:
+            with self._lock:
+                self._job_queues.pop(job_id, None)
+
+    @property
+    def is_ready(self) -> bool:
+        """True when at least one worker has its model loaded and warmed up."""
+        with self._lock:
+            return bool(self._ready)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "workers": self.workers,
+                "alive": sum(1 for process in self._processes if process.is_alive()),
+                "ready": len(self._ready),
+                "activeJobs": len(self._job_queues),
+                "failures": len(self._failures),
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            jobs, processes = self._jobs, list(self._processes)
+        if jobs is None:
+            return
+        for _ in processes:
+            jobs.put(None)
+        for process in processes:
+            process.join(timeout=5)
+
+
+# Global instance
+ocr_worker = OCRWorkerPool.from_env()
@@ -0,0 +1,112 @@
+"""
+Índice de palabras por página
+Precalcula una vez por página lo que las búsquedas por palabras necesitan:
+- Palabras de PyMuPDF con sus coordenadas
+- Versiones en minúsculas y normalizadas (ftfy + ligaduras)
+- Mapa hash token -> posiciones para búsquedas exactas de secuencias
+- Scoring fuzzy vectorizado con rapidfuzz.process.cdist
+"""
+from typing import Dict, List, Tuple
+
+import fitz  # PyMuPDF
+
+from normalizer import normalizer
+
+
+class PageWordIndex:
+    """Índice de palabras de una página para localizar secuencias de tokens"""
+
+    def __init__(self, page: fitz.Page):
+        self.page_number = page.number
+        # [(x0, y0, x1, y1, "word", block_no, line_no, word_no)]
+        self.words: List[Tuple] = page.get_text("words")
+        self.lower_words: List[str] = [w[4].strip().lower() for w in self.words]
+
+        # Normalizar cada palabra distinta una sola vez (ftfy es costoso)
+        normalized_cache: Dict[str, str] = {}
+        self.normalized_words: List[str] = []
+        for word in self.words:
+            word_lower = word[4].lower()
+            normalized = normalized_cache.get(word_lower)
+            if normalized is None:
+                normalized = normalizer.normalize_for_search(word_lower)
+                normalized_cache[word_lower] = normalized
+            self.normalized_words.append(normalized)
+
+        self.positions: Dict[str, List[int]] = {}
+        for idx, token in enumerate(self.lower_words):
+            self.positions.setdefault(token, []).append(idx)
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def find_exact_sequences(self, tokens: List[str]) -> List[List[Tuple]]:
+        """
+        Busca secuencias consecutivas de palabras que coincidan exactamente
+        (sin distinguir mayúsculas) con los tokens dados.
+
+        Returns:
+            Lista de secuencias encontradas, cada una como lista de palabras PyMuPDF
+        """
+        targets = [token.strip().lower() for token in tokens]
+        if not targets:
+            return []
+
+        sequences = []
+        span = len(targets)
+        for start in self.positions.get(targets[0], []):
+            end = start + span
+            if end > len(self.lower_words):
+                continue
+            if self.lower_words[start:end] == targets:
+                sequences.append(self.words[start:end])
+
+        return sequences
+
+    def find_fuzzy_sequences(self, tokens: List[str], min_score: float) -> List[List[Tuple]]:
+        """
+        Busca secuencias de palabras que coincidan de forma aproximada con los tokens.
+
+        El primer token se puntúa contra todas las palabras de la página en una sola
+        llamada vectorizada; solo las posiciones que superan el umbral se extienden,
+        permitiendo palabras intermedias dentro de una ventana de len(tokens) + 5.
+
+        Returns:
+            Lista de secuencias encontradas, cada una como lista de palabras PyMuPDF
+        """
+        if not tokens or not self.words:
+            return []
+
+        from rapidfuzz import fuzz, process
+
+        first_scores = process.cdist(
+            [tokens[0]],
+            self.normalized_words,
+            scorer=fuzz.ratio,
+            score_cutoff=min_score,
+        )[0]
+        candidates = first_scores.nonzero()[0]
+
+        sequences = []
+        seen = set()
+        window = len(tokens) + 5
+        for start in candidates.tolist():
+            if first_scores[start] < min_score:
+                continue
+
+            matched = [start]
+            token_idx = 1
+            for j in range(start + 1, min(start + window, len(self.words))):
+                if token_idx == len(tokens):
+                    break
+                if fuzz.ratio(self.normalized_words[j], tokens[token_idx]) >= min_score:
+                    matched.append(j)
+                    token_idx += 1
+
+            if token_idx == len(tokens):
+                key = tuple(matched)
+                if key not in seen:
+                    seen.add(key)
+                    sequences.append([self.words[idx] for idx in matched])
+
+        return sequences
@@ -0,0 +1,196 @@
+"""
+Páginas del parser leídas bajo demanda
+La respuesta JSON del parser se vuelca a un archivo temporal en streaming y solo
+se indexa: por cada elemento de "pages" se guarda su rango de bytes. Cada página
+se decodifica cuando se pide, así en memoria solo vive la página en curso y no
+el documento completo con todas sus líneas OCR.
+"""
+import json
+import mmap
+import re
+import tempfile
+from collections.abc import Sequence
+from typing import Any, BinaryIO, Iterable, List, Optional, Tuple
+
+_STRING = rb'"[^"\\]*(?:\\.[^"\\]*)*"'
+# Tokens del objeto raíz y del array "pages"
+_TOKEN_PATTERN = re.compile(_STRING + rb'|[\[\]{}:,]|[^\s\[\]{}:,"]+|"', re.S)
+# Dentro de un elemento solo importan las llaves/corchetes (y las cadenas, para saltarlas)
+_NESTED_PATTERN = re.compile(_STRING + rb'|[\[\]{}]|"', re.S)
+
+
+def _skip_nested(buffer, position: int) -> int:
+    """Devuelve la posición tras el cierre del objeto/array abierto justo antes de position"""
+    depth = 1
+    while True:
+        match = _NESTED_PATTERN.search(buffer, position)
+        if match is None:
+            raise ValueError('JSON incompleto: objeto sin cerrar')
+        token = match.group()
+        position = match.end()
+        if token == b'"':
+            raise ValueError('JSON inválido: cadena sin cerrar')
+        if token[:1] == b'"':
+            continue
+        if token in (b'{', b'['):
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return position
+
+
+def index_pages(buffer) -> Tuple[List[Tuple[int, int]], List[str]]:
+    """
+    Localiza los elementos de "pages" en un JSON {"pages": [...], ...} sin decodificarlo
+
+    Returns:
+        Tuple(rangos de bytes (inicio, fin) de cada página, claves del objeto raíz)
+    """
+    match = _TOKEN_PATTERN.search(buffer, 0)
+    if match is None or match.group() != b'{':
+        raise ValueError('JSON inválido: se esperaba un objeto')
+    position = match.end()
+
+    offsets: List[Tuple[int, int]] = []
+    keys: List[str] = []
+    expect_key = True
+    current_key: Optional[str] = None
+    in_pages = False
+
+    while True:
+        match = _TOKEN_PATTERN.search(buffer, position)
+        if match is None:
+            raise ValueError('JSON incompleto: objeto raíz sin cerrar')
+        token = match.group()
+        position = match.end()
+        if token == b'"':
+            raise ValueError('JSON inválido: cadena sin cerrar')
+
+        if in_pages:
+            if token == b']':
+                in_pages = False
+            elif token in (b'{', b'['):
+                position = _skip_nested(buffer, position)
+                offsets.append((match.start(), position))
+            elif token != b',':
+                offsets.append((match.start(), position))
+            continue
+
+        if token == b'}':
+            break
+        if token == b',':
+            expect_key = True
+        elif token == b':':
+            expect_key = False
+        elif expect_key:
+            current_key = json.loads(token)
+            keys.append(current_key)
+        elif token == b'[' and current_key == 'pages':
+            in_pages = True
+        elif token in (b'{', b'['):
+            position = _skip_nested(buffer, position)
+
+    return offsets, keys
+
+
+class SpooledPages(Sequence):
+    """Páginas de una respuesta JSON volcada a disco, decodificadas bajo demanda"""
+
+    def __init__(self, spool: BinaryIO):
+        self._spool = spool
+        self._map = mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._offsets, self.keys = index_pages(self._map)
+        except Exception:
+            self.close()
+            raise
+
+    @classmethod
+    def from_response(cls, response, chunk_size: int = 1024 * 1024) -> 'SpooledPages':
+        """Vuelca en streaming el cuerpo de una respuesta (requests, stream=True) y lo indexa"""
+        # TemporaryFile se borra solo al cerrarse, también en Windows
+        spool = tempfile.TemporaryFile(prefix='parser_response_')
+        try:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    spool.write(chunk)
+            spool.flush()
+            if spool.tell() == 0:
+                raise ValueError('Respuesta vacía')
+            return cls(spool)
+        except Exception:
+            spool.close()
+            raise
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self._map) if self._map is not None else 0
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        start, end = self._offsets[index]
+        return json.loads(self._map[start:end])
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ComposedPages(Sequence):
+    """
+    Vista de páginas compuesta de varias fuentes sin copiarlas
+
+    Cada entrada es una página ya materializada (dict o str) o una referencia
+    (secuencia, índice, campos extra) que se resuelve al acceder.
+    """
+
+    def __init__(self, entries: Iterable[Any], sources: Iterable[Sequence] = ()):
+        self._entries = list(entries)
+        self._sources = list(sources)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        entry = self._entries[index]
+        if not isinstance(entry, tuple):
+            return entry
+
+        source, position, extra = entry
+        page = source[position]
+        if isinstance(page, dict):
+            page = dict(page)
+        elif isinstance(page, str):
+            page = {'text': page}
+        else:
+            page = {'text': ''}
+        page.update(extra)
+        return page
+
+    def close(self) -> None:
+        for source in self._sources:
+            close_pages(source)
+
+
+def close_pages(pages: Any) -> None:
+    """Libera los recursos (archivo temporal) de una secuencia de páginas si los tiene"""
+    close = getattr(pages, 'close', None)
+    if callable(close):
+        close()
@@ -0,0 +1,86 @@
+"""
+Marcado de páginas en paralelo con procesos
+En documentos grandes process_pdf reparte rangos contiguos de páginas entre
+procesos trabajadores. Cada proceso abre su propia copia del PDF con PyMuPDF,
+localiza y marca las detecciones de su rango y guarda un PDF parcial; el proceso
+principal une los parciales en orden.
+
+Los procesos se crean una sola vez con el contexto 'spawn' (seguro con los hilos
+de Flask y del sondeo del parser) y se precalientan importando pdf_processor, que
+deja compilados los patrones del detector.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+_pool: Optional[ProcessPoolExecutor] = None
+_manager = None
+_pool_size = 0
+_pool_lock = threading.Lock()
+
+
+def _init_worker() -> None:
+    # Importar el procesador compila los patrones del detector una vez por proceso
+    import pdf_processor  # noqa: F401
+
+
+def _warm_up(barrier) -> int:
+    # La barrera obliga a que cada tarea de calentamiento ocupe un proceso distinto
+    barrier.wait(timeout=120)
+    return os.getpid()
+
+
+def get_pool(workers: int) -> Tuple[ProcessPoolExecutor, Any]:
+    """
+    Devuelve el pool de procesos compartido (y su Manager para colas de progreso),
+    creándolo y arrancando todos sus procesos la primera vez
+    """
+    global _pool, _manager, _pool_size
+    with _pool_lock:
+        if _pool is None:
+            context = multiprocessing.get_context('spawn')
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker)
+            _manager = context.Manager()
+            _pool_size = workers
+            # Arrancar los procesos ya, no en la primera petición
+            barrier = _manager.Barrier(workers)
+            pids = {future.result() for future in [_pool.submit(_warm_up, barrier) for _ in range(workers)]}
+            print(f"[WORKERS] Pool de {workers} proceso(s) listo ({len(pids)} arrancados)")
+        return _pool, _manager
+
+
+def reset_pool(broken: Optional[ProcessPoolExecutor] = None) -> None:
+    """
+    Descarta el pool roto (BrokenProcessPool tras la caída de un proceso); se
+    recrea al siguiente uso
+
+    El pool es compartido por todas las peticiones: solo hay que descartarlo cuando
+    el propio pool está roto, no por el fallo de una tarea. Con broken solo se
+    descarta si sigue siendo el pool actual (otra petición pudo recrearlo ya).
+    """
+    global _pool, _manager, _pool_size
+    with _pool_lock:
+        if broken is not None and broken is not _pool:
+            return
+        pool, manager = _pool, _manager
+        _pool = _manager = None
+        _pool_size = 0
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+    if manager is not None:
+        try:
+            manager.shutdown()
+        except Exception:
+            pass
+
+
+def pool_status() -> Dict[str, Any]:
+    return {'running': _pool is not None, 'workers': _pool_size}
+
+
+def mark_page_range(task: Dict[str, Any], progress_queue) -> Dict[str, Any]:
+    """Punto de entrada en el proceso trabajador"""
+    from pdf_processor import pdf_processor
+    return pdf_processor._mark_page_range(task, progress_queue)
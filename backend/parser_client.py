@@ -0,0 +1,255 @@
+"""
+Cliente HTTP para el servicio externo de parseo
+- Sesión keep-alive con pool de conexiones reutilizable entre peticiones
+- Sondeo de salud en segundo plano de cada URL candidata
+- Circuit breaker: las URLs caídas se saltan con backoff exponencial
+- Subida multipart en streaming desde archivo o buffer (sin copiarlo en memoria)
+"""
+import io
+import os
+import threading
+import time
+import uuid
+from typing import TYPE_CHECKING, BinaryIO, Dict, List, Optional, Union
+
+if TYPE_CHECKING:  # requests se importa al crear la sesión, no al arrancar
+    import requests
+
+
+class MultipartFileStream:
+    """
+    Cuerpo multipart/form-data con un único archivo, leído por bloques
+
+    requests envía en streaming los objetos con read() y usa __len__ para fijar
+    Content-Length, así el archivo no se copia entero en memoria.
+    """
+
+    def __init__(self, fileobj: BinaryIO, size: int, filename: str, field_name: str = 'file'):
+        self.boundary = uuid.uuid4().hex
+        head = (
+            f'--{self.boundary}\r\n'
+            f'Content-Disposition: form-data; name="{field_name}"; filename="{filename}"\r\n'
+            'Content-Type: application/pdf\r\n\r\n'
+        ).encode('utf-8')
+        tail = f'\r\n--{self.boundary}--\r\n'.encode('utf-8')
+        self._length = len(head) + size + len(tail)
+        self._parts: List[BinaryIO] = [io.BytesIO(head), fileobj, io.BytesIO(tail)]
+        self._part_index = 0
+
+    @property
+    def content_type(self) -> str:
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(64 * 1024)
+            if not chunk:
+                return
+            yield chunk
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self._length
+        chunks = []
+        remaining = size
+        while remaining > 0 and self._part_index < len(self._parts):
+            chunk = self._parts[self._part_index].read(remaining)
+            if not chunk:
+                self._part_index += 1
+                continue
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        return b''.join(chunks)
+
+
+class ParserClient:
+    """Cliente con pool de conexiones, salud por candidato y circuit breaker"""
+
+    def __init__(
+        self,
+        candidates: List[str],
+        connect_timeout: float = 15.0,
+        pool_size: int = 8,
+        health_path: str = '/health',
+        health_interval: float = 30.0,
+        backoff_base: float = 5.0,
+        backoff_max: float = 300.0,
+    ):
+        self.candidates = list(candidates)
+        self.connect_timeout = connect_timeout
+        self.pool_size = pool_size
+        self.health_path = health_path
+        self.health_interval = health_interval
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._lock = threading.Lock()
+        self._session: Optional['requests.Session'] = None
+        self._probe_thread: Optional[threading.Thread] = None
+        self._stop_probe = threading.Event()
+        self._state: Dict[str, Dict] = {
+            url: {'failures': 0, 'open_until': 0.0, 'healthy': None, 'last_error': None, 'last_checked': None}
+            for url in self.candidates
+        }
+
+    @property
+    def session(self) -> 'requests.Session':
+        """Sesión compartida (se crea al primer uso)"""
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=len(self.candidates) or 1, pool_maxsize=self.pool_size)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session = session
+        return self._session
+
+    def ordered_candidates(self) -> List[str]:
+        """
+        Candidatos a intentar, en orden de configuración
+
+        Se saltan los que tienen el circuito abierto. Si todos están abiertos se
+        intenta solo el que antes sale del backoff, para no rechazar la petición.
+        """
+        self.start_health_probe()
+        now = time.monotonic()
+        with self._lock:
+            available = [url for url in self.candidates if self._state[url]['open_until'] <= now]
+            if available:
+                # Los sanos conocidos primero, manteniendo el orden configurado
+                return sorted(available, key=lambda url: self._state[url]['healthy'] is False)
+            soonest = min(self.candidates, key=lambda url: self._state[url]['open_until'])
+        return [soonest]
+
+    def record_success(self, url: str) -> None:
+        with self._lock:
+            state = self._state.setdefault(url, {})
+            state.update({'failures': 0, 'open_until': 0.0, 'healthy': True, 'last_error': None,
+                          'last_checked': time.time()})
+
+    def record_failure(self, url: str, error: str) -> None:
+        """Abre el circuito del candidato con backoff exponencial"""
+        with self._lock:
+            state = self._state.setdefault(url, {'failures': 0})
+            failures = state.get('failures', 0) + 1
+            backoff = min(self.backoff_base * (2 ** (failures - 1)), self.backoff_max)
+            state.update({'failures': failures, 'open_until': time.monotonic() + backoff, 'healthy': False,
+                          'last_error': error, 'last_checked': time.time()})
+        print(f"[PARSER] Circuito abierto para {url} durante {backoff:.0f}s ({error})")
+
+    def status(self) -> List[Dict]:
+        """Estado de salud de cada candidato (para diagnóstico)"""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    'url': url,
+                    'healthy': state['healthy'],
+                    'failures': state['failures'],
+                    'circuit_open': state['open_until'] > now,
+                    'retry_in': max(0.0, round(state['open_until'] - now, 1)),
+                    'last_error': state['last_error'],
+                }
+                for url, state in self._state.items()
+            ]
+
+    def post_file(
+        self,
+        base_url: str,
+        source: Union[str, bytes],
+        read_timeout: Optional[float] = None,
+        filename: str = 'document.pdf',
+        stream: bool = False,
+    ) -> 'requests.Response':
+        """
+        Sube un PDF a {base_url}/parse en streaming
+
+        Args:
+            base_url: URL base del candidato
+            source: Ruta del archivo o contenido en memoria
+            read_timeout: Timeout de lectura (None = esperar lo necesario)
+            filename: Nombre enviado en el multipart
+            stream: No descargar el cuerpo de la respuesta hasta leerlo (hay que cerrarla)
+
+        Returns:
+            Respuesta HTTP (se lanza requests.RequestException si falla la conexión)
+        """
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            fileobj: BinaryIO = io.BytesIO(source)
+            size = len(source)
+            owns_file = False
+        else:
+            fileobj = open(source, 'rb')
+            size = os.fstat(fileobj.fileno()).st_size
+            filename = os.path.basename(source) or filename
+            owns_file = True
+
+        try:
+            body = MultipartFileStream(fileobj, size, filename)
+            return self.session.post(
+                f"{base_url}/parse",
+                data=body,
+                headers={'Content-Type': body.content_type},
+                timeout=(self.connect_timeout, read_timeout),
+                stream=stream,
+            )
+        finally:
+            if owns_file:
+                fileobj.close()
+
+    def start_health_probe(self) -> None:
+        """Arranca (una sola vez) el sondeo de salud en segundo plano"""
+        if self.health_interval <= 0 or self._probe_thread is not None:
+            return
+        with self._lock:
+            if self._probe_thread is not None:
+                return
+            self._probe_thread = threading.Thread(target=self._probe_loop, name='parser-health', daemon=True)
+            self._probe_thread.start()
+
+    def stop_health_probe(self) -> None:
+        self._stop_probe.set()
+
+    def _probe_loop(self) -> None:
+        while not self._stop_probe.is_set():
+            for url in list(self.candidates):
+                self.probe(url)
+            self._stop_probe.wait(self.health_interval)
+
+    def probe(self, url: str) -> bool:
+        """
+        Comprueba si un candidato responde. Cualquier respuesta HTTP < 500 cuenta
+        como disponible (el parser puede no exponer la ruta de salud).
+        """
+        import requests
+
+        try:
+            response = self.session.get(
+                f"{url}{self.health_path}",
+                timeout=(self.connect_timeout, self.connect_timeout),
+            )
+            reachable = response.status_code < 500
+            error = None if reachable else f"HTTP {response.status_code}"
+        except requests.exceptions.RequestException as e:
+            reachable = False
+            error = e.__class__.__name__
+
+        with self._lock:
+            was_healthy = self._state.get(url, {}).get('healthy')
+
+        if reachable:
+            if was_healthy is not True:
+                print(f"[PARSER] Candidato disponible: {url}")
+            self.record_success(url)
+        elif was_healthy is not False or self._state[url]['open_until'] <= time.monotonic():
+            self.record_failure(url, error or 'unreachable')
+
+        return reachable
+
@@ -6,34 +6,97 @@ Implementa el pipeline del blueprint:
 - Subraya o redacta en coordenadas nativas
 """
 import fitz  # PyMuPDF
-import pdfplumber
-import requests
 import os
+import queue
+import shutil
+import tempfile
+import time
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from urllib.parse import urlparse
-from typing import List, Dict, Optional, Tuple, Callable, Any
+from typing import List, Dict, Optional, Tuple, Callable, Any, BinaryIO, Union
 from pathlib import Path
-from rapidfuzz import fuzz
 from normalizer import normalizer
 from detector import detector
 from validators import validator
-from ocr_processor import ocr_processor
+from ocr_processor import get_ocr_processor, ocr_processor, request_ocr_profile
+from ocr_worker import ocr_worker
+from page_index import PageWordIndex
+from parser_client import ParserClient
+from extraction_cache import extraction_cache
+from value_registry import DocumentValueRegistry, compact_for_lookup
+from page_stream import ComposedPages, SpooledPages, close_pages
+import page_workers
+
+# Un PDF puede llegar como ruta en disco o como contenido en memoria
+PdfSource = Union[str, bytes]
 
 
 class PDFProcessor:
     """Procesa PDFs para detectar y marcar datos sensibles"""
 
+    # Origen del texto de cada página según el método de extracción
+    EXTRACTION_SOURCES = {'PARSER_EXTERNO': 'parser', 'OCR': 'ocr'}
+    # Contadores del OCR que pasan del resultado de la extracción a las estadísticas
+    OCR_COUNTERS = ('ocr_cache_hits', 'ocr_rechecked_lines', 'ocr_recheck_improved', 'ocr_region_lines')
+    # Una imagen con más caracteres de capa de texto encima ya se lee localmente (fondo, escaneo con OCR)
+    REGION_TEXT_MAX_CHARS = 10
+
+    # Opciones de doc.save por perfil de guardado ('incremental' se guarda aparte)
+    SAVE_PROFILES = {
+        'compact': {'garbage': 4, 'deflate': True},
+        # deflate solo comprime los streams que aún no lo están (los reescritos al marcar)
+        'fast': {'garbage': 0, 'deflate': True},
+    }
+
     def __init__(self):
         self.min_fuzzy_score = 80  # Score mÃ­nimo para fuzzy matching
         base_parser_url = os.getenv('PARSER_SERVICE_URL', 'http://127.0.0.1:1000').rstrip('/')
         self.parser_url = base_parser_url or 'http://127.0.0.1:1000'
         self.parser_url_candidates = self._build_parser_url_candidates(self.parser_url)
         self._current_page_ocr_lines: List[Dict] = []
-        # Por defecto no aplicamos timeouts para esperar la respuesta todo el tiempo necesario.
+        self._current_page_word_index: Optional[PageWordIndex] = None
+        # Propagar a todo el documento los valores sensibles confirmados en alguna página
+        self.propagate_values = os.getenv('PROPAGATE_DOCUMENT_VALUES', '1').strip().lower() in {'1', 'true', 'yes', 'on'}
+        self.propagation_min_length = int(os.getenv('PROPAGATION_MIN_LENGTH', '4'))
+        self.propagation_numeric_min_length = int(os.getenv('PROPAGATION_NUMERIC_MIN_LENGTH', '7'))
+        # Enrutado por página: capa de texto local para páginas digitales, parser/OCR para el resto
+        self.page_routing = os.getenv('PAGE_ROUTING', '1').strip().lower() in {'1', 'true', 'yes', 'on'}
+        self.text_layer_min_chars = int(os.getenv('TEXT_LAYER_MIN_CHARS', '50'))
+        self.scan_image_coverage = float(os.getenv('SCAN_IMAGE_COVERAGE', '0.85'))
+        # OCR solo de las imágenes sin capa de texto de las páginas digitales (DNI pegado, firma escaneada)
+        self.ocr_image_regions = os.getenv('OCR_IMAGE_REGIONS', '1').strip().lower() in {'1', 'true', 'yes', 'on'}
+        self.ocr_region_min_side = float(os.getenv('OCR_REGION_MIN_SIDE', '24'))
+        self.ocr_region_max_zoom = max(2.0, float(os.getenv('OCR_REGION_MAX_ZOOM', '4')))
+        # Por defecto no hay timeout de lectura para esperar la respuesta todo el tiempo necesario;
+        # la conexión siempre usa PARSER_CONNECT_TIMEOUT para no quedarse colgada en candidatos caídos.
         self.use_parser_timeouts = os.getenv('PARSER_ENABLE_TIMEOUTS', '').strip().lower() in {'1', 'true', 'yes', 'on'}
         self.parser_connect_timeout = float(os.getenv('PARSER_CONNECT_TIMEOUT', '15'))
         self.parser_min_timeout = float(os.getenv('PARSER_MIN_TIMEOUT', '120'))
         self.parser_timeout_per_mb = float(os.getenv('PARSER_TIMEOUT_PER_MB', '30'))
         self.parser_timeout_max = float(os.getenv('PARSER_TIMEOUT_MAX', '600'))
+        # Troceado opcional por rangos de páginas para enviar documentos grandes en paralelo (0 = desactivado)
+        self.parser_shard_pages = int(os.getenv('PARSER_SHARD_PAGES', '0'))
+        self.parser_shard_workers = max(1, int(os.getenv('PARSER_SHARD_WORKERS', '4')))
+        self.parser_shard_retries = max(0, int(os.getenv('PARSER_SHARD_RETRIES', '2')))
+        # Perfil de guardado del PDF de salida: 'compact' (por defecto), 'fast' o 'incremental'
+        self.save_profile = self._normalize_save_profile(os.getenv('OUTPUT_SAVE_PROFILE', 'compact'))
+        # Marcado en paralelo por rangos de páginas con procesos (0/1 = en serie)
+        self.page_workers = int(os.getenv('PAGE_WORKERS', '0'))
+        self.page_workers_min_pages = max(2, int(os.getenv('PAGE_WORKERS_MIN_PAGES', '40')))
+        # Segundos por página que se espera a los procesos antes de pasar a marcar en serie (0 = sin límite)
+        self.page_workers_timeout = float(os.getenv('PAGE_WORKERS_TIMEOUT', '10'))
+        # Cliente HTTP compartido: keep-alive, sondeo de salud y circuit breaker por candidato
+        self.parser_client = ParserClient(
+            self.parser_url_candidates,
+            connect_timeout=self.parser_connect_timeout,
+            pool_size=int(os.getenv('PARSER_POOL_SIZE', '8')),
+            health_path=os.getenv('PARSER_HEALTH_PATH', '/health'),
+            health_interval=float(os.getenv('PARSER_HEALTH_INTERVAL', '30')),
+            backoff_base=float(os.getenv('PARSER_BACKOFF_BASE', '5')),
+            backoff_max=float(os.getenv('PARSER_BACKOFF_MAX', '300')),
+        )
 
     def _build_parser_url_candidates(self, base_url: str) -> List[str]:
         """
@@ -71,19 +134,33 @@ class PDFProcessor:
 
         return ordered_candidates or ['http://127.0.0.1:1000']
 
-    def _get_file_size_mb(self, file_path: str) -> float:
+    def _get_file_size_mb(self, file_path: PdfSource) -> float:
         """Devuelve el tamaño del archivo en MB. Retorna 0.0 si no se puede leer."""
+        if isinstance(file_path, (bytes, bytearray, memoryview)):
+            return len(file_path) / (1024 * 1024)
         try:
             return os.path.getsize(file_path) / (1024 * 1024)
         except OSError:
             return 0.0
 
-    def _validate_parsed_data(self, parsed_data: Dict) -> bool:
+    def _open_pdf(self, source: PdfSource) -> fitz.Document:
+        """Abre un PDF desde una ruta o desde su contenido en memoria"""
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return fitz.open(stream=source, filetype='pdf')
+        return fitz.open(source)
+
+    def _discard_subset(self, subset: Optional[PdfSource]) -> None:
+        """Borra el archivo temporal de un sub-PDF (los sub-PDF en memoria no dejan rastro)"""
+        if isinstance(subset, str) and os.path.exists(subset):
+            os.remove(subset)
+
+    def _validate_parsed_data(self, parsed_data: Dict, min_chars: int = 10) -> bool:
         """
         Valida que los datos parseados son Ãºtiles
 
         Args:
             parsed_data: Datos del parser o OCR
+            min_chars: Caracteres mínimos en total para considerarlos válidos
 
         Returns:
             True si los datos son vÃ¡lidos y contienen texto, False si no
@@ -95,23 +172,29 @@ class PDFProcessor:
             return False
 
         pages = parsed_data['pages']
-        if not isinstance(pages, list) or len(pages) == 0:
+        if not isinstance(pages, Sequence) or isinstance(pages, str) or len(pages) == 0:
             return False
 
-        # Verificar que al menos una pÃ¡gina tiene texto
+        # Verificar que al menos una página tiene texto (las páginas en disco se leen de una en una)
         total_chars = 0
-        for page in pages:
-            if isinstance(page, dict):
-                text = page.get('text') or page.get('content') or page.get('extracted_text') or ''
-            elif isinstance(page, str):
-                text = page
-            else:
-                continue
+        try:
+            for page in pages:
+                if isinstance(page, dict):
+                    text = page.get('text') or page.get('content') or page.get('extracted_text') or ''
+                elif isinstance(page, str):
+                    text = page
+                else:
+                    continue
 
-            total_chars += len(text.strip())
+                total_chars += len(text.strip())
+                if total_chars >= min_chars:
+                    return True
+        except ValueError as e:
+            print(f"[WARN] Página con JSON inválido en los datos parseados: {e}")
+            return False
 
-        # Considerar vÃ¡lido si hay al menos 10 caracteres en total
-        return total_chars >= 10
+        # Considerar válido si hay al menos min_chars caracteres en total (10 por defecto)
+        return total_chars >= min_chars
 
     def _calculate_timeout(self, file_size_mb: float) -> Tuple[float, float]:
         """
@@ -129,16 +212,19 @@ class PDFProcessor:
         read_timeout = min(read_timeout, self.parser_timeout_max)
         return self.parser_connect_timeout, max(read_timeout, self.parser_min_timeout)
 
-    def _parse_with_external_service(self, file_path: str) -> Optional[Dict]:
+    def _parse_with_external_service(self, file_path: PdfSource) -> Optional[Dict]:
         """
         Envía el archivo al servicio externo de parseo y retorna el JSON estructurado.
         IMPORTANTE: Este método espera la respuesta del parser, puede tardar según el tamaño del archivo.
         """
+        import requests
+
         file_size_mb = self._get_file_size_mb(file_path)
         connect_timeout = read_timeout = None
         if self.use_parser_timeouts:
             connect_timeout, read_timeout = self._calculate_timeout(file_size_mb)
-        parser_urls = self.parser_url_candidates or [self.parser_url]
+        # Solo candidatos con el circuito cerrado (los caídos se saltan con backoff)
+        parser_urls = self.parser_client.ordered_candidates()
         total_attempts = len(parser_urls)
         last_error: Optional[str] = None
 
@@ -147,48 +233,49 @@ class PDFProcessor:
         if self.use_parser_timeouts and connect_timeout is not None and read_timeout is not None:
             print(f"[PARSER] Timeout conexión: {connect_timeout}s | lectura: {read_timeout}s (máximo)")
         else:
-            print("[PARSER] Sin timeout - esperará todo el tiempo necesario")
+            print(f"[PARSER] Timeout conexión: {self.parser_connect_timeout}s | lectura: sin límite")
 
         for attempt, candidate_url in enumerate(parser_urls, start=1):
             print(f"[PARSER] Intento {attempt}/{total_attempts}: {candidate_url}/parse")
             try:
-                with open(file_path, 'rb') as f:
-                    files = {'file': f}
-                    print("[PARSER] Esperando respuesta del servicio (puede tardar varios minutos para PDFs escaneados)...")
-                    post_kwargs = {}
-                    if self.use_parser_timeouts and connect_timeout is not None and read_timeout is not None:
-                        post_kwargs['timeout'] = (connect_timeout, read_timeout)
-
-                    response = requests.post(
-                        f"{candidate_url}/parse",
-                        files=files,
-                        **post_kwargs
-                    )
+                print("[PARSER] Esperando respuesta del servicio (puede tardar varios minutos para PDFs escaneados)...")
+                response = self.parser_client.post_file(
+                    candidate_url, file_path, read_timeout=read_timeout, stream=True
+                )
 
                 if response.status_code != 200:
                     print(f"[PARSER] ? Error HTTP {response.status_code}")
                     print(f"[PARSER] Respuesta: {response.text[:500]}")
+                    response.close()
                     last_error = f"HTTP {response.status_code}"
+                    if response.status_code >= 500:
+                        self.parser_client.record_failure(candidate_url, last_error)
                     continue
 
+                self.parser_client.record_success(candidate_url)
+
                 print("[PARSER] ? Respuesta recibida con éxito (status 200)")
 
+                # El JSON se vuelca a disco y las páginas se decodifican de una en una
                 try:
-                    parsed_data = response.json()
+                    pages = SpooledPages.from_response(response)
                 except ValueError as e:
                     print(f"[PARSER] ? Error al decodificar JSON: {e}")
-                    print(f"[PARSER] Respuesta raw: {response.text[:500]}")
                     last_error = str(e)
                     continue
-
-                if not isinstance(parsed_data, dict):
-                    print("[PARSER] ? Respuesta no es un diccionario válido")
-                    last_error = "Respuesta JSON inválida"
+                except requests.exceptions.RequestException as e:
+                    # Corte durante la descarga del cuerpo: el candidato respondió, no se abre el circuito
+                    print(f"[PARSER] ? Respuesta interrumpida desde {candidate_url}: {e}")
+                    last_error = str(e)
                     continue
+                finally:
+                    response.close()
 
-                print(f"[PARSER] [DEBUG] Claves principales del JSON: {list(parsed_data.keys())}")
+                print(f"[PARSER] [DEBUG] Claves principales del JSON: {pages.keys}")
+                print(f"[PARSER] [DEBUG] Respuesta volcada a disco: {pages.size_bytes / (1024 * 1024):.2f} MB")
 
-                if 'pages' in parsed_data:
+                if 'pages' in pages.keys:
+                    parsed_data = {'pages': pages}
                     num_pages = len(parsed_data['pages'])
                     print(f"[PARSER] ? Documento parseado: {num_pages} página(s)")
 
@@ -207,7 +294,7 @@ class PDFProcessor:
                             print(f"[PARSER] [DEBUG] Primera página es string: {first_page[:100]}...")
                 else:
                     print("[PARSER] ? Respuesta no contiene 'pages'")
-                    print(f"[PARSER] [DEBUG] Estructura completa: {str(parsed_data)[:500]}")
+                    pages.close()
                     last_error = "Respuesta sin 'pages'"
                     continue
 
@@ -215,15 +302,17 @@ class PDFProcessor:
                 self.parser_url = candidate_url
                 return parsed_data
 
-            except requests.exceptions.Timeout:
-                print(f"[PARSER] ? Timeout al conectar con {candidate_url}")
-                last_error = "timeout"
-                continue
-
             except requests.exceptions.ConnectionError as e:
+                # Incluye ConnectTimeout: el candidato no está disponible
                 print(f"[PARSER] ? No se pudo conectar al servicio en {candidate_url}")
                 print(f"[PARSER] Error: {e}")
                 last_error = str(e)
+                self.parser_client.record_failure(candidate_url, e.__class__.__name__)
+                continue
+
+            except requests.exceptions.Timeout:
+                print(f"[PARSER] ? Timeout esperando la respuesta de {candidate_url}")
+                last_error = "timeout"
                 continue
 
             except requests.exceptions.RequestException as e:
@@ -242,70 +331,125 @@ class PDFProcessor:
         print("[PARSER] ? Usando fallback a extracción local con PyMuPDF/OCR")
         return None
 
-    def process_pdf(
+    def _count_pages(self, pdf_path: PdfSource) -> int:
+        """Número de páginas del PDF (0 si no se puede abrir)"""
+        try:
+            with self._open_pdf(pdf_path) as doc:
+                return len(doc)
+        except Exception as e:
+            print(f"[WARN] No se pudo contar las páginas del documento: {e}")
+            return 0
+
+    def _parse_in_shards(
         self,
-        input_path: str,
-        output_path: str,
-        enabled_rules: Dict[str, bool],
-        sensitivity_level: str = 'normal',
-        action: str = 'highlight',  # 'highlight' o 'redact'
-        extraction_mode: str = 'auto',
-        progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None
-    ) -> Dict:
+        file_path: PdfSource,
+        page_count: int,
+        report_progress: Callable[[Dict[str, Any]], None],
+    ) -> Optional[Dict]:
         """
-        Procesa un PDF completo
+        Parsea un PDF grande en trozos de PARSER_SHARD_PAGES páginas enviados en paralelo
+
+        Cada trozo es un sub-PDF independiente; sus 'pages' se unen en orden y los
+        trozos que fallan se reintentan por separado. Si alguno no se recupera se
+        devuelve None, igual que cuando falla el parseo del documento completo.
+        """
+        ranges = [
+            (start, min(start + self.parser_shard_pages, page_count))
+            for start in range(0, page_count, self.parser_shard_pages)
+        ]
+        workers = min(self.parser_shard_workers, len(ranges))
+        print(f"[PARSER] Documento de {page_count} página(s) dividido en {len(ranges)} trozo(s), {workers} en paralelo")
+
+        # Los sub-PDFs se generan antes de lanzar los hilos: PyMuPDF no es seguro entre hilos
+        shard_sources = [self._write_page_subset(file_path, list(range(start, end))) for start, end in ranges]
+
+        def parse_shard(shard_index: int) -> Optional[Sequence]:
+            start, end = ranges[shard_index]
+            for attempt in range(1, self.parser_shard_retries + 2):
+                shard_data = self._parse_with_external_service(shard_sources[shard_index])
+                if shard_data is not None and isinstance(shard_data.get('pages'), Sequence):
+                    return shard_data['pages']
+                print(f"[PARSER] Trozo páginas {start + 1}-{end} falló (intento {attempt}/{self.parser_shard_retries + 1})")
+            return None
+
+        shard_pages: List[Optional[Sequence]] = [None] * len(ranges)
+        pages_done = 0
+        try:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='parser-shard') as executor:
+                futures = {executor.submit(parse_shard, index): index for index in range(len(ranges))}
+                for future in as_completed(futures):
+                    index = futures[future]
+                    shard_pages[index] = future.result()
+                    if shard_pages[index] is None:
+                        continue
+                    start, end = ranges[index]
+                    pages_done += end - start
+                    report_progress({
+                        'stage': 'parsing-external',
+                        'percent': 12 + int(6 * pages_done / page_count),
+                        'currentPage': pages_done,
+                        'totalPages': page_count,
+                    })
+        finally:
+            for shard_source in shard_sources:
+                self._discard_subset(shard_source)
+
+        failed = [f"{ranges[i][0] + 1}-{ranges[i][1]}" for i, pages in enumerate(shard_pages) if pages is None]
+        if failed:
+            print(f"[PARSER] ? Trozos sin respuesta del parser: {', '.join(failed)}")
+            for pages in shard_pages:
+                close_pages(pages)
+            return None
+
+        # Las páginas siguen en los volcados de cada trozo; solo se guardan referencias
+        entries: List = []
+        for (start, end), pages in zip(ranges, shard_pages):
+            expected = end - start
+            if len(pages) != expected:
+                print(f"[PARSER] [WARN] Trozo {start + 1}-{end}: {len(pages)} página(s) recibidas, {expected} esperadas")
+            # Mantener la alineación página a página con el PDF original
+            entries.extend((pages, position, {}) for position in range(min(expected, len(pages))))
+            entries.extend({'text': ''} for _ in range(expected - len(pages)))
+
+        print(f"[PARSER] ? Parseo por trozos completado: {len(entries)} página(s)")
+        return {'pages': ComposedPages(entries, shard_pages), 'shards': len(ranges)}
+
+    def _extract_document(
+        self,
+        file_path: PdfSource,
+        normalized_mode: str,
+        report_progress: Callable[[Dict[str, Any]], None],
+        min_chars: int = 10,
+        page_images: Optional[List[Optional[fitz.Pixmap]]] = None,
+        ocr_profile: Optional[str] = None,
+    ) -> Tuple[Dict, str]:
+        """
+        Extrae el texto de un PDF con el parser externo y/o OCR según el modo
 
         Args:
-            input_path: Ruta al PDF de entrada
-            output_path: Ruta para guardar PDF procesado
-            enabled_rules: Reglas habilitadas {rule_id: bool}
-            sensitivity_level: 'strict', 'normal', 'relaxed'
-            action: 'highlight' (subrayar) o 'redact' (eliminar texto)
-            extraction_mode: 'auto', 'parser' o 'ocr' segun el metodo deseado
+            file_path: Ruta al PDF a extraer o su contenido en memoria
+            normalized_mode: 'auto', 'parser' u 'ocr'
+            report_progress: Callback de progreso
+            min_chars: Caracteres mínimos para considerar válida la extracción
+            page_images: Píxeles ya decodificados por página de file_path (o None), para el OCR
+            ocr_profile: Perfil de velocidad/calidad del OCR ('fast', 'balanced' o 'accurate')
 
         Returns:
-            Dict con estadÃ­sticas:
-            {
-                'total_matches': int,
-                'by_type': {type: count},
-                'by_page': {page_num: count},
-                'pages_processed': int
-            }
+            Tuple(parsed_data, método de extracción usado)
         """
-        stats = {
-            'total_matches': 0,
-            'by_type': {},
-            'by_page': {},
-            'pages_processed': 0
-        }
-
-        def report_progress(update: Dict[str, Any]) -> None:
-            if progress_callback:
-                try:
-                    progress_callback(update)
-                except Exception as progress_error:  # pragma: no cover
-                    print(f'[WARN] Error reportando progreso: {progress_error}')
-
-        print(f"\n{'='*60}")
-        print(f"[INICIO] Procesando documento: {input_path}")
-        print(f"{'='*60}\n")
-
-        report_progress({'stage': 'preparing', 'percent': 12, 'currentPage': 0, 'totalPages': 0, 'extractionMethod': extraction_mode})
-
-        normalized_mode = (extraction_mode or "auto").lower()
-        if normalized_mode not in {"auto", "parser", "ocr"}:
-            normalized_mode = "auto"
-        print(f"[MODO] Estrategia de extraccion seleccionada: {normalized_mode}")
-
         parsed_data = None
         extraction_method = None
 
         if normalized_mode != "ocr":
             print("[PASO 1/4] Parseo del documento con servicio externo")
-            parsed_data = self._parse_with_external_service(input_path)
+            page_count = self._count_pages(file_path) if self.parser_shard_pages > 0 else 0
+            if page_count > self.parser_shard_pages > 0:
+                parsed_data = self._parse_in_shards(file_path, page_count, report_progress)
+            else:
+                parsed_data = self._parse_with_external_service(file_path)
 
             if parsed_data is not None:
-                if self._validate_parsed_data(parsed_data):
+                if self._validate_parsed_data(parsed_data, min_chars):
                     extraction_method = "PARSER_EXTERNO"
                     print("\n[V] Usando datos del PARSER EXTERNO\n")
                     report_progress({
@@ -317,6 +461,7 @@ class PDFProcessor:
                     })
                 else:
                     print("\n[?] Parser externo devolvio datos vacios o invalidos\n")
+                    close_pages(parsed_data['pages'])
                     parsed_data = None
 
             if parsed_data is None and normalized_mode == "parser":
@@ -331,8 +476,8 @@ class PDFProcessor:
             if ocr_processor.can_use_ocr():
                 print("\n[>] Intentando extraccion con OCR (Microsoft TrOCR)\n")
                 try:
-                    parsed_data = ocr_processor.extract_text_from_pdf(input_path)
-                    if self._validate_parsed_data(parsed_data):
+                    parsed_data = self._run_ocr(file_path, page_images, report_progress, ocr_profile)
+                    if self._validate_parsed_data(parsed_data, min_chars):
                         extraction_method = "OCR"
                         print("\n[V] Usando datos extraidos con OCR\n")
                         report_progress({
@@ -368,9 +513,433 @@ class PDFProcessor:
                 f"Modo solicitado: {normalized_mode}. "
                 "Verifica el parser externo y el OCR antes de reintentar."
             )
+
+        return parsed_data, extraction_method
+
+    def _run_ocr(
+        self,
+        file_path: PdfSource,
+        page_images: Optional[List[Optional[fitz.Pixmap]]],
+        report_progress: Callable[[Dict[str, Any]], None],
+        ocr_profile: Optional[str] = None,
+    ) -> Dict:
+        """
+        Ejecuta el OCR en los procesos dedicados (OCR_WORKERS > 0) o en este proceso
+
+        Cada página se notifica al terminarse. Si el proceso de OCR falla se
+        repite en este proceso, igual que el marcado en paralelo vuelve al serie.
+        """
+        def on_page(page: Dict, total_pages: int) -> None:
+            report_progress({
+                'stage': 'ocr-extracting',
+                'percent': 12 + int(6 * page['page_number'] / max(total_pages, 1)),
+                'currentPage': page['page_number'],
+                'totalPages': total_pages,
+                'extractionMethod': 'OCR',
+            })
+
+        if ocr_worker.enabled:
+            try:
+                return ocr_worker.extract_text_from_pdf(file_path, page_images, on_page=on_page, profile=ocr_profile)
+            except Exception as e:
+                print(f"[OCR-WORKER] ? Fallo en el proceso de OCR, se continua en este proceso: {e}")
+        return get_ocr_processor(ocr_profile).extract_text_from_pdf(file_path, page_images, on_page=on_page)
+
+    def _extract_with_routing(
+        self,
+        input_path: PdfSource,
+        normalized_mode: str,
+        report_progress: Callable[[Dict[str, Any]], None],
+        page_images: Optional[List[Optional[fitz.Pixmap]]] = None,
+        ocr_profile: Optional[str] = None,
+    ) -> Tuple[Dict, str, Dict[str, int]]:
+        """
+        Extrae el texto del documento enrutando cada página a texto local o parser/OCR
+
+        Returns:
+            Tuple(parsed_data, método de extracción, páginas por origen)
+        """
+        page_plan = self._plan_page_extraction(input_path) if self.page_routing else []
+        local_pages = [entry for entry in page_plan if entry['source'] == 'local']
+        pending_indexes = [entry['index'] for entry in page_plan if entry['source'] != 'local']
+
+        if local_pages:
+            # Documento con capa de texto: leer localmente y extraer solo el resto
+            print(f"[RUTA] Paginas con texto local: {len(local_pages)} | para parser/OCR: {len(pending_indexes)}")
+            remote_data = None
+            remote_method = None
+            if pending_indexes:
+                subset = self._write_page_subset(input_path, pending_indexes)
+                try:
+                    subset_images = [page_images[i] for i in pending_indexes] if page_images else None
+                    remote_data, remote_method = self._extract_document(
+                        subset, normalized_mode, report_progress, min_chars=1, page_images=subset_images,
+                        ocr_profile=ocr_profile,
+                    )
+                finally:
+                    self._discard_subset(subset)
+
+            regions = {entry['index']: entry['ocr_regions'] for entry in local_pages if entry.get('ocr_regions')}
+            region_lines = self._run_region_ocr(input_path, regions, normalized_mode, report_progress, ocr_profile)
+
+            parsed_data = self._merge_routed_pages(
+                page_plan, pending_indexes, remote_data, remote_method, region_lines
+            )
+            extraction_method = "TEXTO_LOCAL" if remote_method is None else f"TEXTO_LOCAL+{remote_method}"
+            remote_source = self.EXTRACTION_SOURCES.get(remote_method, 'remote')
+            pages_by_source = {'local': len(local_pages)}
+            if pending_indexes:
+                pages_by_source[remote_source] = len(pending_indexes)
+        else:
+            parsed_data, extraction_method = self._extract_document(
+                input_path, normalized_mode, report_progress, page_images=page_images, ocr_profile=ocr_profile
+            )
+            pages_by_source = {
+                self.EXTRACTION_SOURCES.get(extraction_method, 'remote'): len(parsed_data['pages'])
+            }
+
+        return parsed_data, extraction_method, pages_by_source
+
+    def _extraction_cache_options(self, ocr_profile: str) -> Dict[str, Any]:
+        """Opciones que cambian el resultado de la extracción y forman parte de la clave de caché"""
+        return {
+            'ocr_profile': ocr_profile,
+            'page_routing': self.page_routing,
+            'text_layer_min_chars': self.text_layer_min_chars,
+            'scan_image_coverage': self.scan_image_coverage,
+            'parser_shard_pages': self.parser_shard_pages,
+            'ocr_image_regions': self.ocr_image_regions,
+        }
+
+    def _plan_page_extraction(self, pdf_path: PdfSource) -> List[Dict]:
+        """
+        Clasifica cada página antes de extraer: capa de texto local o parser/OCR
+
+        Una página se lee localmente si su capa de texto tiene suficientes caracteres
+        y no está cubierta casi por completo por imágenes (escaneo con capa OCR).
+        Las páginas en blanco también se resuelven localmente. En las páginas locales
+        se anotan las imágenes sin texto encima, que se leerán con OCR por regiones.
+
+        Returns:
+            Lista por página: {'index', 'source', 'chars', 'image_coverage', 'text', 'ocr_regions'}
+        """
+        plan: List[Dict] = []
+        doc = self._open_pdf(pdf_path)
+        try:
+            for page in doc:
+                text = page.get_text()
+                chars = len(text.strip())
+                page_area = abs(page.rect) or 1.0
+                image_area = 0.0
+                image_info = page.get_image_info()
+                for info in image_info:
+                    bbox = fitz.Rect(info.get('bbox', (0, 0, 0, 0))) & page.rect
+                    image_area += abs(bbox)
+                image_coverage = min(1.0, image_area / page_area)
+
+                has_text_layer = chars >= self.text_layer_min_chars and image_coverage < self.scan_image_coverage
+                is_blank = chars == 0 and image_area == 0 and not page.get_drawings()
+
+                plan.append({
+                    'index': page.number,
+                    'source': 'local' if (has_text_layer or is_blank) else 'pending',
+                    'chars': chars,
+                    'image_coverage': round(image_coverage, 3),
+                    'text': text if (has_text_layer or is_blank) else None,
+                    'ocr_regions': (
+                        self._image_regions(page, image_info) if has_text_layer and self.ocr_image_regions else []
+                    ),
+                })
+        finally:
+            doc.close()
+
+        return plan
+
+    def _image_regions(self, page: fitz.Page, image_info: List[Dict]) -> List[Dict]:
+        """
+        Imágenes de una página digital que hay que leer con OCR
+
+        Se descartan las pequeñas (iconos, viñetas), las contenidas en otra ya
+        elegida y las que tienen capa de texto encima. El zoom de cada región es
+        la resolución nativa de la imagen (mínimo 2, máximo OCR_REGION_MAX_ZOOM).
+
+        Returns:
+            Lista de {'bbox': [x0, y0, x1, y1], 'zoom': float} en puntos PDF
+        """
+        regions: List[Dict] = []
+        taken: List[fitz.Rect] = []
+        for info in image_info:
+            bbox = fitz.Rect(info.get('bbox', (0, 0, 0, 0))) & page.rect
+            if bbox.is_empty or min(bbox.width, bbox.height) < self.ocr_region_min_side:
+                continue
+            if any(rect.contains(bbox) for rect in taken):
+                continue
+            if len(page.get_text('text', clip=bbox).strip()) > self.REGION_TEXT_MAX_CHARS:
+                continue
+            native_zoom = info.get('width', 0) / bbox.width if bbox.width else 2.0
+            taken.append(bbox)
+            regions.append({
+                'bbox': [bbox.x0, bbox.y0, bbox.x1, bbox.y1],
+                'zoom': round(min(self.ocr_region_max_zoom, max(2.0, native_zoom)), 2),
+            })
+        return regions
+
+    def _run_region_ocr(
+        self,
+        input_path: PdfSource,
+        regions: Dict[int, List[Dict]],
+        normalized_mode: str,
+        report_progress: Callable[[Dict[str, Any]], None],
+        ocr_profile: Optional[str] = None,
+    ) -> Dict[int, List[Dict]]:
+        """
+        OCR de las regiones de imagen de las páginas locales
+
+        Es un complemento de la capa de texto: si el OCR no está disponible o
+        falla, el documento sigue con el texto local.
+
+        Returns:
+            Índice de página -> líneas OCR de sus regiones
+        """
+        if not regions or normalized_mode == 'parser' or not ocr_processor.can_use_ocr():
+            return {}
+
+        total_regions = sum(len(page_regions) for page_regions in regions.values())
+        print(f"[RUTA] OCR por regiones: {total_regions} imagen(es) en {len(regions)} pagina(s) con texto local")
+        report_progress({
+            'stage': 'ocr-initializing',
+            'percent': 14,
+            'currentPage': 0,
+            'totalPages': 0,
+            'extractionMethod': 'OCR',
+        })
+        if ocr_worker.enabled:
+            try:
+                return ocr_worker.extract_text_from_regions(input_path, regions, profile=ocr_profile)
+            except Exception as e:
+                print(f"[OCR-WORKER] Fallo en el OCR por regiones, se continua en este proceso: {e}")
+        try:
+            return get_ocr_processor(ocr_profile).extract_text_from_regions(input_path, regions)
+        except Exception as e:
+            print(f"[RUTA] OCR por regiones no disponible, se usa solo la capa de texto: {e}")
+            return {}
+
+    def _write_page_subset(self, pdf_path: PdfSource, page_indexes: List[int]) -> PdfSource:
+        """
+        Sub-PDF con solo las páginas indicadas (en orden)
+
+        Se queda en memoria si el origen está en memoria; si no, se guarda en un
+        PDF temporal. Se libera con _discard_subset.
+        """
+        source = self._open_pdf(pdf_path)
+        subset = fitz.open()
+        try:
+            run_start = previous = page_indexes[0]
+            for index in page_indexes[1:] + [None]:
+                if index is not None and index == previous + 1:
+                    previous = index
+                    continue
+                subset.insert_pdf(source, from_page=run_start, to_page=previous)
+                if index is not None:
+                    run_start = previous = index
+
+            if not isinstance(pdf_path, str):
+                return subset.tobytes()
+            fd, subset_path = tempfile.mkstemp(prefix='subset_', suffix='.pdf')
+            os.close(fd)
+            subset.save(subset_path)
+        finally:
+            subset.close()
+            source.close()
+
+        return subset_path
+
+    def _merge_routed_pages(
+        self,
+        page_plan: List[Dict],
+        pending_indexes: List[int],
+        remote_data: Optional[Dict],
+        remote_method: Optional[str],
+        region_lines: Optional[Dict[int, List[Dict]]] = None,
+    ) -> Dict:
+        """
+        Combina texto local y resultados del parser/OCR en la estructura parsed_data['pages']
+
+        Las páginas remotas no se copian: se referencian y se leen al acceder a ellas.
+        Las líneas OCR de las regiones de imagen se añaden al texto local de su
+        página y quedan en 'lines' para localizar las coincidencias.
+        """
+        remote_pages = remote_data.get('pages', []) if remote_data else []
+        remote_position = {page_index: position for position, page_index in enumerate(pending_indexes)}
+        remote_source = self.EXTRACTION_SOURCES.get(remote_method, 'remote')
+
+        entries: List = []
+        for entry in page_plan:
+            index = entry['index']
+            if entry['source'] == 'local':
+                lines = (region_lines or {}).get(index)
+                if lines:
+                    text = (entry['text'] or '').rstrip('\n') + '\n' + '\n'.join(line['text'] for line in lines)
+                    entries.append({'text': text, 'page_number': index + 1, 'source': 'local+ocr', 'lines': lines})
+                    continue
+                entries.append({'text': entry['text'] or '', 'page_number': index + 1, 'source': 'local'})
+                continue
+
+            extra = {'page_number': index + 1, 'source': remote_source}
+            position = remote_position.get(index)
+            if position is None or position >= len(remote_pages):
+                print(f'  [WARN] Pagina {index + 1} sin resultado del parser/OCR')
+                entries.append(dict(extra, text=''))
+                continue
+            entries.append((remote_pages, position, extra))
+
+        merged = {'pages': ComposedPages(entries, [remote_pages])}
+        for counter in self.OCR_COUNTERS:
+            if remote_data and remote_data.get(counter):
+                merged[counter] = remote_data[counter]
+        if region_lines:
+            merged['ocr_region_lines'] = sum(len(lines) for lines in region_lines.values())
+        return merged
+
+    def process_pdf(
+        self,
+        input_path: PdfSource,
+        output_path: Optional[Union[str, BinaryIO]],
+        enabled_rules: Dict[str, bool],
+        sensitivity_level: str = 'normal',
+        action: str = 'highlight',  # 'highlight', 'redact' o 'findings'
+        extraction_mode: str = 'auto',
+        progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+        save_profile: Optional[str] = None,
+        page_images: Optional[List[Optional[fitz.Pixmap]]] = None,
+        ocr_profile: Optional[str] = None,
+    ) -> Dict:
+        """
+        Procesa un PDF completo
+
+        Args:
+            input_path: Ruta al PDF de entrada o su contenido en memoria (bytes)
+            output_path: Ruta o buffer binario (p. ej. io.BytesIO) donde guardar el PDF
+                         procesado (no se usa con action='findings')
+            enabled_rules: Reglas habilitadas {rule_id: bool}
+            sensitivity_level: 'strict', 'normal', 'relaxed'
+            action: 'highlight' (subrayar), 'redact' (eliminar texto) o 'findings'
+                    (solo detecciones con coordenadas, sin modificar ni guardar el PDF)
+            extraction_mode: 'auto', 'parser' o 'ocr' segun el metodo deseado
+            save_profile: 'compact', 'fast' o 'incremental' (None = OUTPUT_SAVE_PROFILE)
+            page_images: Píxeles ya decodificados por página (subidas de imagen); el OCR
+                         los usa en lugar de volver a rasterizar esas páginas
+            ocr_profile: Perfil del OCR: 'fast', 'balanced' o 'accurate' (None = OCR_PROFILE)
+
+        Returns:
+            Dict con estadísticas:
+            {
+                'total_matches': int,
+                'by_type': {type: count},
+                'by_page': {page_num: count},
+                'pages_processed': int,
+                'propagated_values': int,  # valores del registro localizados, contados una vez por página
+                'propagated_values_by_type': {type: count},
+                'pages_by_source': {'local' | 'parser' | 'ocr': count},
+                'extraction_cache': 'hit' | 'miss' | 'disabled',
+                'detection_cache_hits': int,  # páginas cuya detección salió de la caché
+                'detection_cache_hit_rate': float,
+                'ocr_cache_hits': int,  # páginas del OCR con todas sus líneas reutilizadas de la caché de plantillas
+                'ocr_region_lines': int,  # líneas leídas con OCR en imágenes de páginas con texto local
+                'ocr_rechecked_lines': int,  # líneas OCR releídas a más resolución (baja confianza o identificadores)
+                'ocr_recheck_improved': int,  # de ellas, las que cambiaron por una lectura más fiable
+                'ocr_profile': str,  # perfil de velocidad/calidad del OCR usado
+                'save': {'profile', 'requested', 'seconds', 'size_bytes'},
+                # solo con action='findings':
+                'findings': [{'page', 'type', 'confidence', 'rects', 'propagated'}],
+                'page_sizes': [{'page', 'width', 'height'}]
+            }
+        """
+        stats = {
+            'total_matches': 0,
+            'by_type': {},
+            'by_page': {},
+            'pages_processed': 0,
+            'propagated_values': 0,
+            'propagated_values_by_type': {},
+            'pages_by_source': {},
+            'extraction_cache': 'disabled',
+            'detection_cache_hits': 0,
+            'detection_cache_hit_rate': 0.0,
+            'ocr_cache_hits': 0,
+            'ocr_region_lines': 0,
+            'ocr_rechecked_lines': 0,
+            'ocr_recheck_improved': 0,
+            'ocr_profile': None,
+            'save': {},
+        }
+
+        def report_progress(update: Dict[str, Any]) -> None:
+            if progress_callback:
+                try:
+                    progress_callback(update)
+                except Exception as progress_error:  # pragma: no cover
+                    print(f'[WARN] Error reportando progreso: {progress_error}')
+
+        print(f"\n{'='*60}")
+        print(f"[INICIO] Procesando documento: {input_path if isinstance(input_path, str) else f'en memoria ({len(input_path)} bytes)'}")
+        print(f"{'='*60}\n")
+
+        report_progress({'stage': 'preparing', 'percent': 12, 'currentPage': 0, 'totalPages': 0, 'extractionMethod': extraction_mode})
+
+        normalized_mode = (extraction_mode or "auto").lower()
+        if normalized_mode not in {"auto", "parser", "ocr"}:
+            normalized_mode = "auto"
+        print(f"[MODO] Estrategia de extraccion seleccionada: {normalized_mode}")
+        ocr_profile = request_ocr_profile(ocr_profile)
+        stats['ocr_profile'] = ocr_profile
+        if normalized_mode != "parser":
+            print(f"[MODO] Perfil del OCR: {ocr_profile}")
+
+        cache_key = None
+        cached = None
+        if extraction_cache.enabled:
+            cache_key = extraction_cache.make_key(input_path, normalized_mode, self._extraction_cache_options(ocr_profile))
+            cached = extraction_cache.get(cache_key)
+
+        if cached is not None:
+            parsed_data = {'pages': cached['pages']}
+            extraction_method = cached['meta'].get('extraction_method') or normalized_mode.upper()
+            stats['pages_by_source'] = cached['meta'].get('pages_by_source', {})
+            stats['extraction_cache'] = 'hit'
+            print(f"[CACHE] Extraccion recuperada de cache ({extraction_method}, {len(parsed_data['pages'])} pagina(s))")
+        else:
+            parsed_data, extraction_method, stats['pages_by_source'] = self._extract_with_routing(
+                input_path, normalized_mode, report_progress, page_images, ocr_profile
+            )
+            for counter in self.OCR_COUNTERS:
+                stats[counter] = parsed_data.get(counter, 0)
+            if cache_key is not None:
+                extraction_cache.put(cache_key, parsed_data['pages'], {
+                    'extraction_method': extraction_method,
+                    'pages_by_source': stats['pages_by_source'],
+                })
+                stats['extraction_cache'] = 'miss'
+
         # Abrir PDF con PyMuPDF
         print(f"[PASO 2/4] Abriendo documento PDF con PyMuPDF")
-        doc = fitz.open(input_path)
+        requested_profile = self._normalize_save_profile(save_profile) if save_profile else self.save_profile
+        incremental_base = (
+            action != 'findings'
+            and requested_profile == 'incremental'
+            and isinstance(output_path, str)
+            and self._can_save_incrementally(input_path, action)
+        )
+        if incremental_base:
+            # El guardado incremental añade los cambios al final de una copia del original
+            if isinstance(input_path, str):
+                shutil.copyfile(input_path, output_path)
+            else:
+                with open(output_path, 'wb') as f:
+                    f.write(input_path)
+            doc = fitz.open(output_path)
+        else:
+            doc = self._open_pdf(input_path)
         total_pages = len(doc)
         print(f"[INFO] Total de pÃ¡ginas: {total_pages}\n")
         total_for_progress = total_pages if total_pages > 0 else 1
@@ -382,111 +951,122 @@ class PDFProcessor:
             'extractionMethod': extraction_method or normalized_mode.upper(),
         })
 
-
+        output_doc: Optional[fitz.Document] = None
         try:
             print(f"[PASO 3/4] Procesando pÃ¡ginas y detectando datos sensibles")
             print(f"{'-'*60}")
 
-            # Procesar cada pÃ¡gina
+            # Fase A: detectar en todas las páginas y registrar los valores del documento
+            registry = DocumentValueRegistry(self.propagation_min_length, self.propagation_numeric_min_length)
+            page_matches: List[List[Dict]] = []
             for page_num in range(total_pages):
-                page = doc[page_num]
-                print(f"\n[PAGINA {page_num + 1}/{total_pages}]")
-
-                # PASO 2: Obtener texto de la pÃ¡gina
-                page_text = None
-
-                # Obtener texto del mÃ©todo de extracciÃ³n disponible (parser o OCR)
-                ocr_lines = []
-
-                if page_num >= len(parsed_data['pages']):
-                    print(f'  [WARN] Pagina {page_num + 1} no encontrada en datos parseados')
-                    page_text = ''
-                else:
-                    page_data = parsed_data['pages'][page_num]
-
-                    if isinstance(page_data, dict):
-                        page_text = page_data.get('text') or page_data.get('content') or page_data.get('extracted_text') or ''
-                        lines_candidate = page_data.get('lines')
-                        if isinstance(lines_candidate, list):
-                            ocr_lines = lines_candidate
-                    elif isinstance(page_data, str):
-                        page_text = page_data
-                    else:
-                        print(f'  [WARN] Estructura de pagina no reconocida: {type(page_data)}')
-                        page_text = ''
-
-                    if not page_text or len(page_text.strip()) == 0:
-                        print('  [WARN] No se obtuvo texto para esta pagina')
-                        page_text = ''
-                    else:
-                        print(f'  [INFO] Fuente de texto: {extraction_method}')
-                        print(f'  [INFO] Caracteres extraidos: {len(page_text)}')
-                        print(f'  [INFO] Preview: {page_text[:100]}...')
-
-                self._current_page_ocr_lines = ocr_lines
-
-                page_stage = 'ocr-page' if (extraction_method == 'OCR') else 'parser-page'
-                percent_start = 20 + int((page_num / total_for_progress) * 75) if total_for_progress else 20
-                report_progress({
-                    'stage': page_stage,
-                    'percent': min(95, percent_start),
-                    'currentPage': page_num + 1,
-                    'totalPages': total_pages,
-                })
-
-                # Detectar datos sensibles
-                print(f"  â”œâ”€ Detectando datos sensibles...")
-                matches = detector.detect(
+                page_text, _ = self._get_page_content(parsed_data, page_num)
+                # Páginas repetidas (cabeceras, condiciones, anexos) reutilizan la detección
+                matches, cache_hit = detector.detect_cached(
                     page_text,
                     enabled_rules,
                     sensitivity_level
                 )
+                if cache_hit:
+                    stats['detection_cache_hits'] += 1
+                page_matches.append(matches)
+                registry.register(page_num + 1, matches)
+            print(f"[INFO] Valores sensibles distintos en el documento: {len(registry)}")
+            stats['detection_cache_hit_rate'] = round(stats['detection_cache_hits'] / total_pages, 3) if total_pages else 0.0
+            print(f"[INFO] Paginas resueltas desde la cache de deteccion: {stats['detection_cache_hits']}/{total_pages}")
+
+            # Fase B: localizar y marcar cada página (en paralelo por rangos si está activado)
+            page_stage = 'ocr-page' if ('OCR' in extraction_method) else 'parser-page'
+            # El guardado incremental necesita marcar el propio documento abierto
+            workers = 1 if incremental_base else self._page_workers_for(total_pages)
+            if workers > 1 and action != 'findings':
+                # Los parciales unidos pierden las partes del documento que no cuelgan de una página
+                document_parts = self._document_level_parts(doc)
+                if document_parts:
+                    print(f"[WORKERS] El documento tiene {', '.join(document_parts)}: se marca en serie para conservarlos")
+                    workers = 1
+            findings: List[Dict] = []
+            marked_in_workers = False
+            if workers > 1:
+                try:
+                    output_doc, located_by_type = self._mark_pages_in_workers(
+                        input_path, parsed_data, extraction_method, page_matches, registry,
+                        action, workers, page_stage, report_progress, findings
+                    )
+                    self._add_propagated_stats(stats, located_by_type)
+                    stats['page_workers'] = workers
+                    marked_in_workers = True
+                except Exception as e:
+                    print(f"[WORKERS] ? Fallo en el marcado en paralelo, se continua en serie: {e}")
+                    output_doc = None
+                    findings.clear()
 
-                if matches:
-                    print(f"  â”œâ”€ âœ“ {len(matches)} dato(s) sensible(s) detectado(s)")
-
-                    # Buscar y marcar cada match en el PDF
-                    for idx, match in enumerate(matches, 1):
-                        print(f"  â”‚  â””â”€ [{idx}] {match['type']}: {match['value'][:30]}...")
-                        self._mark_match_on_page(
-                            page,
-                            match,
-                            page_text,
-                            action,
-                            self._current_page_ocr_lines
-                        )
-
-                        # Actualizar estadÃ­sticas
-                        stats['total_matches'] += 1
-                        stats['by_type'][match['type']] = stats['by_type'].get(match['type'], 0) + 1
+            if not marked_in_workers:
+                output_doc = doc
+                for page_num in range(total_pages):
+                    page = doc[page_num]
+                    print(f"\n[PAGINA {page_num + 1}/{total_pages}]")
 
-                    stats['by_page'][page_num + 1] = len(matches)
-                    print(f"  â””â”€ âœ“ Datos marcados en el PDF")
-                else:
-                    print(f"  â””â”€ No se detectaron datos sensibles")
+                    # Obtener texto del método de extracción disponible (parser o OCR)
+                    page_text, ocr_lines = self._get_page_content(parsed_data, page_num, extraction_method)
 
-                percent_end = 20 + int(((page_num + 1) / total_for_progress) * 75) if total_for_progress else 95
-                report_progress({
-                    'stage': page_stage,
-                    'percent': min(95, percent_end),
-                    'currentPage': page_num + 1,
-                    'totalPages': total_pages,
-                })
+                    percent_start = 20 + int((page_num / total_for_progress) * 75) if total_for_progress else 20
+                    report_progress({
+                        'stage': page_stage,
+                        'percent': min(95, percent_start),
+                        'currentPage': page_num + 1,
+                        'totalPages': total_pages,
+                    })
+
+                    matches = page_matches[page_num]
+                    propagated = self._propagated_for_page(registry, page_text, matches)
+                    located_by_type = self._mark_page(
+                        page, page_text, ocr_lines, matches, propagated, action, findings
+                    )
+                    self._add_propagated_stats(stats, located_by_type)
+
+                    percent_end = 20 + int(((page_num + 1) / total_for_progress) * 75) if total_for_progress else 95
+                    report_progress({
+                        'stage': page_stage,
+                        'percent': min(95, percent_end),
+                        'currentPage': page_num + 1,
+                        'totalPages': total_pages,
+                    })
 
+            for page_num, matches in enumerate(page_matches):
+                for match in matches:
+                    # Actualizar estadísticas
+                    stats['total_matches'] += 1
+                    stats['by_type'][match['type']] = stats['by_type'].get(match['type'], 0) + 1
+                if matches:
+                    stats['by_page'][page_num + 1] = len(matches)
                 stats['pages_processed'] += 1
 
-            # Guardar PDF modificado
-            print(f"\n{'-'*60}")
-            print(f"[PASO 4/4] Guardando PDF procesado")
             report_progress({'stage': 'finalizing', 'percent': 97, 'currentPage': total_pages, 'totalPages': total_pages})
-            doc.save(output_path, garbage=4, deflate=True)
-            print(f"[âœ“] PDF guardado exitosamente: {output_path}")
+            if action == 'findings':
+                # Solo detecciones y geometría: el documento no se modifica ni se guarda
+                stats['findings'] = findings
+                stats['page_sizes'] = [
+                    {'page': page.number + 1, 'width': round(page.rect.width, 2), 'height': round(page.rect.height, 2)}
+                    for page in doc
+                ]
+                print(f"\n[PASO 4/4] Modo findings: {len(findings)} deteccion(es) localizadas, sin generar PDF")
+            else:
+                # Guardar PDF modificado
+                print(f"\n{'-'*60}")
+                print(f"[PASO 4/4] Guardando PDF procesado")
+                stats['save'] = self._save_output(
+                    output_doc, output_path, requested_profile, action,
+                    incremental_ready=incremental_base and output_doc is doc,
+                )
+                print(f"[âœ“] PDF guardado exitosamente: {output_path if isinstance(output_path, str) else 'en memoria'}")
 
             # Resumen final
             print(f"\n{'='*60}")
             print(f"[RESUMEN]")
             print(f"  Paginas procesadas: {stats['pages_processed']}")
             print(f"  Total datos sensibles encontrados: {stats['total_matches']}")
+            print(f"  Valores propagados por página desde el registro: {stats['propagated_values']}")
             if stats['by_type']:
                 print(f"  Desglose por tipo:")
                 for data_type, count in stats['by_type'].items():
@@ -494,23 +1074,477 @@ class PDFProcessor:
             print(f"{'='*60}\n")
 
         finally:
+            if output_doc is not None and output_doc is not doc:
+                output_doc.close()
             doc.close()
+            close_pages(parsed_data['pages'])
 
         return stats
 
+    def _normalize_save_profile(self, profile: Optional[str]) -> str:
+        normalized = (profile or 'compact').strip().lower()
+        if normalized not in self.SAVE_PROFILES and normalized != 'incremental':
+            print(f"[WARN] Perfil de guardado desconocido '{profile}', se usa 'compact'")
+            return 'compact'
+        return normalized
+
+    def _can_save_incrementally(self, pdf_path: PdfSource, action: str) -> bool:
+        """
+        Indica si el PDF admite guardado incremental para esta acción
+
+        Nunca en redacción: las revisiones anteriores del archivo seguirían
+        conteniendo el texto eliminado.
+        """
+        if action == 'redact':
+            print("[GUARDAR] Redaccion: no se usa guardado incremental (conservaria el texto eliminado)")
+            return False
+        try:
+            with self._open_pdf(pdf_path) as source:
+                return bool(source.can_save_incrementally()) and not source.is_repaired
+        except Exception as e:
+            print(f"[WARN] No se pudo comprobar el guardado incremental: {e}")
+            return False
+
+    def _save_output(
+        self,
+        doc: fitz.Document,
+        output_path: Union[str, BinaryIO],
+        profile: str,
+        action: str,
+        incremental_ready: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Guarda el PDF de salida con el perfil indicado
+
+        - compact: recolección completa de objetos, deduplicación y recompresión
+        - fast: sin recolección ni recompresión de los streams ya comprimidos; los
+          reescritos al marcar se comprimen (en redacción con garbage=1 para no
+          dejar el contenido eliminado en objetos huérfanos)
+        - incremental: solo añade los cambios al final del original; si no es
+          posible (o la salida es un buffer en memoria) se usa fast
+
+        Returns:
+            Dict con perfil usado, perfil pedido, segundos y tamaño en bytes
+        """
+        effective = profile
+        if profile == 'incremental' and not incremental_ready:
+            print("[GUARDAR] Guardado incremental no disponible para este documento, se usa 'fast'")
+            effective = 'fast'
+
+        started = time.perf_counter()
+        if effective == 'incremental':
+            doc.save(doc.name, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+        else:
+            options = dict(self.SAVE_PROFILES[effective])
+            if action == 'redact':
+                options['garbage'] = max(options['garbage'], 1)
+            doc.save(output_path, **options)
+        elapsed = time.perf_counter() - started
+
+        size_bytes = os.path.getsize(output_path) if isinstance(output_path, str) else output_path.tell()
+        print(f"[GUARDAR] Perfil {effective}: {elapsed:.2f}s, {size_bytes / (1024 * 1024):.2f} MB")
+        return {
+            'profile': effective,
+            'requested': profile,
+            'seconds': round(elapsed, 3),
+            'size_bytes': size_bytes,
+        }
+
+    # Entradas del catálogo que la unión de parciales con insert_pdf no copia
+    DOCUMENT_LEVEL_KEYS = (
+        ('AcroForm', 'formularios'),
+        ('PageLabels', 'etiquetas de pagina'),
+        ('Dests', 'destinos con nombre'),
+        ('Names/Dests', 'destinos con nombre'),
+        ('Names/JavaScript', 'JavaScript de documento'),
+        ('OpenAction', 'accion de apertura'),
+        ('AA', 'acciones de documento'),
+        ('Names/EmbeddedFiles', 'adjuntos'),
+    )
+
+    def _document_level_parts(self, doc: fitz.Document) -> List[str]:
+        """
+        Partes del documento que se perderían al unir los rangos marcados en paralelo:
+        formularios, etiquetas de página, destinos con nombre, JavaScript y acciones
+        de documento, adjuntos y enlaces internos entre páginas
+        """
+        catalog = doc.pdf_catalog()
+        parts: List[str] = []
+        for key, label in self.DOCUMENT_LEVEL_KEYS:
+            if doc.xref_get_key(catalog, key)[0] != 'null' and label not in parts:
+                parts.append(label)
+        for page in doc:
+            if any(link.get('kind') in (fitz.LINK_GOTO, fitz.LINK_NAMED) for link in page.get_links()):
+                parts.append('enlaces internos')
+                break
+        return parts
+
+    def _page_workers_for(self, total_pages: int) -> int:
+        """Procesos a usar para marcar el documento (1 = en serie)"""
+        if self.page_workers <= 1 or total_pages < self.page_workers_min_pages:
+            return 1
+        # Cada proceso recibe al menos la mitad del mínimo de páginas
+        return max(1, min(self.page_workers, total_pages // max(1, self.page_workers_min_pages // 2)))
+
+    def _propagated_for_page(self, registry: DocumentValueRegistry, page_text: str, matches: List[Dict]) -> List[Dict]:
+        """Valores ya confirmados en el documento que la detección no marcó en esta página"""
+        if not self.propagate_values or not len(registry):
+            return []
+        detected_keys = {compact_for_lookup(match['value']) for match in matches}
+        return registry.find_in_page(page_text, exclude=detected_keys)
+
+    def _add_propagated_stats(self, stats: Dict, located_by_type: Dict[str, int]) -> None:
+        for data_type, count in located_by_type.items():
+            stats['propagated_values'] += count
+            stats['propagated_values_by_type'][data_type] = stats['propagated_values_by_type'].get(data_type, 0) + count
+
+    def _mark_page(
+        self,
+        page: fitz.Page,
+        page_text: str,
+        ocr_lines: List[Dict],
+        matches: List[Dict],
+        propagated: List[Dict],
+        action: str,
+        findings: Optional[List[Dict]] = None,
+    ) -> Dict[str, int]:
+        """
+        Marca en una página sus detecciones y los valores propagados del documento
+
+        Con action='findings' la página no se modifica: las detecciones localizadas
+        se añaden a findings.
+
+        Returns:
+            Valores propagados que se pudieron localizar en la página, por tipo
+            (cada valor cuenta una vez aunque aparezca varias veces)
+        """
+        self._current_page_ocr_lines = ocr_lines
+        self._current_page_word_index = None
+
+        if action == 'findings':
+            located_by_type, page_findings = self._collect_page_findings(page, ocr_lines, matches, propagated)
+            if findings is not None:
+                findings.extend(page_findings)
+            return located_by_type
+
+        if matches:
+            print(f"  â”œâ”€ âœ“ {len(matches)} dato(s) sensible(s) detectado(s)")
+
+            # Buscar y marcar cada valor distinto una sola vez
+            marked_values = set()
+            for idx, match in enumerate(matches, 1):
+                print(f"  â”‚  â””â”€ [{idx}] {match['type']}: {match['value'][:30]}...")
+                if match['value'] not in marked_values:
+                    marked_values.add(match['value'])
+                    self._mark_match_on_page(
+                        page,
+                        match,
+                        page_text,
+                        action,
+                        self._current_page_ocr_lines
+                    )
+
+            print(f"  â””â”€ âœ“ Datos marcados en el PDF")
+        else:
+            print(f"  â””â”€ No se detectaron datos sensibles")
+
+        located_by_type: Dict[str, int] = {}
+        if propagated:
+            print(f"  [INFO] {len(propagated)} valor(es) del documento presentes en la página")
+            for match in propagated:
+                print(f"  [PROPAGADO] {match['type']}: {match['value'][:30]}...")
+                if self._mark_match_on_page(
+                    page,
+                    match,
+                    page_text,
+                    action,
+                    self._current_page_ocr_lines
+                ):
+                    located_by_type[match['type']] = located_by_type.get(match['type'], 0) + 1
+
+        return located_by_type
+
+    def _collect_page_findings(
+        self,
+        page: fitz.Page,
+        ocr_lines: List[Dict],
+        matches: List[Dict],
+        propagated: List[Dict],
+    ) -> Tuple[Dict[str, int], List[Dict]]:
+        """
+        Localiza las detecciones de una página sin modificarla
+
+        Las detecciones que no se pudieron localizar se devuelven con rects vacíos;
+        los valores propagados solo si aparecen en la página.
+
+        Returns:
+            Tuple(propagados localizados por tipo, findings de la página)
+        """
+        located_by_type: Dict[str, int] = {}
+        page_findings: List[Dict] = []
+        rects_by_value: Dict[str, List[fitz.Rect]] = {}
+        for match in list(matches) + list(propagated):
+            value = match['value']
+            if value not in rects_by_value:
+                rects_by_value[value] = self._locate_match_on_page(page, match, ocr_lines)
+            rects = rects_by_value[value]
+
+            is_propagated = bool(match.get('propagated'))
+            if is_propagated:
+                if not rects:
+                    continue
+                located_by_type[match['type']] = located_by_type.get(match['type'], 0) + 1
+
+            page_findings.append({
+                'page': page.number + 1,
+                'type': match['type'],
+                'confidence': round(float(match.get('confidence', 0.0)), 3),
+                'rects': [[round(rect.x0, 2), round(rect.y0, 2), round(rect.x1, 2), round(rect.y1, 2)] for rect in rects],
+                'propagated': is_propagated,
+            })
+
+        return located_by_type, page_findings
+
+    def _mark_pages_in_workers(
+        self,
+        input_path: PdfSource,
+        parsed_data: Dict,
+        extraction_method: str,
+        page_matches: List[List[Dict]],
+        registry: DocumentValueRegistry,
+        action: str,
+        workers: int,
+        page_stage: str,
+        report_progress: Callable[[Dict[str, Any]], None],
+        findings: Optional[List[Dict]] = None,
+    ) -> Tuple[Optional[fitz.Document], Dict[str, int]]:
+        """
+        Marca el documento repartiendo rangos contiguos de páginas entre procesos
+
+        La detección y el registro de valores ya están hechos en este proceso, así la
+        propagación sigue siendo de todo el documento. Cada proceso marca su rango en
+        su propia copia del PDF y guarda un parcial; aquí se unen en orden.
+
+        Returns:
+            Tuple(documento unido (None con action='findings'), valores propagados
+            localizados por página y tipo)
+        """
+        total_pages = len(page_matches)
+        chunk = -(-total_pages // workers)
+        ranges = [(start, min(start + chunk, total_pages)) for start in range(0, total_pages, chunk)]
+        print(f"[WORKERS] Marcando {total_pages} pagina(s) en {len(ranges)} rango(s) con {workers} proceso(s)")
+
+        pool, manager = page_workers.get_pool(self.page_workers)
+        progress_queue = manager.Queue()
+        # Plazo total según el número de páginas: un proceso colgado no debe bloquear la petición
+        deadline = None
+        if self.page_workers_timeout > 0:
+            deadline = time.monotonic() + max(60.0, self.page_workers_timeout * total_pages)
+        partial_paths: List[str] = []
+        futures = []
+        located_by_type: Dict[str, int] = {}
+        spilled_input: Optional[str] = None
+        try:
+            worker_input = input_path
+            if not isinstance(input_path, str):
+                # Los procesos abren el PDF desde disco: se vuelca una vez en lugar de enviarlo a cada uno
+                fd, spilled_input = tempfile.mkstemp(prefix='workers_input_', suffix='.pdf')
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(input_path)
+                worker_input = spilled_input
+
+            for start, end in ranges:
+                fd, partial_path = tempfile.mkstemp(prefix='partial_', suffix='.pdf')
+                os.close(fd)
+                partial_paths.append(partial_path)
+                pages = []
+                for page_num in range(start, end):
+                    page_text, ocr_lines = self._get_page_content(parsed_data, page_num)
+                    pages.append({
+                        'page_num': page_num,
+                        'text': page_text,
+                        'ocr_lines': ocr_lines,
+                        'matches': page_matches[page_num],
+                        'propagated': self._propagated_for_page(registry, page_text, page_matches[page_num]),
+                    })
+                task = {
+                    'input_path': worker_input,
+                    'start': start,
+                    'end': end,
+                    'pages': pages,
+                    'action': action,
+                    'partial_path': partial_path,
+                }
+                futures.append(pool.submit(page_workers.mark_page_range, task, progress_queue))
+
+            # Progreso por página mientras trabajan los procesos
+            pages_done = 0
+            while pages_done < total_pages:
+                if deadline is not None and time.monotonic() > deadline:
+                    raise TimeoutError(f"los procesos no terminaron a tiempo ({pages_done}/{total_pages} páginas)")
+                try:
+                    progress_queue.get(timeout=0.5)
+                except queue.Empty:
+                    failed = next((f for f in futures if f.done() and f.exception() is not None), None)
+                    if failed is not None:
+                        raise failed.exception()
+                    if all(f.done() for f in futures):
+                        break
+                    continue
+                pages_done += 1
+                report_progress({
+                    'stage': page_stage,
+                    'percent': min(95, 20 + int((pages_done / total_pages) * 75)),
+                    'currentPage': pages_done,
+                    'totalPages': total_pages,
+                })
+
+            for future in futures:
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                result = future.result(timeout=remaining)
+                for data_type, count in result['propagated_by_type'].items():
+                    located_by_type[data_type] = located_by_type.get(data_type, 0) + count
+                if findings is not None:
+                    findings.extend(result['findings'])
+
+            if action == 'findings':
+                return None, located_by_type
+
+            # Unir los parciales en orden conservando metadatos y marcadores del original
+            output_doc = fitz.open()
+            for partial_path in partial_paths:
+                with fitz.open(partial_path) as partial:
+                    output_doc.insert_pdf(partial)
+            with self._open_pdf(input_path) as source:
+                output_doc.set_metadata(source.metadata or {})
+                toc = source.get_toc(simple=False)
+                if toc:
+                    output_doc.set_toc(toc)
+        except BrokenProcessPool:
+            # Solo la caída de un proceso rompe el pool compartido; el fallo de una tarea no
+            page_workers.reset_pool(pool)
+            raise
+        finally:
+            for future in futures:
+                future.cancel()
+            for partial_path in partial_paths:
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+            self._discard_subset(spilled_input)
+
+        return output_doc, located_by_type
+
+    def _mark_page_range(self, task: Dict[str, Any], progress_queue=None) -> Dict[str, Any]:
+        """
+        Marca un rango de páginas en una copia propia del PDF (se ejecuta en un proceso trabajador)
+
+        Args:
+            task: input_path, start, end, pages (texto, líneas OCR, detecciones y
+                  propagados de cada página), action y partial_path
+            progress_queue: Cola donde se notifica cada página terminada
+
+        Returns:
+            Dict con los valores propagados localizados por página y tipo, los findings
+            (con action='findings') y la ruta del parcial
+        """
+        located_by_type: Dict[str, int] = {}
+        findings: List[Dict] = []
+        doc = fitz.open(task['input_path'])
+        try:
+            for entry in task['pages']:
+                page_num = entry['page_num']
+                print(f"\n[PAGINA {page_num + 1}/{len(doc)}] (proceso {os.getpid()})")
+                page_located = self._mark_page(
+                    doc[page_num],
+                    entry['text'],
+                    entry['ocr_lines'],
+                    entry['matches'],
+                    entry['propagated'],
+                    task['action'],
+                    findings,
+                )
+                for data_type, count in page_located.items():
+                    located_by_type[data_type] = located_by_type.get(data_type, 0) + count
+                if progress_queue is not None:
+                    progress_queue.put(page_num)
+
+            if task['action'] != 'findings':
+                # Solo el rango de este proceso; garbage=1 descarta los objetos del resto de páginas
+                doc.select(list(range(task['start'], task['end'])))
+                doc.save(task['partial_path'], garbage=1)
+        finally:
+            doc.close()
+            self._current_page_word_index = None
+            self._current_page_ocr_lines = []
+
+        return {'propagated_by_type': located_by_type, 'findings': findings, 'partial_path': task['partial_path']}
+
+    def _get_page_content(
+        self,
+        parsed_data: Dict,
+        page_num: int,
+        source_label: Optional[str] = None,
+    ) -> Tuple[str, List[Dict]]:
+        """
+        Obtiene el texto y las líneas OCR de una página de los datos parseados
+
+        Args:
+            parsed_data: Datos del parser o OCR
+            page_num: Índice de página (base 0)
+            source_label: Si se indica, registra en el log la fuente y un preview
+
+        Returns:
+            Tuple(texto de la página, líneas con bbox)
+        """
+        page_text = ''
+        ocr_lines: List[Dict] = []
+
+        if page_num >= len(parsed_data['pages']):
+            if source_label is not None:
+                print(f'  [WARN] Pagina {page_num + 1} no encontrada en datos parseados')
+            return page_text, ocr_lines
+
+        page_data = parsed_data['pages'][page_num]
+
+        if isinstance(page_data, dict):
+            page_text = page_data.get('text') or page_data.get('content') or page_data.get('extracted_text') or ''
+            lines_candidate = page_data.get('lines')
+            if isinstance(lines_candidate, list):
+                ocr_lines = lines_candidate
+        elif isinstance(page_data, str):
+            page_text = page_data
+        elif source_label is not None:
+            print(f'  [WARN] Estructura de pagina no reconocida: {type(page_data)}')
+
+        if not page_text or len(page_text.strip()) == 0:
+            if source_label is not None:
+                print('  [WARN] No se obtuvo texto para esta pagina')
+            page_text = ''
+        elif source_label is not None:
+            if isinstance(page_data, dict) and page_data.get('source'):
+                source_label = page_data['source']
+            print(f'  [INFO] Fuente de texto: {source_label}')
+            print(f'  [INFO] Caracteres extraidos: {len(page_text)}')
+            print(f'  [INFO] Preview: {page_text[:100]}...')
+
+        return page_text, ocr_lines
+
     # MÃ‰TODO ELIMINADO: _extract_text_with_layout
     # Ya no se usa PyMuPDF para extracciÃ³n de texto
     # TODO texto viene del parser externo en 127.0.0.1:1000
 
-    def _mark_match_on_page(
+    def _locate_match_on_page(
         self,
         page: fitz.Page,
         match: Dict,
-        page_text: str,
-        action: str,
         ocr_lines: Optional[List[Dict]] = None,
-    ):
-        """Locate a match on a PDF page and apply highlight or redaction with pixel-perfect precision."""
+    ) -> List[fitz.Rect]:
+        """
+        Locate a match on a PDF page without modifying it.
+
+        Returns:
+            Rects covering the match (empty list if it could not be located)
+        """
         value = match["value"]
         normalized_value = normalizer.normalize_for_search(value)
 
@@ -532,12 +1566,28 @@ class PDFProcessor:
         if not rects and ocr_lines:
             rects = self._rects_from_ocr_lines(match, ocr_lines)
 
-        if not rects:
-            print("    [WARN] No se encontraron coordenadas para el dato sensible")
-            return
-
         # SIN PADDING - precisión exacta
-        precise_rects = rects
+        return list(rects or [])
+
+    def _mark_match_on_page(
+        self,
+        page: fitz.Page,
+        match: Dict,
+        page_text: str,
+        action: str,
+        ocr_lines: Optional[List[Dict]] = None,
+    ) -> bool:
+        """
+        Locate a match on a PDF page and apply highlight or redaction with pixel-perfect precision.
+
+        Returns:
+            True if the match was located and marked, False otherwise
+        """
+        precise_rects = self._locate_match_on_page(page, match, ocr_lines)
+
+        if not precise_rects:
+            print("    [WARN] No se encontraron coordenadas para el dato sensible")
+            return False
 
         if action == "highlight":
             highlight_shape = page.new_shape()
@@ -545,13 +1595,24 @@ class PDFProcessor:
                 highlight_shape.draw_rect(precise_rect)
             highlight_shape.finish(color=(1, 0, 0), fill=None, width=1.2)
             highlight_shape.commit()
-            return
+            return True
 
         # Para redacción: aplicar directamente sin padding
         for precise_rect in precise_rects:
             page.add_redact_annot(precise_rect, fill=(0, 0, 0), text="")
 
         page.apply_redactions(images=fitz.PDF_REDACT_IMAGE_NONE)
+        # El texto de la página ha cambiado: el índice de palabras ya no es válido
+        self._current_page_word_index = None
+        return True
+
+    def _get_page_word_index(self, page: fitz.Page) -> PageWordIndex:
+        """Devuelve el índice de palabras de la página, construyéndolo una sola vez"""
+        index = self._current_page_word_index
+        if index is None or index.page_number != page.number:
+            index = PageWordIndex(page)
+            self._current_page_word_index = index
+        return index
 
     def _get_precise_char_rects(self, page: fitz.Page, search_text: str) -> List[fitz.Rect]:
         """
@@ -754,6 +1815,7 @@ class PDFProcessor:
                         mapping_end_idx = mapping[min(idx + len(normalized_value) - 1, len(mapping) - 1)]
                         match_end = mapping_end_idx + 1
                     else:
+                        from rapidfuzz import fuzz
                         score = fuzz.partial_ratio(normalized_value, normalized_line)
                         if score >= self.min_fuzzy_score:
                             match_start = mapping[0]
@@ -820,33 +1882,10 @@ class PDFProcessor:
             # Si es una sola palabra, no tiene sentido este mÃ©todo
             return rects
 
-        # Extraer todas las palabras del PDF con sus posiciones
-        page_words = page.get_text("words")  # [(x0, y0, x1, y1, "word", block_no, line_no, word_no)]
-
-        # Buscar secuencias de palabras que coincidan
-        for i in range(len(page_words)):
-            matched_words = []
-            word_idx = 0
-
-            # Intentar emparejar desde esta posiciÃ³n
-            for j in range(i, min(i + len(words) * 2, len(page_words))):
-                page_word = page_words[j][4].strip()
-                search_word = words[word_idx].strip()
-
-                # Comparar palabras (exacta o normalizada)
-                if page_word.lower() == search_word.lower():
-                    matched_words.append(page_words[j])
-                    word_idx += 1
-
-                    # Si hemos encontrado todas las palabras
-                    if word_idx == len(words):
-                        # Crear rectÃ¡ngulo que englobe todas las palabras encontradas
-                        rect = self._create_rect_from_words(matched_words)
-                        rects.append(rect)
-                        break
-                elif word_idx > 0:
-                    # Ya habÃ­amos empezado a emparejar pero fallÃ³, reiniciar
-                    break
+        # Secuencias exactas desde el mapa token -> posiciones del índice de la página
+        index = self._get_page_word_index(page)
+        for matched_words in index.find_exact_sequences(words):
+            rects.append(self._create_rect_from_words(matched_words))
 
         return rects
 
@@ -861,39 +1900,14 @@ class PDFProcessor:
         """
         rects = []
 
-        # Extraer palabras con coordenadas
-        words = page.get_text("words")  # [(x0, y0, x1, y1, "word", block_no, line_no, word_no)]
-
         # Normalizar texto de bÃºsqueda
         search_normalized = normalizer.normalize_for_search(search_text).lower()
         search_words = search_normalized.split()
 
-        # Buscar secuencias de palabras que coincidan fuzzy
-        for i in range(len(words)):
-            # Intentar emparejar desde esta posiciÃ³n
-            matched_words = []
-            current_search_idx = 0
-
-            for j in range(i, min(i + len(search_words) + 5, len(words))):
-                word_text = words[j][4].lower()
-                word_normalized = normalizer.normalize_for_search(word_text)
-
-                if current_search_idx < len(search_words):
-                    target_word = search_words[current_search_idx]
-
-                    # Calcular similitud
-                    score = fuzz.ratio(word_normalized, target_word)
-
-                    if score >= self.min_fuzzy_score:
-                        matched_words.append(words[j])
-                        current_search_idx += 1
-
-                        # Si hemos encontrado todas las palabras
-                        if current_search_idx == len(search_words):
-                            # Crear rectÃ¡ngulo que englobe todas las palabras
-                            rect = self._create_rect_from_words(matched_words)
-                            rects.append(rect)
-                            break
+        # Puntuar el primer token contra todas las palabras y extender solo los candidatos
+        index = self._get_page_word_index(page)
+        for matched_words in index.find_fuzzy_sequences(search_words, self.min_fuzzy_score):
+            rects.append(self._create_rect_from_words(matched_words))
 
         return rects
 
@@ -909,14 +1923,72 @@ class PDFProcessor:
 
         return fitz.Rect(x0, y0, x1, y1)
 
-    def extract_text_with_coords(self, pdf_path: str) -> List[Dict]:
+    def extract_text_with_coords(self, pdf_path: str, engine: str = 'pymupdf') -> List[Dict]:
         """
-        Extrae texto con coordenadas usando pdfplumber
+        Extrae texto con coordenadas
         Ãštil para anÃ¡lisis detallado
 
+        Args:
+            pdf_path: Ruta al PDF
+            engine: 'pymupdf' (por defecto) o 'pdfplumber' (se importa solo si se pide)
+
         Returns:
-            Lista de pÃ¡ginas con palabras y coordenadas
+            Lista de páginas con palabras y coordenadas:
+            [{'page_num', 'words': [{'text', 'x0', 'x1', 'top', 'bottom', 'doctop',
+              'upright', 'height', 'width', 'direction'}], 'full_text'}]
         """
+        if engine == 'pdfplumber':
+            return self._extract_text_with_coords_pdfplumber(pdf_path)
+
+        pages_data = []
+        doctop_offset = 0.0
+
+        doc = fitz.open(pdf_path)
+        try:
+            for page in doc:
+                # Un único TextPage para palabras, direcciones de línea y texto completo
+                textpage = page.get_textpage(flags=fitz.TEXTFLAGS_WORDS)
+                line_dirs = {}
+                for block_no, block in enumerate(page.get_text('dict', textpage=textpage)['blocks']):
+                    for line_no, line in enumerate(block.get('lines', [])):
+                        line_dirs[(block_no, line_no)] = line['dir']
+
+                words = []
+                for x0, y0, x1, y1, text, block_no, line_no, _ in page.get_text('words', textpage=textpage):
+                    dir_x, dir_y = line_dirs.get((block_no, line_no), (1.0, 0.0))
+                    upright = abs(dir_y) < 1e-3
+                    if upright:
+                        direction = 'ltr' if dir_x >= 0 else 'rtl'
+                    else:
+                        direction = 'ttb' if dir_y > 0 else 'btt'
+                    words.append({
+                        'text': text,
+                        'x0': x0,
+                        'x1': x1,
+                        'top': y0,
+                        'bottom': y1,
+                        'doctop': doctop_offset + y0,
+                        'upright': upright,
+                        'height': y1 - y0,
+                        'width': x1 - x0,
+                        'direction': direction,
+                    })
+
+                pages_data.append({
+                    'page_num': page.number + 1,
+                    'words': words,
+                    'full_text': page.get_text('text', textpage=textpage).strip()
+                })
+                doctop_offset += page.rect.height
+        finally:
+            doc.close()
+
+        return pages_data
+
+    def _extract_text_with_coords_pdfplumber(self, pdf_path: str) -> List[Dict]:
+        """Implementación original con pdfplumber (mucho más lenta, se mantiene para comparar)"""
+        import pdfplumber
+
         pages_data = []
 
         with pdfplumber.open(pdf_path) as pdf:
@@ -0,0 +1,91 @@
+"""
+Espacio de trabajo aislado por petición
+El documento subido se procesa desde memoria: se lee del buffer de la subida y
+el PDF resultante se escribe en un io.BytesIO. Solo los documentos que superan
+el umbral de volcado pasan a disco, y lo hacen en un directorio privado de la
+petición (creado con permisos 0700 la primera vez que se necesita) que se borra
+entero al terminar. Así dos subidas con el mismo nombre no se pisan y el
+directorio temporal del sistema no se llena de entradas y salidas huérfanas.
+"""
+import io
+import os
+import shutil
+import tempfile
+from typing import BinaryIO, Optional, Union
+
+
+class RequestWorkspace:
+    """Entrada/salida de una petición en memoria o, por encima del umbral, en un directorio privado"""
+
+    def __init__(self, spill_bytes: int, base_dir: Optional[str] = None):
+        self.spill_bytes = spill_bytes
+        self.base_dir = base_dir
+        self._directory: Optional[str] = None
+
+    @property
+    def directory(self) -> str:
+        """Directorio privado de la petición (se crea al primer uso)"""
+        if self._directory is None:
+            self._directory = tempfile.mkdtemp(prefix='request_', dir=self.base_dir)
+        return self._directory
+
+    @property
+    def spilled(self) -> bool:
+        return self._directory is not None
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def should_spill(self, size: int) -> bool:
+        return self.spill_bytes >= 0 and size > self.spill_bytes
+
+    def load_upload(self, storage, name: str = 'input.pdf') -> Union[bytes, str]:
+        """
+        Contenido de un archivo subido (werkzeug FileStorage): bytes si cabe en
+        memoria, o ruta dentro del directorio privado si supera el umbral
+        """
+        stream = storage.stream
+        stream.seek(0, os.SEEK_END)
+        size = stream.tell()
+        stream.seek(0)
+        if self.should_spill(size):
+            path = self.path(name)
+            storage.save(path)
+            print(f"[WORKSPACE] Subida de {size / (1024 * 1024):.2f} MB volcada a {path}")
+            return path
+        return stream.read()
+
+    def store(self, data: bytes, name: str) -> Union[bytes, str]:
+        """Mantiene un contenido generado en memoria o lo vuelca si supera el umbral"""
+        if self.should_spill(len(data)):
+            path = self.path(name)
+            with open(path, 'wb') as f:
+                f.write(data)
+            return path
+        return data
+
+    def output_target(
+        self,
+        source: Union[bytes, str],
+        name: str = 'output.pdf',
+        on_disk: bool = False,
+    ) -> Union[BinaryIO, str]:
+        """
+        Destino del PDF de salida: en el mismo medio que la entrada, o en disco si
+        se pide (el guardado incremental necesita un archivo)
+        """
+        if on_disk or isinstance(source, str):
+            return self.path(name)
+        return io.BytesIO()
+
+    def cleanup(self) -> None:
+        """Borra el directorio privado si llegó a crearse (se puede llamar varias veces)"""
+        directory, self._directory = self._directory, None
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def __enter__(self) -> 'RequestWorkspace':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.cleanup()
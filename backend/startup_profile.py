@@ -0,0 +1,79 @@
+"""
+Perfil de arranque del backend
+Mide cuánto tarda cada módulo en importarse al arrancar app.py y cuánto pasa
+hasta que el servidor está listo. Las dependencias pesadas que no se necesitan
+para aceptar peticiones (requests, ftfy, rapidfuzz, PIL) se importan de forma
+diferida en su primer uso; warm_up_in_background las carga en un hilo para que
+tampoco la primera petición pague ese coste.
+"""
+import importlib
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+# Módulos que solo se usan al procesar: se precargan en segundo plano tras el arranque
+DEFERRED_MODULES = ('requests', 'ftfy', 'rapidfuzz', 'PIL.Image')
+
+
+class StartupProfile:
+    """Tiempos de importación y de arranque del proceso"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.imports: Dict[str, float] = {}
+        self.warm_imports: Dict[str, float] = {}
+        self.ready_seconds: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def import_modules(self, names: Iterable[str]) -> None:
+        """Importa los módulos en orden y registra el tiempo (acumulado) de cada uno"""
+        for name in names:
+            if name in sys.modules:
+                continue
+            started = time.perf_counter()
+            importlib.import_module(name)
+            self.imports[name] = round(time.perf_counter() - started, 4)
+
+    def warm_up_in_background(self, names: Iterable[str] = DEFERRED_MODULES) -> None:
+        """Importa en un hilo los módulos diferidos (STARTUP_WARM_IMPORTS=0 lo desactiva)"""
+        if os.getenv('STARTUP_WARM_IMPORTS', '1').strip().lower() not in {'1', 'true', 'yes', 'on'}:
+            return
+        pending: List[str] = [name for name in names if name not in sys.modules]
+        if not pending:
+            return
+
+        def _warm() -> None:
+            for name in pending:
+                started = time.perf_counter()
+                try:
+                    importlib.import_module(name)
+                except ImportError as e:
+                    print(f"[STARTUP] No se pudo precargar {name}: {e}")
+                    continue
+                with self._lock:
+                    self.warm_imports[name] = round(time.perf_counter() - started, 4)
+
+        threading.Thread(target=_warm, name='startup-warm-imports', daemon=True).start()
+
+    def mark_ready(self) -> None:
+        self.ready_seconds = round(time.perf_counter() - self.started_at, 4)
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            warm_imports = dict(self.warm_imports)
+        return {
+            'readySeconds': self.ready_seconds,
+            'imports': dict(self.imports),
+            'warmImports': warm_imports,
+        }
+
+    def print_report(self) -> None:
+        slowest = sorted(self.imports.items(), key=lambda item: item[1], reverse=True)
+        detail = ', '.join(f"{name} {seconds:.3f}s" for name, seconds in slowest)
+        print(f"[STARTUP] Listo en {self.ready_seconds:.3f}s | imports: {detail}")
+
+
+# Instancia global
+startup_profile = StartupProfile()
@@ -0,0 +1,85 @@
+"""
+Pruebas de la caché de detección por texto normalizado
+Se ejecutan con pytest o directamente: python test_detection_cache.py
+"""
+from detector import SensitiveDataDetector
+
+RULES = {'email': True, 'dni': True, 'phone': True, 'iban': False}
+
+TEXT = """
+Juan Perez García
+DNI: 12345678Z
+Email: juan.perez@example.com
+"""
+
+
+def _summary(matches):
+    return [(m['type'], m['value'], m['start'], m['end'], m['confidence'], m['context']) for m in matches]
+
+
+def test_acierto_y_fallo():
+    detector = SensitiveDataDetector()
+    first, cached = detector.detect_cached(TEXT, RULES)
+    assert not cached and first
+    second, cached = detector.detect_cached(TEXT, RULES)
+    assert cached
+    # Lo que sale de la caché es idéntico a detectar de nuevo
+    assert _summary(second) == _summary(first)
+    assert _summary(second) == _summary(detector.detect(TEXT, RULES))
+
+    stats = detector.cache_stats()
+    assert stats['hits'] == 1 and stats['misses'] == 1 and stats['entries'] == 1
+
+
+def test_reglas_o_sensibilidad_distintas_no_reutilizan():
+    detector = SensitiveDataDetector()
+    detector.detect_cached(TEXT, RULES)
+
+    only_email, cached = detector.detect_cached(TEXT, dict(RULES, dni=False, phone=False))
+    assert not cached
+    assert {m['type'] for m in only_email} <= {'email'}
+
+    _, cached = detector.detect_cached(TEXT, RULES, sensitivity_level='strict')
+    assert not cached
+    _, cached = detector.detect_cached(TEXT, RULES, context_length=10)
+    assert not cached
+    # Reglas desactivadas que no cambian el plan sí reutilizan la entrada
+    _, cached = detector.detect_cached(TEXT, dict(RULES, creditCard=False))
+    assert cached
+
+
+def test_texto_distinto_no_reutiliza():
+    detector = SensitiveDataDetector()
+    detector.detect_cached(TEXT, RULES)
+    matches, cached = detector.detect_cached(TEXT.replace('12345678Z', '87654321X'), RULES)
+    assert not cached
+    assert all('12345678Z' not in m['value'] for m in matches)
+
+
+def test_limite_de_entradas():
+    detector = SensitiveDataDetector()
+    detector.cache_size = 2
+    for index in range(3):
+        detector.detect_cached(f"Email: usuario{index}@example.com", RULES)
+    assert detector.cache_stats()['entries'] == 2
+    # La más antigua se desalojó
+    _, cached = detector.detect_cached("Email: usuario0@example.com", RULES)
+    assert not cached
+    _, cached = detector.detect_cached("Email: usuario2@example.com", RULES)
+    assert cached
+
+
+def test_cache_desactivada():
+    detector = SensitiveDataDetector()
+    detector.cache_size = 0
+    detector.detect_cached(TEXT, RULES)
+    _, cached = detector.detect_cached(TEXT, RULES)
+    assert not cached
+    assert detector.cache_stats()['entries'] == 0
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"[OK] {name}")
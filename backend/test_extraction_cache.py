@@ -0,0 +1,146 @@
+"""
+Pruebas de la caché en disco de resultados de extracción
+Se ejecutan con pytest o directamente: python test_extraction_cache.py
+"""
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from extraction_cache import ExtractionCache, HEADER_STRUCT
+
+PAGES = [{'text': 'DNI: 12345678Z'}, {'text': 'Email: juan.perez@example.com'}]
+
+
+def _cache(cache_dir, **kwargs):
+    return ExtractionCache(cache_dir=cache_dir, **kwargs)
+
+
+def _rewrite_created_at(path, created_at):
+    """Cambia la fecha de creación guardada en la cabecera de una entrada"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, flags, header_length = HEADER_STRUCT.unpack_from(data, 0)
+    start = HEADER_STRUCT.size
+    header = json.loads(data[start:start + header_length].decode('utf-8'))
+    header['created_at'] = created_at
+    encoded = json.dumps(header).encode('utf-8')
+    with open(path, 'wb') as f:
+        f.write(HEADER_STRUCT.pack(magic, flags, len(encoded)))
+        f.write(encoded)
+        f.write(data[start + header_length:])
+
+
+def test_acierto_y_fallo():
+    cache_dir = tempfile.mkdtemp(prefix='test_extraction_cache_')
+    try:
+        cache = _cache(cache_dir)
+        key = cache.make_key(b'%PDF-1.7 documento', 'parser')
+        assert cache.get(key) is None
+
+        cache.put(key, PAGES, meta={'source': 'parser'})
+        entry = cache.get(key)
+        assert entry is not None
+        assert list(entry['pages']) == PAGES
+        assert entry['meta'] == {'source': 'parser'}
+
+        stats = cache.stats()
+        assert stats['hits'] == 1 and stats['misses'] == 1 and stats['writes'] == 1
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def test_clave_distinta_no_reutiliza():
+    cache_dir = tempfile.mkdtemp(prefix='test_extraction_cache_')
+    try:
+        cache = _cache(cache_dir)
+        key = cache.make_key(b'%PDF-1.7 documento', 'parser')
+        cache.put(key, PAGES)
+
+        # Otro contenido, otro modo u otras opciones son otra entrada
+        assert cache.get(cache.make_key(b'%PDF-1.7 documento distinto', 'parser')) is None
+        assert cache.get(cache.make_key(b'%PDF-1.7 documento', 'ocr')) is None
+        assert cache.get(cache.make_key(b'%PDF-1.7 documento', 'parser', {'dpi': 300})) is None
+        assert cache.get(key) is not None
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def test_cifrado_con_otra_clave_no_se_lee():
+    cache_dir = tempfile.mkdtemp(prefix='test_extraction_cache_')
+    try:
+        cache = _cache(cache_dir, encryption_key='clave-a')
+        key = cache.make_key(b'%PDF-1.7 documento', 'parser')
+        cache.put(key, PAGES)
+        with open(cache._entry_path(key), 'rb') as f:
+            assert b'12345678Z' not in f.read()
+        assert list(cache.get(key)['pages']) == PAGES
+
+        # Sin clave la entrada cifrada se ignora; con otra clave no se puede descifrar
+        assert _cache(cache_dir).get(key) is None
+        from cryptography.fernet import InvalidToken
+        other = _cache(cache_dir, encryption_key='clave-b').get(key)
+        try:
+            other['pages'][0]
+        except InvalidToken:
+            pass
+        else:
+            raise AssertionError('una clave distinta descifró la entrada')
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def test_caducidad_por_fecha_de_creacion():
+    cache_dir = tempfile.mkdtemp(prefix='test_extraction_cache_')
+    try:
+        cache = _cache(cache_dir, ttl_seconds=60)
+        key = cache.make_key(b'%PDF-1.7 documento', 'parser')
+        cache.put(key, PAGES)
+        path = cache._entry_path(key)
+
+        # Usarla renueva el LRU (mtime) pero no la caducidad
+        _rewrite_created_at(path, time.time() - 120)
+        os.utime(path)
+        assert cache.get(key) is None
+        assert not os.path.exists(path)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def test_desalojo_usa_el_mismo_reloj():
+    cache_dir = tempfile.mkdtemp(prefix='test_extraction_cache_')
+    try:
+        cache = _cache(cache_dir, ttl_seconds=60)
+        old_key = cache.make_key(b'%PDF-1.7 antiguo', 'parser')
+        new_key = cache.make_key(b'%PDF-1.7 nuevo', 'parser')
+        cache.put(old_key, PAGES)
+        _rewrite_created_at(cache._entry_path(old_key), time.time() - 120)
+        os.utime(cache._entry_path(old_key))
+
+        # Al guardar otra entrada se purga la caducada aunque su mtime sea reciente
+        cache.put(new_key, PAGES)
+        assert not os.path.exists(cache._entry_path(old_key))
+        assert cache.get(new_key) is not None
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def test_desactivada_sin_clave_por_defecto():
+    saved = {name: os.environ.pop(name, None) for name in ('EXTRACTION_CACHE_ENABLED', 'EXTRACTION_CACHE_KEY')}
+    try:
+        assert not ExtractionCache.from_env().enabled
+        os.environ['EXTRACTION_CACHE_KEY'] = 'clave'
+        assert ExtractionCache.from_env().enabled
+    finally:
+        for name, value in saved.items():
+            os.environ.pop(name, None)
+            if value is not None:
+                os.environ[name] = value
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"[OK] {name}")
@@ -0,0 +1,175 @@
+"""
+Tests for the on-disk OCR line cache of recurring scanned templates.
+Run with pytest or directly: python test_ocr_cache.py
+"""
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from ocr_cache import OCRCache, PageSignature, crop_digest
+
+MODEL = "trocr:microsoft/trocr-base-printed:default"
+
+
+def _page(seed=0):
+    """White page with three dark 'text lines' of a fixed random pattern."""
+    rng = np.random.default_rng(seed)
+    page = np.full((240, 320), 255, dtype=np.uint8)
+    for top in (40, 100, 160):
+        page[top:top + 20, 20:300] = np.where(rng.random((20, 280)) < 0.3, 0, 255)
+    return page
+
+
+def _lines(page):
+    crops = [page[top:top + 20, 20:300] for top in (40, 100, 160)]
+    return [
+        {"digest": crop_digest(crop), "text": f"line {index}", "confidence": 0.9}
+        for index, crop in enumerate(crops)
+    ]
+
+
+def _cache(cache_dir, **kwargs):
+    return OCRCache(cache_dir=cache_dir, **kwargs)
+
+
+def test_hit_and_miss():
+    cache_dir = tempfile.mkdtemp(prefix="test_ocr_cache_")
+    try:
+        cache = _cache(cache_dir)
+        page = _page()
+        signature = PageSignature.from_gray(page)
+        assert cache.get(signature, MODEL) is None
+
+        cache.put(signature, MODEL, _lines(page))
+        readings = cache.get(PageSignature.from_gray(page.copy()), MODEL)
+        assert readings is not None
+        assert sorted(reading["text"] for reading in readings.values()) == ["line 0", "line 1", "line 2"]
+
+        # Another template is a miss
+        assert cache.get(PageSignature.from_gray(np.rot90(_page(1)).copy()), MODEL) is None
+        stats = cache.stats()
+        assert stats["hits"] == 1 and stats["misses"] == 2 and stats["writes"] == 1
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def test_other_model_is_not_reused():
+    cache_dir = tempfile.mkdtemp(prefix="test_ocr_cache_")
+    try:
+        cache = _cache(cache_dir)
+        page = _page()
+        cache.put(PageSignature.from_gray(page), MODEL, _lines(page))
+        assert cache.get(PageSignature.from_gray(page), "trocr:microsoft/trocr-large-printed:default") is None
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def test_block_tolerance_rejects_another_page():
+    cache_dir = tempfile.mkdtemp(prefix="test_ocr_cache_")
+    try:
+        cache = _cache(cache_dir, block_tolerance=10)
+        page = _page()
+        cache.put(PageSignature.from_gray(page), MODEL, _lines(page))
+
+        # A dark patch changes a few blocks far beyond the tolerance; the dHash still finds the entry
+        patched = page.copy()
+        patched[200:216, 40:56] = 0
+        signature = PageSignature.from_gray(patched)
+        distance = bin(signature.dhash ^ PageSignature.from_gray(page).dhash).count("1")
+        assert distance <= cache.max_distance
+        assert cache.get(signature, MODEL) is None
+        assert cache.stats()["rejected"] == 1
+
+        # The same patch is accepted by a looser tolerance
+        assert _cache(cache_dir, block_tolerance=255).get(signature, MODEL) is not None
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def test_changed_line_has_no_reading():
+    cache_dir = tempfile.mkdtemp(prefix="test_ocr_cache_")
+    try:
+        cache = _cache(cache_dir)
+        page = _page()
+        cache.put(PageSignature.from_gray(page), MODEL, _lines(page))
+
+        # One pixel inside the second line: same template, but that line must be read again
+        changed = page.copy()
+        changed[110, 150] = 255 - changed[110, 150]
+        readings = cache.get(PageSignature.from_gray(changed), MODEL)
+        assert readings is not None
+        digests = [line["digest"] for line in _lines(changed)]
+        assert digests[0] in readings and digests[2] in readings
+        assert digests[1] not in readings
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def test_crop_digest_is_exact():
+    crop = _page()[40:60, 20:300]
+    assert crop_digest(crop) == crop_digest(crop.copy())
+    shifted = crop.copy()
+    shifted[0, 0] ^= 1
+    assert crop_digest(shifted) != crop_digest(crop)
+    # Same pixels in another shape are another crop
+    assert crop_digest(crop.reshape(40, 140)) != crop_digest(crop)
+
+
+def test_expiry():
+    cache_dir = tempfile.mkdtemp(prefix="test_ocr_cache_")
+    try:
+        cache = _cache(cache_dir, ttl_seconds=0.2)
+        page = _page()
+        signature = PageSignature.from_gray(page)
+        cache.put(signature, MODEL, _lines(page))
+        assert cache.get(signature, MODEL) is not None
+
+        # Using an entry refreshes the LRU order, not its age
+        time.sleep(0.3)
+        for name in os.listdir(cache_dir):
+            os.utime(os.path.join(cache_dir, name))
+        assert cache.get(signature, MODEL) is None
+        assert not [name for name in os.listdir(cache_dir) if name.endswith(".ocr")]
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def test_encrypted_entries_need_the_key():
+    cache_dir = tempfile.mkdtemp(prefix="test_ocr_cache_")
+    try:
+        page = _page()
+        signature = PageSignature.from_gray(page)
+        _cache(cache_dir, encryption_key="key-a").put(signature, MODEL, _lines(page))
+        for name in os.listdir(cache_dir):
+            with open(os.path.join(cache_dir, name), "rb") as f:
+                assert b"line 0" not in f.read()
+
+        assert _cache(cache_dir, encryption_key="key-a").get(signature, MODEL) is not None
+        assert _cache(cache_dir).get(signature, MODEL) is None
+        assert _cache(cache_dir, encryption_key="key-b").get(signature, MODEL) is None
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def test_disabled_without_key_by_default():
+    names = ("OCR_CACHE_ENABLED", "OCR_CACHE_KEY", "EXTRACTION_CACHE_KEY")
+    saved = {name: os.environ.pop(name, None) for name in names}
+    try:
+        assert not OCRCache.from_env().enabled
+        os.environ["OCR_CACHE_KEY"] = "key"
+        assert OCRCache.from_env().enabled
+    finally:
+        for name, value in saved.items():
+            os.environ.pop(name, None)
+            if value is not None:
+                os.environ[name] = value
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"[OK] {name}")
@@ -0,0 +1,96 @@
+"""
+Pruebas del índice de páginas de las respuestas del parser volcadas a disco
+Se ejecutan con pytest o directamente: python test_page_stream.py
+"""
+import json
+import tempfile
+
+from page_stream import ComposedPages, SpooledPages, index_pages
+
+
+class _Response:
+    """Respuesta en streaming mínima (iter_content) con el cuerpo troceado"""
+
+    def __init__(self, body: bytes, chunk: int = 7):
+        self._chunks = [body[i:i + chunk] for i in range(0, len(body), chunk)]
+
+    def iter_content(self, chunk_size=None):
+        return iter(self._chunks)
+
+
+# Cadenas con llaves, corchetes, comillas escapadas y barras que no deben contar como estructura
+PAGES = [
+    {'text': 'Nombre: {Juan} [titular]', 'lines': [{'text': 'a "b" c', 'bbox': [1, 2, 3, 4]}]},
+    {'text': 'Fin de objeto falso: "}]}, {"pages": [', 'meta': {'nested': {'deep': ['}', '{', ']']}}},
+    {'text': 'Barra final \\', 'other': '\\"'},
+    {'text': 'ñandú — €  emoji 😀'},
+    'página como cadena con } y ]',
+    {},
+]
+
+
+def _body(pages, before=None, after=None) -> bytes:
+    document = dict(before or {})
+    document['pages'] = pages
+    document.update(after or {})
+    return json.dumps(document, ensure_ascii=False, indent=1).encode('utf-8')
+
+
+def test_indice_con_llaves_y_comillas_en_cadenas():
+    body = _body(
+        PAGES,
+        before={'status': 'ok "pages": [1, 2]', 'info': {'pages': [{'x': 1}]}},
+        after={'trailer': '{]"'},
+    )
+    offsets, keys = index_pages(body)
+    assert keys == ['status', 'info', 'pages', 'trailer']
+    assert [json.loads(body[start:end]) for start, end in offsets] == PAGES
+
+
+def test_paginas_bajo_demanda_desde_la_respuesta():
+    pages = SpooledPages.from_response(_Response(_body(PAGES, after={'total': len(PAGES)})))
+    try:
+        assert len(pages) == len(PAGES)
+        assert list(pages) == PAGES
+        assert pages[-1] == {} and pages[1:3] == PAGES[1:3]
+        assert 'total' in pages.keys
+    finally:
+        pages.close()
+
+
+def test_json_incompleto_o_invalido():
+    for body in (b' ', b'[1, 2]', b'{"pages": [{"text": "a"}', b'{"pages": [{"text": "sin cerrar}]}'):
+        spool = tempfile.TemporaryFile()
+        spool.write(body)
+        spool.flush()
+        try:
+            SpooledPages(spool)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f'se aceptó un JSON inválido: {body!r}')
+        finally:
+            spool.close()
+
+
+def test_paginas_compuestas_respetan_el_orden():
+    first, second = PAGES[:3], PAGES[3:]
+    composed = ComposedPages(
+        [(second, 0, {'shard': 1}), (first, 2, {}), {'text': 'ya materializada'}, (second, 1, {})],
+        [first, second],
+    )
+    assert len(composed) == 4
+    assert composed[0] == dict(PAGES[3], shard=1)
+    assert composed[1] == PAGES[2]
+    assert composed[2] == {'text': 'ya materializada'}
+    # Las páginas en cadena se convierten al formato de dict
+    assert composed[3] == {'text': PAGES[4]}
+    # Acceder no modifica la fuente
+    assert 'shard' not in PAGES[3]
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"[OK] {name}")
@@ -0,0 +1,88 @@
+"""
+Pruebas de la unión de trozos del parseo en paralelo (PARSER_SHARD_PAGES)
+El servicio de parseo se sustituye en la instancia por una función que responde
+con el número de página real de cada sub-PDF, y los trozos terminan en desorden.
+Se ejecutan con pytest o directamente: python test_parser_shards.py
+"""
+import threading
+import time
+
+from pdf_processor import PDFProcessor
+
+
+def _processor(shard_pages=3, workers=4, retries=1, short=None, fail=None):
+    """
+    PDFProcessor cuyo parser devuelve {'text': 'p<n>'} por página del trozo
+
+    short: trozo (por su primera página) al que le falta su última página
+    fail: {primera página: intentos que fallan antes de responder}
+    """
+    processor = PDFProcessor()
+    processor.parser_shard_pages = shard_pages
+    processor.parser_shard_workers = workers
+    processor.parser_shard_retries = retries
+    failures = dict(fail or {})
+    lock = threading.Lock()
+    discarded = []
+
+    # El "sub-PDF" es la lista de índices de página que contiene
+    processor._write_page_subset = lambda source, indexes: list(indexes)
+    processor._discard_subset = discarded.append
+
+    def parse(subset):
+        first = subset[0]
+        # Los primeros trozos tardan más: terminan después que los últimos
+        time.sleep(0.02 * (10 - first // shard_pages) / 10)
+        with lock:
+            if failures.get(first, 0) > 0:
+                failures[first] -= 1
+                return None
+        pages = [{'text': f'p{index}'} for index in subset]
+        if first == short:
+            pages = pages[:-1]
+        return {'pages': pages}
+
+    processor._parse_with_external_service = parse
+    processor.discarded = discarded
+    return processor
+
+
+def test_union_en_orden_de_pagina():
+    processor = _processor()
+    progress = []
+    result = processor._parse_in_shards('documento.pdf', 10, progress.append)
+    assert result['shards'] == 4
+    assert [page['text'] for page in result['pages']] == [f'p{index}' for index in range(10)]
+    assert progress[-1]['currentPage'] == 10
+    # Todos los sub-PDF se descartan
+    assert len(processor.discarded) == 4
+
+
+def test_trozo_incompleto_mantiene_la_alineacion():
+    processor = _processor(short=3)
+    result = processor._parse_in_shards('documento.pdf', 10, lambda update: None)
+    texts = [page['text'] for page in result['pages']]
+    # La página que falta queda vacía en su sitio; las siguientes no se desplazan
+    assert len(texts) == 10
+    assert texts[:5] == ['p0', 'p1', 'p2', 'p3', 'p4']
+    assert texts[5] == ''
+    assert texts[6:] == ['p6', 'p7', 'p8', 'p9']
+
+
+def test_reintento_de_un_trozo():
+    processor = _processor(fail={6: 1})
+    result = processor._parse_in_shards('documento.pdf', 10, lambda update: None)
+    assert [page['text'] for page in result['pages']] == [f'p{index}' for index in range(10)]
+
+
+def test_trozo_sin_respuesta_invalida_el_parseo():
+    processor = _processor(fail={3: 5})
+    assert processor._parse_in_shards('documento.pdf', 10, lambda update: None) is None
+    assert len(processor.discarded) == 4
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"[OK] {name}")
@@ -0,0 +1,128 @@
+"""
+Registro de valores sensibles a nivel de documento
+Un DNI, IBAN o nombre de tomador suele repetirse en muchas páginas. El registro
+guarda cada valor confirmado una sola vez para poder:
+- Localizar cada valor distinto una sola vez por página
+- Marcar también las apariciones que la detección por contexto no captó
+
+Una aparición solo cuenta si empieza y termina en límite de palabra: un valor
+dentro de otra palabra o de un número más largo (el final de un teléfono dentro
+de un IBAN, un apellido dentro de otro) no se propaga.
+"""
+import re
+from typing import Dict, Iterable, List, Optional, Set
+
+from normalizer import normalizer
+
+
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+# Grupo de dígitos pegado a una aparición numérica; solo se mira una ventana corta
+# junto a la aparición, nunca el resto de la página
+_DIGIT_GROUP_WINDOW = 8
+_DIGIT_GROUP_BEFORE = re.compile(r'\d\s*$')
+_DIGIT_GROUP_AFTER = re.compile(r'\s*\d')
+
+
+def compact_for_lookup(text: str) -> str:
+    """Forma compacta para comparar valores: normalizada, en minúsculas y sin espacios"""
+    if not text:
+        return ''
+    return _WHITESPACE_PATTERN.sub('', normalizer.normalize_for_search(text)).lower()
+
+
+def _boundary_pattern(key: str) -> 're.Pattern':
+    """Patrón de una clave compacta con espacios opcionales entre caracteres y límites de palabra"""
+    body = r'\s*'.join(re.escape(char) for char in key)
+    return re.compile(r'(?<!\w)' + body + r'(?!\w)')
+
+
+class DocumentValueRegistry:
+    """Valores sensibles confirmados en un documento, indexados por su forma compacta"""
+
+    def __init__(self, min_length: int = 4, numeric_min_length: int = 7):
+        # Valores demasiado cortos generarían falsos positivos al propagarse
+        self.min_length = min_length
+        # Los números cortos (importes, códigos postales, años) se repiten sin ser datos personales
+        self.numeric_min_length = max(min_length, numeric_min_length)
+        self._entries: Dict[str, Dict] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def register(self, page_num: int, matches: Iterable[Dict]) -> None:
+        """Añade al registro las detecciones confirmadas de una página"""
+        for match in matches:
+            key = compact_for_lookup(match.get('value', ''))
+            if len(key) < (self.numeric_min_length if key.isdigit() else self.min_length):
+                continue
+
+            entry = self._entries.get(key)
+            if entry is None:
+                self._entries[key] = {
+                    'key': key,
+                    'type': match['type'],
+                    'value': match['value'],
+                    'confidence': match.get('confidence', 0.0),
+                    'normalized_value': match.get('normalized_value', match['value']),
+                    'first_page': page_num,
+                    'pattern': _boundary_pattern(key),
+                }
+            elif match.get('confidence', 0.0) > entry['confidence']:
+                entry.update({
+                    'type': match['type'],
+                    'value': match['value'],
+                    'confidence': match['confidence'],
+                    'normalized_value': match.get('normalized_value', match['value']),
+                })
+
+    def find_in_page(self, page_text: str, exclude: Optional[Set[str]] = None) -> List[Dict]:
+        """
+        Busca en bloque todos los valores registrados en el texto de una página
+
+        Args:
+            page_text: Texto extraído de la página
+            exclude: Claves compactas ya detectadas en la página
+
+        Returns:
+            Detecciones propagadas con el formato de detector.detect y 'propagated': True
+        """
+        compact_page = compact_for_lookup(page_text)
+        if not compact_page:
+            return []
+        search_text = normalizer.normalize_for_search(page_text).lower()
+
+        excluded = exclude or set()
+        found = []
+        for key, entry in self._entries.items():
+            # Descarte rápido antes de la búsqueda por límites de palabra
+            if key in excluded or key not in compact_page:
+                continue
+            if not self._occurs_as_token(entry, search_text):
+                continue
+            found.append({
+                'type': entry['type'],
+                'value': entry['value'],
+                'confidence': entry['confidence'],
+                'normalized_value': entry['normalized_value'],
+                'propagated': True,
+            })
+
+        return found
+
+    @staticmethod
+    def _occurs_as_token(entry: Dict, search_text: str) -> bool:
+        """
+        True si el valor aparece completo, sin letras ni dígitos pegados; un
+        valor numérico tampoco puede continuar un grupo de dígitos separado por
+        espacios (p. ej. un teléfono formado por bloques de un IBAN)
+        """
+        numeric = entry['key'].isdigit()
+        for occurrence in entry['pattern'].finditer(search_text):
+            start, end = occurrence.span()
+            if numeric and (
+                _DIGIT_GROUP_BEFORE.search(search_text, max(0, start - _DIGIT_GROUP_WINDOW), start)
+                or _DIGIT_GROUP_AFTER.match(search_text, end, end + _DIGIT_GROUP_WINDOW)
+            ):
+                continue
+            return True
+        return False